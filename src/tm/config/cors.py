@@ -1,32 +1,142 @@
-from pyramid.events import NewRequest
+"""Cross-origin resource sharing.
+
+Headers are worked out once when the application is created. Settings:
+
+* ``tm.cors.allow_origins``: origins allowed to call the API, like ``https://app.example.com``. Defaults to ``*``, any origin. With a list of origins the matching request origin is echoed back together with ``Vary: Origin``, and ``Access-Control-Allow-Credentials`` is sent.
+
+* ``tm.cors.allow_methods``, ``tm.cors.allow_headers``, ``tm.cors.expose_headers``: header values
+
+* ``tm.cors.allow_credentials``: defaults to true, never sent for ``*`` as browsers refuse that combination
+
+* ``tm.cors.max_age``: how many seconds browsers may cache preflight responses, default 1728000
+
+* ``tm.cors.skip_routes``: route names served without CORS headers. Static views never get them.
+
+* ``tm.cors.route.<route name>.<option>``: override any of the above options for one route
+
+``OPTIONS`` requests are answered by the tween without running the view, with a new response built from the precomputed headers.
+"""
+import typing as t
+
+from pyramid.interfaces import IRoutesMapper
+from pyramid.registry import Registry
 from pyramid.response import Response
+from pyramid.settings import asbool
+from pyramid.settings import aslist
+
 
-__cors_headers = {
-    'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Methods': 'POST,GET,DELETE,PUT,OPTIONS',
-    'Access-Control-Allow-Headers': 'Origin, Content-Type, Accept, Authorization',
-    'Access-Control-Expose-Headers': 'Authorization',
-    'Access-Control-Allow-Credentials': 'true',
-    'Access-Control-Max-Age': '1728000',
+DEFAULTS = {
+    'allow_origins': '*',
+    'allow_methods': 'POST,GET,DELETE,PUT,OPTIONS',
+    'allow_headers': 'Origin, Content-Type, Accept, Authorization',
+    'expose_headers': 'Authorization, Link',
+    'allow_credentials': 'true',
+    'max_age': '1728000',
 }
 
-def cors_preflight_tween_factory(handler, registry):
-    # one-time configuration code goes here
+#: Body of preflight responses
+PREFLIGHT_BODY = b'{}'
+
+PREFLIGHT_CONTENT_TYPE = (('Content-Type', 'application/json'), )
+
+Headers = t.Tuple[t.Tuple[str, str], ...]
+
+
+class CORSPolicy:
+    """Precomputed CORS headers for one set of options."""
+
+    def __init__(self, options: dict):
+        origins = aslist(options['allow_origins'])
+        self.any_origin = '*' in origins
+
+        shared = (('Access-Control-Expose-Headers', options['expose_headers']), )
+        preflight = (
+            ('Access-Control-Allow-Methods', options['allow_methods']),
+            ('Access-Control-Allow-Headers', options['allow_headers']),
+            ('Access-Control-Max-Age', options['max_age']),
+        )
+
+        if self.any_origin:
+            origin_headers = {None: (('Access-Control-Allow-Origin', '*'), )}
+        else:
+            credentials = (('Access-Control-Allow-Credentials', 'true'), ) if asbool(options['allow_credentials']) else ()
+            origin_headers = {origin: (('Access-Control-Allow-Origin', origin), ('Vary', 'Origin')) + credentials for origin in origins}
+
+        #: Response headers by request origin
+        self.response_headers = {origin: headers + shared for origin, headers in origin_headers.items()}
+
+        #: Preflight response headers by request origin
+        self.preflight_headers = {
+            origin: PREFLIGHT_CONTENT_TYPE + headers + preflight
+            for origin, headers in origin_headers.items()
+        }
+
+        #: Headers for origins which are not allowed, so that caches do not mix up responses
+        self.rejected_headers = () if self.any_origin else (('Vary', 'Origin'), )
+
+    def get_response_headers(self, origin: t.Optional[str]) -> Headers:
+        return self.response_headers.get(None if self.any_origin else origin, self.rejected_headers)
+
+    def get_preflight_headers(self, origin: t.Optional[str]) -> Headers:
+        return self.preflight_headers.get(None if self.any_origin else origin, PREFLIGHT_CONTENT_TYPE + self.rejected_headers)
+
+
+def get_cors_policies(settings: dict) -> t.Tuple[CORSPolicy, t.Dict[str, t.Optional[CORSPolicy]]]:
+    """Build the default policy and the per route policies from ``tm.cors.*`` settings.
+
+    :return: Tuple(default policy, policy by route name). ``None`` means no CORS for the route.
+    """
+    options = {key: settings.get('tm.cors.' + key, value) for key, value in DEFAULTS.items()}
+    default = CORSPolicy(options)
+
+    route_options = {}
+    prefix = 'tm.cors.route.'
+    for key, value in settings.items():
+        if key.startswith(prefix):
+            route_name, _, option = key[len(prefix):].rpartition('.')
+            if option not in DEFAULTS:
+                raise ValueError('Unknown CORS option {}'.format(key))
+            route_options.setdefault(route_name, dict(options))[option] = value
+
+    routes = {route_name: CORSPolicy(options) for route_name, options in route_options.items()}
+    for route_name in aslist(settings.get('tm.cors.skip_routes', '')):
+        routes[route_name] = None
+    return default, routes
+
+
+def cors_preflight_tween_factory(handler, registry: Registry):
+    default, routes = get_cors_policies(registry.settings)
+
+    def get_policy(route) -> t.Optional[CORSPolicy]:
+        if route is None:
+            return default
+        # Static views have internal route names starting with __
+        if route.name.startswith('__'):
+            return None
+        return routes.get(route.name, default)
 
     def cors_tween(request):
+        origin = request.headers.get('Origin')
+
         if request.method == 'OPTIONS':
-            response = Response(json={})
-        else:
-            # before
-            response = handler(request) # <-- be-TWEEN
-            # after
+            # Preflight never reaches the router, so match the route here
+            mapper = registry.queryUtility(IRoutesMapper)
+            route = mapper(request)['route'] if mapper else None
+            policy = get_policy(route)
+            headers = policy.get_preflight_headers(origin) if policy else PREFLIGHT_CONTENT_TYPE
+            # Not one shared Response per policy: outer tweens and response callbacks add headers to the response
+            # they get, which would pile up on a shared one. Copying a prototype costs more than building this.
+            return Response(body=PREFLIGHT_BODY, headerlist=list(headers))
 
-        response.headers.update(__cors_headers)
+        response = handler(request)
+
+        policy = get_policy(getattr(request, 'matched_route', None))
+        if policy and 'Access-Control-Allow-Origin' not in response.headers:
+            response.headerlist.extend(policy.get_response_headers(origin))
         return response
 
     return cors_tween
 
+
 def includeme(config):
     config.add_tween('tm.config.cors.cors_preflight_tween_factory')
-
-
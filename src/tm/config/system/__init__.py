@@ -1,7 +1,10 @@
 def includeme(config):
+    config.include('.metrics')
     config.include('.templates')
     config.include('.routes')
     config.include('.models')
+    config.include('.password')
+    config.include('.mail')
     config.include('.auth')
     config.include('.federated_login')
     config.include('.sanity_check')
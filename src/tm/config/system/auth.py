@@ -6,6 +6,7 @@ class Root:
     def __acl__(self):
         return [
             (Allow, Authenticated, ('authenticated',)),
+            (Allow, 'group:admin', ('admin',)),
         ]
 
     def __init__(self, request):
@@ -32,6 +33,18 @@ def includeme(config):
                                          audience="localhost"
                                          )
 
+    # Cache users between requests so that request.user does not hit the database every time
+    config.include('tm.system.user.cache')
+
+    # Short-lived OAuth authorization codes
+    config.include('tm.system.user.authcodes')
+
+    # Delete expired activation and authorization code rows in the background, if enabled
+    config.include('tm.system.user.sweeper')
+
+    # Rate limit login, sign up and password reset attempts
+    config.include('tm.system.core.throttle')
+
     # Grab incoming auth details changed events
     from tm.system.auth import subscribers
     config.scan(subscribers)
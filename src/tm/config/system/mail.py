@@ -0,0 +1,23 @@
+def includeme(config):
+    """Create the mailer once and share it between requests.
+
+    Settings are the ``mail.*`` keys of pyramid_mailer, plus ``mail.mailer`` to pick a debug backend and the SMTP connection pool settings of :py:func:`tm.system.mail.mailer.create_smtp_mailer`.
+
+    CSS inlined email bodies are cached unless ``mail.inline_cache = false``. ``mail.inlined_templates_file`` points to results of the ``precompile_email_templates`` script.
+    """
+    from pyramid.settings import asbool
+    from pyramid_mailer import IMailer
+    from tm.system.mail.inlining import InlinedTemplateCache
+    from tm.system.mail.utils import create_mailer
+
+    settings = config.registry.settings
+
+    config.registry.registerUtility(create_mailer(config.registry), IMailer)
+
+    if asbool(settings.get("mail.inline_cache", True)):
+        path = settings.get("mail.inlined_templates_file")
+        if path:
+            cache = InlinedTemplateCache.from_file(config.registry, path)
+        else:
+            cache = InlinedTemplateCache(config.registry)
+        config.registry["mail.inlined_templates"] = cache
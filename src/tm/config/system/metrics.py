@@ -0,0 +1,19 @@
+def metrics_view(request) -> dict:
+    """Current values of the in-process metrics as JSON, see :py:meth:`tm.utils.metrics.Metrics.snapshot`.
+
+    Only members of the admin group may read them. Every process keeps its own metrics, so a request only sees the numbers of the process serving it.
+    """
+    from tm.system.core.utils import get_metrics
+
+    return get_metrics(request.registry).snapshot()
+
+
+def includeme(config):
+    """Register the in-process metrics collector and the ``/metrics`` view exporting it."""
+    from tm.system.core.interfaces import IMetrics
+    from tm.utils.metrics import Metrics
+
+    config.registry.registerUtility(Metrics(), IMetrics)
+
+    config.add_route('metrics', '/metrics', accept='application/json')
+    config.add_view(metrics_view, route_name='metrics', permission='admin', renderer='json')
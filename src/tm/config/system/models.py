@@ -3,6 +3,7 @@ def includeme(config):
     config_declarative_models()
 
     config.include('tm.system.model.meta')
+    config.include('tm.system.model.isolation')
 
 
 
@@ -0,0 +1,38 @@
+
+def includeme(config):
+    """Set up the password hasher and the worker pool it hashes in.
+
+    Settings:
+
+    * ``tm.password.pool``: ``thread`` (default), ``process`` or ``none`` to hash in the request thread
+
+    * ``tm.password.pool_workers``: number of hashing workers, defaults to the number of CPUs
+
+    * ``tm.password.pool_max_queue``: jobs allowed to wait for a worker before answering 503, defaults to the number of workers
+
+    * ``tm.password.pool_timeout_seconds``: give up waiting for a result after this many seconds
+
+    * ``tm.password.time_cost``, ``tm.password.memory_cost``, ``tm.password.parallelism``: Argon 2 parameters for new hashes, pick them with the ``calibrate_password_hashing`` script
+
+    * ``tm.password.rehash_on_login``: hash the password again with the current parameters when a user logs in with an older hash, default true
+    """
+    from tm.system.user.interfaces import IPasswordHasher
+    from tm.system.user.password import Argon2Hasher
+    from tm.system.user.password import HashingPool
+    from tm.system.user.password import get_argon2_parameters
+
+    settings = config.registry.settings
+
+    kind = settings.get("tm.password.pool", "thread")
+
+    pool = None
+    if kind and kind != "none":
+        workers = settings.get("tm.password.pool_workers")
+        max_queue = settings.get("tm.password.pool_max_queue")
+        timeout = settings.get("tm.password.pool_timeout_seconds")
+        pool = HashingPool(kind=kind,
+                           workers=int(workers) if workers else None,
+                           max_queue=int(max_queue) if max_queue else None,
+                           timeout=float(timeout) if timeout else None)
+
+    config.registry.registerUtility(Argon2Hasher(pool=pool, **get_argon2_parameters(settings)), IPasswordHasher)
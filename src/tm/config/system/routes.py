@@ -22,6 +22,7 @@ def includeme(config):
     config.add_view(my_view,
                     permission='authenticated',
                     route_name='email_sample',
+                    read_only=True,
                     renderer="tm.system.user:templates/login/email/forgot_password.body.html")
 
     config.add_route('users', '/users', accept='application/json')
@@ -1,3 +1,6 @@
+import contextlib
+import fcntl
+
 from pyramid.settings import asbool
 
 
@@ -12,38 +15,67 @@ def db_sanity_check(config):
         # config.commit()
 
 
+@contextlib.contextmanager
+def exclusive_lock(lock_file):
+    """Hold an exclusive advisory lock on a file, so that only one process at a time runs the block."""
+    with open(lock_file, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def sanity_check_callback(config):
     """Perform post-initialization sanity checks.
 
     This is run on every startup to check that the database table schema matches our model definitions. If there
     are un-run migrations this will bail out and do not let the problem to escalate later.
 
+    The check borrows the engine of the application session factory instead of creating its own pool. The pool is
+    disposed afterwards, so that connections opened during boot are not inherited by forked workers.
+
+    Set ``tm.sanity_check.cache_file`` to a writable path to remember a fingerprint of a passed check and skip the
+    reflection on later startups as long as the models and the database schema stay the same.
+
+    Set ``tm.sanity_check.lock_file`` to run the check once per deployment instead of once per worker process: workers
+    booting at the same time serialize on the lock, the first one does the check and the rest find its fingerprint.
+    If no cache file is given ``<lock_file>.fingerprint`` is used.
     """
     import transaction
-    from tm.system.model.meta import get_engine
-    from tm.system.model.meta import get_session_factory
     from tm.system.model.meta import get_tm_session
     from tm.system.model import sanitycheck
     from tm.system.model.meta import Base
     import sqlalchemy.exc
 
-    engine = get_engine(config.registry.settings)
-    session_factory = get_session_factory(engine)
-    with transaction.manager:
-        dbsession = get_tm_session(session_factory, transaction.manager)
+    settings = config.registry.settings
+    session_factory = config.registry['dbsession_factory']
+    engine = session_factory.kw['bind']
 
-        db_connection_string = config.registry.settings.get("sqlalchemy.url")
+    lock_file = settings.get("tm.sanity_check.lock_file")
+    cache_file = settings.get("tm.sanity_check.cache_file")
+    if lock_file and not cache_file:
+        cache_file = lock_file + ".fingerprint"
 
-        try:
-            if not sanitycheck.is_sane_database(Base, dbsession):
-                raise SanityCheckFailed("The database sanity check failed. Check log for details.")
-        except sqlalchemy.exc.OperationalError as e:
-            msg = "The database {} is not responding.\nMake sure the database is running on your local computer or "
-            "correctly configured in settings INI file."
-            raise SanityCheckFailed(msg.format(db_connection_string)) from e
-        dbsession.close()
+    lock = exclusive_lock(lock_file) if lock_file else contextlib.suppress()
+
+    try:
+        with lock, transaction.manager:
+            dbsession = get_tm_session(session_factory, transaction.manager)
+
+            db_connection_string = settings.get("sqlalchemy.url")
+
+            try:
+                if not sanitycheck.is_sane_database(Base, dbsession, cache_file=cache_file):
+                    raise SanityCheckFailed("The database sanity check failed. Check log for details.")
+            except sqlalchemy.exc.OperationalError as e:
+                msg = "The database {} is not responding.\nMake sure the database is running on your local computer or "
+                "correctly configured in settings INI file."
+                raise SanityCheckFailed(msg.format(db_connection_string)) from e
+            dbsession.close()
+    finally:
+        engine.dispose()
 
 
 class SanityCheckFailed(Exception):
     """Looks like the application has configuration which would fail to run."""
-
@@ -1,4 +1,12 @@
+import os
+
+
 def includeme(config):
+    # Jinja does not create the bytecode cache directory and fails rendering if it is missing
+    bytecode_caching_directory = config.get_settings().get('jinja2.bytecode_caching_directory')
+    if bytecode_caching_directory:
+        os.makedirs(bytecode_caching_directory, exist_ok=True)
+
     # Jinja 2 templates as .html files
     config.include('pyramid_jinja2')
     config.add_jinja2_renderer('.html')
@@ -8,6 +16,7 @@ def includeme(config):
 
     config.include("tm.system.core.templatecontext")
     config.include("tm.system.core.vars")
+    config.include("tm.system.core.warmup")
 
      # Add core templates to the search path
     config.add_jinja2_search_path('tm.system.core:templates', name='.html')
@@ -0,0 +1,42 @@
+"""Pick Argon 2 parameters for this machine.
+
+Run on the production hardware and copy the printed settings to the INI file::
+
+    calibrate_password_hashing --target-ms=250
+
+Existing password hashes keep working with their old parameters and are upgraded when their users next log in, see ``tm.password.rehash_on_login``.
+"""
+import argparse
+import sys
+
+from ..system.user.password import PARAMETER_SETTINGS
+from ..system.user.password import calibrate
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Find Argon 2 parameters meeting a target password verification latency on this machine.")
+    parser.add_argument("--target-ms", type=float, default=250, help="Wanted verification latency in milliseconds")
+    parser.add_argument("--memory-cost", type=int, default=65536, help="Memory use in KiB to start from")
+    parser.add_argument("--min-memory-cost", type=int, default=19456, help="Never go below this memory use in KiB")
+    parser.add_argument("--parallelism", type=int, default=4, help="Number of lanes")
+    parser.add_argument("--samples", type=int, default=5, help="Verifications timed per candidate")
+    return parser
+
+
+def main(argv=sys.argv):
+    args = get_parser().parse_args(argv[1:])
+    parameters, elapsed = calibrate(
+        args.target_ms / 1000,
+        memory_cost=args.memory_cost,
+        parallelism=args.parallelism,
+        min_memory_cost=args.min_memory_cost,
+        samples=args.samples,
+    )
+
+    print("# Password verification takes {:.0f} ms on this machine".format(elapsed * 1000))
+    for key, argument in PARAMETER_SETTINGS.items():
+        print("{} = {}".format(key, parameters[argument]))
+
+
+if __name__ == "__main__":
+    main()
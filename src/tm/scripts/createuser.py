@@ -1,5 +1,8 @@
+from sqlalchemy import func
+
 from tm.system.user.models import User
 from tm.system.user.models import Group
+from tm.system.user.interfaces import IPasswordHasher
 from tm.utils.time import now
 
 import typing as t
@@ -11,7 +14,8 @@ def create(
         email: str,
         password: t.Optional[str] = None,
         source: str = 'initialize_db_script',
-        admin: bool = False
+        admin: bool = False,
+        hasher: t.Optional[IPasswordHasher] = None
 ) -> User:
     """Create a new site user from command line.
 
@@ -21,9 +25,10 @@ def create(
     :param password: Password.
     :param source: Source of this user, in here, initialize_db_script.
     :param admin: Set this user to admin. The first user is always implicitly admin.
+    :param hasher: Password hasher to use, e.g. one backed by a worker pool. Defaults to hashing in the calling thread.
     :return: Newly created user.
     """
-    u = dbsession.query(User).filter_by(email=email).first()
+    u = dbsession.query(User).filter(func.lower(User.email) == email.lower()).first()
     if u is not None:
         return u
 
@@ -32,11 +37,9 @@ def create(
     dbsession.flush()  # Make sure u.user_data is set
 
     if password:
-        # from tm.system.user.userregistry import UserRegistry
-        # user_registry = UserRegistry()
-        # user_registry.set_password(u, password)
-        from tm.system.user.password import Argon2Hasher
-        hasher = Argon2Hasher()
+        if hasher is None:
+            from tm.system.user.password import Argon2Hasher
+            hasher = Argon2Hasher()
         hashed = hasher.hash_password(password)
         u.hashed_password = hashed
 
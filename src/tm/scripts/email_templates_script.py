@@ -0,0 +1,52 @@
+"""Inline the CSS of HTML email templates ahead of time.
+
+Run at build or deploy time with the production settings and point ``mail.inlined_templates_file`` to the output, so that no web process pays for premailer on its first emails::
+
+    precompile_email_templates production.ini var/inlined-email-templates.json
+"""
+import json
+import os
+import sys
+
+from pyramid.paster import (
+    bootstrap,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from ..system.mail.inlining import InlinedTemplateCache
+from ..system.mail.inlining import find_email_templates
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> <output_file> [var=value]\n'
+          '(example: "%s development.ini inlined-email-templates.json")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 3:
+        usage(argv)
+    config_uri = argv[1]
+    output_file = argv[2]
+    options = parse_vars(argv[3:])
+    setup_logging(config_uri)
+
+    with bootstrap(config_uri, options=options) as env:
+        cache = InlinedTemplateCache(env['registry'])
+        names = find_email_templates(cache.env)
+        precompiled = cache.precompile(env['request'], names)
+
+    tmp = "{}.{}.tmp".format(output_file, os.getpid())
+    with open(tmp, "wt") as f:
+        json.dump(precompiled, f)
+    os.replace(tmp, output_file)
+
+    cached = [name for name in names if cache.templates.get(name)]
+    print("Inlined {} of {} email templates: {}".format(len(cached), len(names), ", ".join(cached)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Import users in bulk from CSV or JSON lines.
+
+The input has one user per record with ``email`` and optional ``username``, ``password``, ``hashed_password`` and ``full_name``. ``password`` is plain text and gets hashed, ``hashed_password`` is an Argon 2 hash, e.g. exported from a legacy system, which is stored as is::
+
+    tm-import-users production.ini users.csv
+    tm-import-users production.ini users.jsonl --workers=8 --source=legacy
+    zcat users.csv.gz | tm-import-users production.ini - --format=csv
+
+Users with an email or a username which already exists are skipped, so an interrupted import can be run again. See :py:mod:`tm.system.user.importer`.
+"""
+import argparse
+import sys
+
+import argon2
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from ..system.model.meta import get_engine
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Import users in bulk from CSV or JSON lines.")
+    parser.add_argument("config_uri", help="Application INI file, like production.ini")
+    parser.add_argument("input", help="CSV or JSON lines file, - for stdin")
+    parser.add_argument("options", nargs="*", help="Extra settings as var=value")
+    parser.add_argument("--format", dest="input_format", choices=("csv", "jsonl"), help="Input format, guessed from the file name by default")
+    parser.add_argument("--workers", type=int, help="Password hashing processes, defaults to the number of CPUs")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Users inserted per transaction")
+    parser.add_argument("--source", default="import", help="Registration source stored for the imported users")
+    parser.add_argument("--not-activated", action="store_true", help="Do not mark the imported users activated")
+    parser.add_argument("--dry-run", action="store_true", help="Check and hash, but do not insert")
+    return parser
+
+
+def main(argv=sys.argv):
+    args = get_parser().parse_args(argv[1:])
+    options = parse_vars(args.options)
+    setup_logging(args.config_uri)
+    settings = get_appsettings(args.config_uri, options=options)
+
+    from ..system.model import config_declarative_models
+    config_declarative_models()
+
+    from ..system.user.importer import UserImporter
+    from ..system.user.importer import guess_format
+    from ..system.user.importer import read_records
+    from ..system.user.password import get_argon2_parameters
+
+    engine = get_engine(settings)
+    input_format = args.input_format or guess_format(args.input)
+
+    def report(stats):
+        print(stats, file=sys.stderr)
+
+    stream = sys.stdin if args.input == "-" else open(args.input, "rt", newline="", encoding="utf-8")
+    try:
+        hasher = argon2.PasswordHasher(**get_argon2_parameters(settings))
+        importer = UserImporter(engine, hasher=hasher, workers=args.workers, source=args.source, activate=not args.not_activated, dry_run=args.dry_run)
+        with importer:
+            stats = importer.run(read_records(stream, input_format), chunk_size=args.chunk_size, report=report)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    print("{}Imported users: {}".format("Dry run, nothing inserted. " if args.dry_run else "", stats))
+
+
+if __name__ == "__main__":
+    main()
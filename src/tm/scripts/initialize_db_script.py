@@ -12,6 +12,8 @@ from pyramid.scripts.common import parse_vars
 from .createuser import create
 
 from ..system.user.models import Group
+from ..system.user.password import Argon2Hasher
+from ..system.user.password import get_argon2_parameters
 from ..system.model.meta import Base
 from ..system.model.meta import (
     get_engine,
@@ -51,7 +53,9 @@ def main(argv=sys.argv):
         dbsession = get_tm_session(session_factory, transaction.manager)
         group = Group(name=Group.DEFAULT_ADMIN_GROUP_NAME, description="Super administrator")
         dbsession.add(group)
-        create(dbsession, username="Carlos", email="carloslopez@me.com", password="some?pass", admin=True )
+        # The application is not running yet, hash with the configured tm.password.* parameters directly
+        hasher = Argon2Hasher(**get_argon2_parameters(settings))
+        create(dbsession, username="Carlos", email="carloslopez@me.com", password="some?pass", admin=True, hasher=hasher)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+"""Send emails queued in the mail outbox table.
+
+Run one or more of these next to the web processes when ``mail.outbox`` is enabled::
+
+    mail_outbox_worker production.ini
+
+Use ``--once`` to send the due messages and exit, e.g. from cron.
+"""
+import os
+import signal
+import sys
+
+from pyramid.paster import (
+    bootstrap,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from ..system.mail.outbox import OutboxWorker
+from ..system.mail.utils import get_mailer
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [--once] [var=value]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    args = [arg for arg in argv[1:] if arg != '--once']
+    once = len(args) < len(argv) - 1
+    if len(args) < 1:
+        usage(argv)
+    config_uri = args[0]
+    options = parse_vars(args[1:])
+    setup_logging(config_uri)
+
+    with bootstrap(config_uri, options=options) as env:
+        registry = env['registry']
+        worker = OutboxWorker.from_settings(registry.settings, registry['dbsession_factory'], get_mailer(registry))
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        worker.run(once=once)
+
+
+if __name__ == "__main__":
+    main()
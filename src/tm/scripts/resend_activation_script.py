@@ -0,0 +1,100 @@
+"""Send a fresh activation link to every user who has not activated their account.
+
+Each user gets a new activation token, replacing any earlier one::
+
+    resend_activation_emails production.ini
+
+Users are processed in batches of ``BATCH_SIZE``, each batch in its own transaction, so an interrupted run can be restarted and a large user table is never loaded at once. Use ``--dry-run`` to only count the users.
+"""
+import os
+import sys
+
+from pyramid.paster import (
+    bootstrap,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from ..system.mail import send_templated_mails
+from ..system.user.models import User
+from ..system.user.services.signup import SignUpService
+from ..utils.crypt import generate_random_strings
+
+
+#: Users per transaction
+BATCH_SIZE = 500
+
+#: Length of :py:attr:`tm.system.user.models.Activation.code`
+ACTIVATION_CODE_LENGTH = 32
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [--dry-run] [var=value]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def get_unactivated_users(dbsession, after_id: int, limit: int) -> list:
+    """Next batch of enabled users waiting for activation, in id order."""
+    return dbsession.query(User). \
+        filter(User.activated_at.is_(None)). \
+        filter(User.enabled.is_(True)). \
+        filter(User.id > after_id). \
+        order_by(User.id). \
+        limit(limit). \
+        all()
+
+
+def create_fresh_activation_context(signup: SignUpService, dbsession, user: User, activation_code: str) -> dict:
+    """Replace the activation token of the user, so that only the link in the new email works."""
+    previous_activation = user.activation
+    context = signup.create_email_activation_context(user, activation_code)
+    if previous_activation:
+        dbsession.delete(previous_activation)
+    return context
+
+
+def main(argv=sys.argv):
+    args = [arg for arg in argv[1:] if arg != '--dry-run']
+    dry_run = len(args) < len(argv) - 1
+    if len(args) < 1:
+        usage(argv)
+    config_uri = args[0]
+    options = parse_vars(args[1:])
+    setup_logging(config_uri)
+
+    with bootstrap(config_uri, options=options) as env:
+        request = env['request']
+        tm = request.tm
+        signup = SignUpService(request)
+
+        last_id = 0
+        total_sent = total_failed = 0
+        while True:
+            with tm:
+                users = get_unactivated_users(request.dbsession, last_id, BATCH_SIZE)
+                if not users:
+                    break
+                last_id = users[-1].id
+
+                if dry_run:
+                    total_sent += len(users)
+                    continue
+
+                # Mint the codes of the whole batch from one read of the system entropy source
+                codes = generate_random_strings(len(users), ACTIVATION_CODE_LENGTH)
+                messages = (([user.email], create_fresh_activation_context(signup, request.dbsession, user, code)) for user, code in zip(users, codes))
+                sent, failed = send_templated_mails(request, "login/email/activate", messages, tm=tm)
+                total_sent += sent
+                total_failed += failed
+
+    if dry_run:
+        print("Would send activation emails to {} users".format(total_sent))
+    else:
+        print("Sent activation emails to {} users, {} failed".format(total_sent, total_failed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Delete expired activation and authorization code rows.
+
+Run periodically, e.g. from cron::
+
+    sweep_expired_tokens production.ini
+
+See :py:mod:`tm.system.user.sweeper` for the settings.
+"""
+import os
+import sys
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from ..system.model.meta import get_engine
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [var=value]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        usage(argv)
+    config_uri = argv[1]
+    options = parse_vars(argv[2:])
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri, options=options)
+
+    from ..system.model import config_declarative_models
+    config_declarative_models()
+
+    from ..system.user.sweeper import Sweeper
+
+    engine = get_engine(settings)
+    counts = Sweeper.from_settings(settings, engine).sweep()
+    print("Deleted expired tokens: {}".format(", ".join("{} {}".format(count, table) for table, count in counts.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Create the case-insensitive lookup indexes on existing user tables, and the ``expires_at`` indexes of the activation and authorization code tables.
+
+New databases get the indexes from ``Base.metadata.create_all()``. Databases created before the indexes were declared need this one-off migration. Indexes are built with ``CREATE INDEX CONCURRENTLY`` so the users table stays writable.
+"""
+import logging
+import os
+import re
+import sys
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+
+from ..system.model.meta import get_engine
+
+
+logger = logging.getLogger(__name__)
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [var=value]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def report_case_duplicates(connection, column) -> int:
+    """Log values which differ only by case. Lookups by such value pick an arbitrary row.
+
+    :return: Number of duplicated values
+    """
+    lowered = func.lower(column)
+    query = select([lowered, func.count()]).where(column.isnot(None)).group_by(lowered).having(func.count() > 1)
+    duplicates = connection.execute(query).fetchall()
+    for value, count in duplicates:
+        logger.warning("%d users share %s %s when compared case-insensitively", count, column.name, value)
+    return len(duplicates)
+
+
+def get_create_index_ddl(index, dialect) -> str:
+    """``CREATE INDEX CONCURRENTLY IF NOT EXISTS`` statement for a declared index.
+
+    SQLAlchemy 1.3 cannot emit ``IF NOT EXISTS`` for indexes, so both options are added to the compiled statement instead of changing the declared index. It keeps the script safe to run while another copy of it, or a deploy running ``create_all()``, creates the same index.
+    """
+    ddl = str(CreateIndex(index).compile(dialect=dialect))
+    return re.sub(r"^CREATE (UNIQUE )?INDEX ", r"CREATE \1INDEX CONCURRENTLY IF NOT EXISTS ", ddl)
+
+
+def create_missing_indexes(engine, table) -> list:
+    """Create declared indexes of the table which do not exist in the database yet.
+
+    An interrupted ``CREATE INDEX CONCURRENTLY`` leaves an invalid index behind, which PostgreSQL does not use. Such indexes are dropped and built again.
+
+    :return: Names of the created indexes
+    """
+    # SQLAlchemy reflection skips expression indexes, so ask PostgreSQL directly
+    query = text(
+        "SELECT index_class.relname, pg_index.indisvalid FROM pg_index "
+        "JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid "
+        "JOIN pg_class table_class ON table_class.oid = pg_index.indrelid "
+        "WHERE table_class.relname = :table"
+    )
+    existing = {name: valid for name, valid in engine.execute(query, table=table.name)}
+    created = []
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for index in table.indexes:
+            if existing.get(index.name):
+                continue
+            if index.name in existing:
+                logger.warning("Index %s is invalid, probably left behind by an interrupted build, rebuilding it", index.name)
+                connection.execute('DROP INDEX CONCURRENTLY IF EXISTS "{}"'.format(index.name))
+            logger.info("Creating index %s", index.name)
+            connection.execute(get_create_index_ddl(index, connection.dialect))
+            created.append(index.name)
+    return created
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        usage(argv)
+    config_uri = argv[1]
+    options = parse_vars(argv[2:])
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri, options=options)
+
+    from ..system.model import config_declarative_models
+    config_declarative_models()
+
+    from ..system.user.models import Activation
+    from ..system.user.models import AuthorizationCode
+    from ..system.user.models import User
+    table = User.__table__
+
+    engine = get_engine(settings)
+
+    with engine.connect() as connection:
+        report_case_duplicates(connection, table.c.email)
+        report_case_duplicates(connection, table.c.username)
+
+    created = []
+    for model in (User, Activation, AuthorizationCode):
+        created += create_missing_indexes(engine, model.__table__)
+    print("Created indexes: {}".format(", ".join(created) if created else "none, all up to date"))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from pyramid.interfaces import IRequest
 # System
 import typing as t
 
+from tm.system.model.replica import replica_reads
 from tm.system.user.models import User
 from tm.system.user.userregistry import UserRegistry
 
@@ -15,7 +16,8 @@ def get_user(user_id: str, request: IRequest) -> t.Optional[User]:
     user_registry = UserRegistry(request)
     user = None
     if user_id is not None:
-        user = user_registry.get_user_by_id(user_id)
+        with replica_reads(request.dbsession):
+            user = user_registry.get_cached_user_by_id(user_id)
         # Check through conditions why this user would no longer be valid
         if user and not user.can_login():
             # User account disabled while in mid-session
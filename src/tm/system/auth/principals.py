@@ -5,8 +5,21 @@ from pyramid.interfaces import IRequest
 # Standard Library
 import typing as t
 
+from tm.system.user.userregistry import UserRegistry
+
+
 def resolve_principals(token: str, request: IRequest) -> t.Optional[t.List[str]]:
     """Get applied groups and other for the user.
+
+    Group principals are resolved for every request through :py:meth:`tm.system.user.userregistry.UserRegistry.get_group_names`, which serves them from the group membership cache, so that membership changes apply without logging in again. Other principals come from the token.
+
     :return: List of principals assigned to the user.
     """
-    return request.jwt_claims.get('principals', [])
+    principals = request.jwt_claims.get('principals', [])
+    user = request.user
+    if user is None:
+        return principals
+
+    group_names = UserRegistry(request).get_group_names(user)
+    principals = [principal for principal in principals if not principal.startswith('group:')]
+    return principals + ['group:{}'.format(name) for name in sorted(group_names)]
@@ -2,6 +2,8 @@
 # Pyramid
 from pyramid.events import subscriber
 
+from tm.system.user.cache import get_user_cache
+from tm.system.user.events import Login
 from tm.system.user.events import UserAuthSensitiveOperation
 from tm.utils.time import now
 
@@ -17,3 +19,17 @@ def user_auth_details_changes(event: UserAuthSensitiveOperation):
     user = event.user
     # Update the timestamp which session validation checks on every request
     user.last_auth_sensitive_operation_at = now()
+    invalidate_cached_user(event)
+
+
+@subscriber(Login)
+def user_logged_in(event: Login):
+    """Drop the cached user as login updated its last login details."""
+    invalidate_cached_user(event)
+
+
+def invalidate_cached_user(event):
+    """Remove the event user from the user cache, if one is configured."""
+    cache = get_user_cache(event.request.registry)
+    if cache is not None and event.user.id is not None:
+        cache.invalidate(event.user.id)
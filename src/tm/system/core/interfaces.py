@@ -16,3 +16,36 @@ class ISecrets(Interface):
     """
 
 
+class IMetrics(Interface):
+    """Utility collecting application metrics.
+
+    See :py:class:`tm.utils.metrics.Metrics`.
+    """
+
+    def incr(name, value=1, **labels):
+        """Increment a counter."""
+
+    def observe(name, value, **labels):
+        """Record a measurement, like a duration."""
+
+    def gauge(name, value, **labels):
+        """Set a gauge to a value or a callable returning the value."""
+
+    def snapshot():
+        """Get the current values of all metrics."""
+
+
+class IThrottleStore(Interface):
+    """Token buckets of :py:mod:`tm.system.core.throttle`.
+
+    The default keeps them in process memory. Deployments running several web processes can share them, e.g. in Redis.
+    """
+
+    def take(key: str, limit: int, period: float) -> float:
+        """Take a token from a bucket holding up to ``limit`` tokens and refilling ``limit`` tokens every ``period`` seconds.
+
+        :return: 0 if a token was taken, otherwise seconds until the next token is available.
+        """
+
+    def refund(key: str, limit: int, period: float):
+        """Put back a token taken for an attempt which was rejected by another bucket."""
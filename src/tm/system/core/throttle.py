@@ -0,0 +1,206 @@
+"""Throttle login, sign up and other expensive or abusable actions.
+
+Every attempt takes a token from a bucket of the client IP address and another of the account the attempt targets. Buckets refill continuously, so clients may burst up to the limit and then continue at the sustained rate. A client out of tokens gets ``429 Too Many Requests`` with ``Retry-After`` before we spend any CPU on password hashing or send any email.
+
+Settings:
+
+* ``tm.throttle.enabled``: default true
+
+* ``tm.throttle.<action>.ip`` and ``tm.throttle.<action>.account``: ``<attempts>/<seconds>``, like ``10/300`` for ten attempts in five minutes. ``0`` disables the limit. See :py:data:`DEFAULT_RATES` for the actions and their defaults.
+
+* ``tm.throttle.store.factory``: dotted name of a callable ``factory(registry) -> IThrottleStore``. Defaults to the in-process store, which only counts the attempts seen by one process.
+
+* ``tm.throttle.store.max_size``: in-process store sizing, the least recently used buckets are dropped first
+
+Client addresses are read from ``request.client_addr``, i.e. ``REMOTE_ADDR``. Behind a reverse proxy or a load balancer that is the address of the proxy and all clients would share one bucket, so configure waitress to take the address from the proxy headers, e.g. ``trusted_proxy = 127.0.0.1`` and ``trusted_proxy_headers = x-forwarded-for`` in ``[server:main]``. Only trust headers set by your own proxy, as clients can put anything in them.
+
+IPv6 clients are throttled by their ``/64`` network, as one host usually has the whole network to pick addresses from. Account limits also slow down the real owner of an attacked account, so keep them generous enough for people mistyping their password. Rejected attempts are counted in the ``throttle.rejected`` metric labelled with the action and the scope.
+"""
+# Standard Library
+import ipaddress
+import math
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+# Pyramid
+from pyramid.path import DottedNameResolver
+from pyramid.registry import Registry
+from pyramid.settings import asbool
+from zope.interface import implementer
+
+# System
+from tm.system.core.interfaces import IMetrics
+from tm.system.core.interfaces import IThrottleStore
+from tm.system.core.utils import get_metrics
+from tm.system.http import Request
+from tm.system.user.interfaces import Throttled
+
+
+#: Default rates as ``<attempts>/<seconds>`` by action and scope
+DEFAULT_RATES = {
+    "login.ip": "30/60",
+    "login.account": "10/300",
+    "forgot_password.ip": "10/600",
+    "forgot_password.account": "3/3600",
+    "signup.ip": "10/3600",
+    "signup.account": "3/3600",
+}
+
+
+def parse_rate(value: str) -> t.Optional[t.Tuple[int, float]]:
+    """Parse ``<attempts>/<seconds>``.
+
+    :return: Tuple(attempts, seconds) or ``None`` for no limit
+    """
+    value = value.strip()
+    if value in ("", "0"):
+        return None
+    attempts, _, seconds = value.partition("/")
+    if not seconds:
+        raise ValueError("Throttle rate must be <attempts>/<seconds>, got {}".format(value))
+    return int(attempts), float(seconds)
+
+
+def client_network(address: t.Optional[str]) -> str:
+    """Key of a client address, IPv6 addresses are cut to their /64 network."""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return str(address)
+    if ip.version == 6:
+        if ip.ipv4_mapped:
+            return str(ip.ipv4_mapped)
+        return str(ipaddress.ip_network("{}/64".format(ip), strict=False))
+    return str(ip)
+
+
+@implementer(IThrottleStore)
+class MemoryThrottleStore:
+    """Keep token buckets in process memory."""
+
+    def __init__(self, max_size: int = 100000, clock: t.Callable[[], float] = time.monotonic):
+        """Initialize MemoryThrottleStore.
+
+        :param max_size: Maximum number of buckets. Dropping a bucket forgets the attempts counted in it.
+        :param clock: Monotonic time source, can be replaced in tests.
+        """
+        self.max_size = max_size
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _refill(self, key: str, limit: int, period: float, now: float) -> float:
+        """Tokens in a bucket now, removing it from the LRU order. Call with the lock held."""
+        tokens, updated = self._buckets.pop(key, (limit, now))
+        return min(limit, tokens + (now - updated) * limit / period)
+
+    def _store(self, key: str, tokens: float, now: float):
+        """Put a bucket back as the most recently used. Call with the lock held."""
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_size:
+            self._buckets.popitem(last=False)
+
+    def take(self, key: str, limit: int, period: float) -> float:
+        now = self.clock()
+        with self._lock:
+            tokens = self._refill(key, limit, period, now)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) * period / limit
+            self._store(key, tokens, now)
+        return wait
+
+    def refund(self, key: str, limit: int, period: float):
+        now = self.clock()
+        with self._lock:
+            self._store(key, min(limit, self._refill(key, limit, period, now) + 1), now)
+
+
+class Throttle:
+    """Apply the configured rates."""
+
+    def __init__(self, store: IThrottleStore, rates: t.Dict[str, t.Optional[t.Tuple[int, float]]], metrics: t.Optional[IMetrics] = None):
+        """Initialize Throttle.
+
+        :param rates: Tuple(attempts, seconds) by ``<action>.<scope>``, ``None`` for no limit
+        :param metrics: Where to report rejected attempts, optional.
+        """
+        self.store = store
+        self.rates = rates
+        self.metrics = metrics
+
+    @classmethod
+    def from_settings(cls, settings: dict, store: IThrottleStore, metrics: t.Optional[IMetrics] = None) -> "Throttle":
+        """Create a throttle configured by ``tm.throttle.*`` settings."""
+        rates = {name: parse_rate(settings.get("tm.throttle." + name, default)) for name, default in DEFAULT_RATES.items()}
+        return cls(store, rates, metrics)
+
+    def check(self, action: str, ip: t.Optional[str], account: t.Optional[str] = None) -> float:
+        """Count an attempt.
+
+        A rejected attempt is not counted in any bucket: the account bucket is only charged if the IP bucket had a token, so that an attacker hitting the IP limit does not lock out the account too, and the IP token is put back if the account bucket is empty, so that attempts on a locked account do not use up the limit of an address shared by many users.
+
+        :param ip: Client address
+        :param account: Username or email the attempt targets, compared case insensitively
+        :return: 0 if the attempt may proceed, otherwise seconds the client should wait
+        """
+        taken = []
+        for scope, value in (("ip", client_network(ip) if ip else None), ("account", account.lower() if account else None)):
+            rate = self.rates.get("{}.{}".format(action, scope))
+            if rate is None or value is None:
+                continue
+
+            key = "{}:{}:{}".format(action, scope, value)
+            wait = self.store.take(key, *rate)
+            if wait:
+                for taken_key, taken_rate in taken:
+                    self.store.refund(taken_key, *taken_rate)
+                if self.metrics:
+                    self.metrics.incr("throttle.rejected", action=action, scope=scope)
+                return wait
+            taken.append((key, rate))
+        return 0.0
+
+
+def get_throttle(registry: Registry) -> t.Optional[Throttle]:
+    """Get the throttle, ``None`` if disabled with ``tm.throttle.enabled = false``."""
+    return registry.get("tm.throttle")
+
+
+def check_throttle(request: Request, action: str, account: t.Optional[str] = None):
+    """Count an attempt of the requesting client.
+
+    :param action: Action name as used in the ``tm.throttle.<action>.*`` settings
+    :param account: Username or email the attempt targets
+    :raise Throttled: If the client has made too many attempts
+    """
+    throttle = get_throttle(request.registry)
+    if throttle is None:
+        return
+
+    wait = throttle.check(action, request.client_addr, account)
+    if wait:
+        raise Throttled(json={"message": "Too many attempts, please try again later."}, headers={"Retry-After": str(math.ceil(wait))})
+
+
+def memory_throttle_store_factory(registry: Registry) -> IThrottleStore:
+    """Build the default in-process store from ``tm.throttle.store.*`` settings."""
+    max_size = int(registry.settings.get("tm.throttle.store.max_size", 100000))
+    return MemoryThrottleStore(max_size=max_size)
+
+
+def includeme(config):
+    """Register the throttle store and the throttle, unless ``tm.throttle.enabled`` is false."""
+    settings = config.registry.settings
+    if not asbool(settings.get("tm.throttle.enabled", True)):
+        return
+
+    factory = settings.get("tm.throttle.store.factory")
+    factory = DottedNameResolver().resolve(factory) if factory else memory_throttle_store_factory
+    store = factory(config.registry)
+    config.registry.registerUtility(store, IThrottleStore)
+    config.registry["tm.throttle"] = Throttle.from_settings(settings, store, get_metrics(config.registry))
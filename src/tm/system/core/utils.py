@@ -1,5 +1,6 @@
 import os
 import typing as t
+from .interfaces import IMetrics
 from .interfaces import ISecrets
 
 
@@ -29,6 +30,11 @@ def get_secrets(registry) -> dict:
     return registry.getUtility(ISecrets)
 
 
+def get_metrics(registry) -> IMetrics:
+    """Get the metrics collector."""
+    return registry.getUtility(IMetrics)
+
+
 def replace_env_vars(settings: dict) -> dict:
     """Expand all environment variables in a settings dictionary.
 
@@ -1,10 +1,19 @@
-"""Default template variables."""
+"""Default template variables.
+
+Variables are evaluated once per process when the configuration is committed and the values are shared by all renders, because most of them only read settings. Variables declared with ``per_request=True`` are evaluated for each render, but only for Jinja templates which refer to them.
+"""
 # Standard Library
 import datetime
 import logging
+import typing as t
 
 # Pyramid
+from jinja2 import Environment
+from jinja2 import TemplateNotFound
+from jinja2 import meta
 from pyramid.events import BeforeRender
+from pyramid.registry import Registry
+from pyramid_jinja2 import IJinja2Environment
 
 # System
 from tm.utils.time import now
@@ -15,12 +24,24 @@ logger = logging.getLogger(__name__)
 
 _template_variables = {}
 
+#: Names of the variables evaluated for every render
+_per_request_variables = set()
+
+
+def var(name, per_request=False):
+    """Decorator to mark template variables for documentation.
 
-def var(name):
-    """Decorator to mark template variables for documentation."""
+    The decorated function is called as ``func(request, registry, settings)``.
+
+    :param per_request: Evaluate the variable for every render using it. Otherwise the function is called once with ``request`` set to ``None`` and the value is reused.
+    """
 
     def _inner(func):
         _template_variables[name] = func
+        if per_request:
+            _per_request_variables.add(name)
+        else:
+            _per_request_variables.discard(name)
         return func
 
     return _inner
@@ -198,14 +219,89 @@ def _timedelta(request, registry, settings):
     return datetime.timedelta
 
 
+def get_variable_names(per_request: bool = False) -> t.FrozenSet[str]:
+    """Names of the declared template variables.
+
+    :param per_request: Names of the variables evaluated for every render instead of the ones evaluated once.
+    """
+    if per_request:
+        return frozenset(_per_request_variables)
+    return frozenset(_template_variables.keys() - _per_request_variables)
+
+
+def get_static_variables(registry: Registry) -> dict:
+    """Values of the variables which are not evaluated per request, computed on first use."""
+    values = registry.get("tm.template_variables")
+    if values is None:
+        values = {name: func(None, registry, registry.settings) for name, func in _template_variables.items() if name not in _per_request_variables}
+        registry["tm.template_variables"] = values
+    return values
+
+
+def find_template_variables(env: Environment, name: str) -> t.Optional[t.Set[str]]:
+    """Find the names a template and the templates it extends, includes and imports look up from the render context.
+
+    :return: ``None`` if this cannot be worked out, e.g. the template includes a template picked at run time.
+    """
+    names = set()
+    seen = set()
+    pending = [name]
+    while pending:
+        template_name = pending.pop()
+        if template_name in seen:
+            continue
+        seen.add(template_name)
+
+        try:
+            source = env.loader.get_source(env, template_name)[0]
+        except TemplateNotFound:
+            return None
+
+        ast = env.parse(source)
+        names.update(meta.find_undeclared_variables(ast))
+        for ref in meta.find_referenced_templates(ast):
+            if ref is None:
+                return None
+            pending.append(ref)
+    return names
+
+
+def get_used_variables(registry: Registry, renderer_info) -> t.Optional[t.Set[str]]:
+    """Names used by the template being rendered, ``None`` if unknown or not a Jinja template."""
+    env = registry.queryUtility(IJinja2Environment, name=renderer_info.type)
+    if env is None:
+        return None
+
+    cache = registry.setdefault("tm.template_variables.used", {})
+    key = (renderer_info.type, renderer_info.name)
+    if key in cache:
+        return cache[key]
+
+    names = find_template_variables(env, renderer_info.name)
+
+    # Templates may change under us when they are reloaded
+    if not env.auto_reload:
+        cache[key] = names
+    return names
+
+
 def includeme(config):
 
     def on_before_render(event):
         # Augment Pyramid template renderers with these extra variables and deal with JS placement
 
         request = event["request"]
+        registry = request.registry
 
-        for name, func in _template_variables.items():
-            event[name] = func(request, request.registry, request.registry.settings)
+        event.update(get_static_variables(registry))
+
+        if _per_request_variables:
+            used = get_used_variables(registry, event["renderer_info"])
+            names = _per_request_variables if used is None else _per_request_variables.intersection(used)
+            for name in names:
+                event[name] = _template_variables[name](request, registry, registry.settings)
 
     config.add_subscriber(on_before_render, BeforeRender)
+
+    # Evaluate once all variables and settings are in place
+    config.action("tm.template_variables", lambda: get_static_variables(config.registry))
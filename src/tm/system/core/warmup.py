@@ -0,0 +1,91 @@
+"""Compile templates at start up.
+
+Jinja compiles a template to Python code on first use, so without warm up the first sign up after a deploy pays for compiling the email templates. With ``tm.templates.warmup = true`` every template on the search paths of the Jinja renderers is compiled when the application is created.
+
+Combine with the bytecode cache of ``pyramid_jinja2`` so that compiled templates survive restarts and are shared between worker processes::
+
+    jinja2.bytecode_caching = true
+    jinja2.bytecode_caching_directory = /var/cache/tm/jinja2
+"""
+# Standard Library
+import logging
+import os
+import time
+import typing as t
+
+# Pyramid
+from jinja2 import Environment
+from jinja2 import meta
+from pyramid.events import ApplicationCreated
+from pyramid.registry import Registry
+from pyramid.settings import asbool
+from pyramid_jinja2 import IJinja2Environment
+
+
+logger = logging.getLogger(__name__)
+
+
+def find_templates(env: Environment, suffix: str) -> t.List[str]:
+    """List templates on the search path of an environment by file name suffix.
+
+    :return: Template names relative to the search path, as given to renderers
+    """
+    names = set()
+    for root in getattr(env.loader, "searchpath", []):
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(suffix):
+                    names.add(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/"))
+    return sorted(names)
+
+
+def compile_template(env: Environment, name: str, seen: t.Set[str]):
+    """Compile a template and the templates it extends and includes.
+
+    Referenced templates are compiled under the names they are looked up with at render time, as ``pyramid_jinja2`` makes them relative to the referring template.
+    """
+    if name in seen:
+        return
+    seen.add(name)
+
+    env.get_template(name)
+
+    source = env.loader.get_source(env, name)[0]
+    for ref in meta.find_referenced_templates(env.parse(source)):
+        if ref:
+            compile_template(env, env.join_path(ref, name), seen)
+
+
+def warm_up_templates(registry: Registry) -> int:
+    """Compile the templates of every Jinja renderer into the environment cache.
+
+    A template which does not compile is logged and skipped. It fails the page using it at render time, not the whole application at start up.
+
+    :return: Number of templates compiled
+    """
+    count = 0
+    for renderer_name, env in registry.getUtilitiesFor(IJinja2Environment):
+        seen = set()
+        failed = 0
+        for name in find_templates(env, renderer_name):
+            try:
+                compile_template(env, name, seen)
+            except Exception as e:
+                # Each failure stops at the one template it was raised for, which stays in seen and is not tried again
+                logger.warning("Could not compile template %s: %s: %s", name, e.__class__.__name__, e)
+                failed += 1
+        count += len(seen) - failed
+    return count
+
+
+def includeme(config):
+    settings = config.get_settings()
+    if not asbool(settings.get("tm.templates.warmup", False)):
+        return
+
+    def on_application_created(event):
+        start = time.perf_counter()
+        count = warm_up_templates(event.app.registry)
+        logger.info("Compiled %d templates in %.2f seconds", count, time.perf_counter() - start)
+
+    config.add_subscriber(on_application_created, ApplicationCreated)
@@ -7,14 +7,18 @@ from email.utils import formataddr
 
 # Pyramid
 from pyramid.renderers import render
+from pyramid.registry import Registry
 from pyramid.settings import asbool
 from transaction import TransactionManager
 
 import premailer
+from pyramid_mailer import IMailer
 from pyramid_mailer.message import Message
 
 # System
-from tm.system.mail.utils import create_mailer
+from tm.system.mail.inlining import get_inlined_template_cache
+from tm.system.mail.outbox import enqueue_message
+from tm.system.mail.utils import get_mailer
 from tm.system.http import Request
 
 
@@ -34,7 +38,7 @@ def render_templated_mail(request: Request, template: str, context: dict) -> t.T
 
     Make sure you have configured your template engine (Jinja 2) to read TXT templates beside HTML.
 
-    HTML body goes through Premailer transform step, inlining any CSS styles.
+    HTML body goes through Premailer transform step, inlining any CSS styles. The inlined HTML is cached between messages when possible, see :py:mod:`tm.system.mail.inlining`.
 
     :param template: Template filename base string for template tripled (subject, HTML body, plain text body). For example ``email/my_message`` would map to templates ``email/my_message.subject.txt``, ``email/my_message.body.txt``, ``email/my_message.body.html``
 
@@ -46,15 +50,57 @@ def render_templated_mail(request: Request, template: str, context: dict) -> t.T
     subject = render(template + ".subject.txt", context, request=request)
     subject = subject.strip()
 
-    html_body = render(template + ".body.html", context, request=request)
     text_body = render(template + ".body.txt", context, request=request)
 
     # Inline CSS styles
-    html_body = premailer.transform(html_body)
+    inlined_templates = get_inlined_template_cache(request.registry)
+    if inlined_templates:
+        html_body = inlined_templates.render_html(request, template + ".body.html", context)
+    else:
+        html_body = render(template + ".body.html", context, request=request)
+        html_body = premailer.transform(html_body)
 
     return subject, text_body, html_body
 
 
+def get_default_sender(registry: Registry) -> str:
+    """Sender from ``mail.default_sender`` with ``mail.default_sender_name`` as the name part."""
+    sender = registry.settings["mail.default_sender"]
+
+    # Add enveloped From:
+    sender_name = registry.settings.get("mail.default_sender_name")
+    if sender_name:
+        sender = formataddr((str(Header(sender_name, 'utf-8')), sender))
+    return sender
+
+
+def _get_delivery(request: Request, immediate: t.Optional[bool], tm: t.Optional[TransactionManager], subject: str) -> t.Tuple[IMailer, bool, bool]:
+    """Work out how to deliver mail.
+
+    :return: Tuple(mailer, send immediately, store in outbox)
+    """
+    if not tm:
+        tm = getattr(request, "tm", None)
+
+    # The mailer is shared by all requests. Bind a copy to our transaction manager instead of
+    # the default thread local one, which won't fly with Celery. Binding is cheap,
+    # the copy shares the SMTP connections of the original.
+    mailer = get_mailer(request.registry)
+    if tm and hasattr(mailer, "bind"):
+        # Not needed for dummy mailers
+        mailer = mailer.bind(transaction_manager=tm)
+
+    if immediate is None:
+        immediate = asbool(request.registry.settings.get("mail.immediate", False))
+
+    if not tm:
+        logger.warn("Warning: Implicit immediate email, because no transaction manager: %s", subject)
+        immediate = True
+
+    outbox = not immediate and asbool(request.registry.settings.get("mail.outbox", False))
+    return mailer, immediate, outbox
+
+
 def send_templated_mail(request: Request, recipients: t.List, template: str, context: dict, sender=None, immediate=None, tm: t.Optional[TransactionManager]=None) -> t.Tuple[str, str, str]:
     """Send out templatized HTML and plain text emails.
 
@@ -102,6 +148,8 @@ def send_templated_mail(request: Request, recipients: t.List, template: str, con
 
     :param immediate: Set True to send to the email immediately and do not wait the transaction to commit. This is very useful for debugging outgoing email issues in an interactive traceback inspector. If this is ``None`` then use setting ``mail.immediate`` that defaults to ``False``.
 
+    With setting ``mail.outbox`` the message is not sent but stored in the outbox table in the request transaction, see :py:mod:`tm.system.mail.outbox`. Immediate sends bypass the outbox.
+
     :param tm: Give transaction manager that is used instead of ``request.tm`` for the commit hook.
 
     :return: tuple(subject, text_body, html_body)
@@ -120,40 +168,16 @@ def send_templated_mail(request: Request, recipients: t.List, template: str, con
     logger.info("Sending out email to:%s subject:%s", recipients, subject)
 
     if not sender:
-        sender = request.registry.settings["mail.default_sender"]
-
-        # Add enveloped From:
-        sender_name = request.registry.settings.get("mail.default_sender_name")
-        if sender_name:
-            sender = formataddr((str(Header(sender_name, 'utf-8')), sender))
+        sender = get_default_sender(request.registry)
 
     message = Message(subject=subject, sender=sender, recipients=recipients, body=text_body, html=html_body)
     message.validate()
 
-    if not tm:
-        tm = getattr(request, "tm", None)
-
-    # TODO: Fix upstream pyramid_mailer
+    mailer, immediate, outbox = _get_delivery(request, immediate, tm, subject)
 
-    # mailer = get_mailer(request)
-
-    # We need to reconstruct mailer instance every time because it assumes thread local TM.
-    # and we want to rewrite this value for every request
-    mailer = create_mailer(request.registry)
-
-    # Don't use the default ThreadLocal transaction manager as that won't fly with Celery.
-    # Note we do this only for SMTP services, not for other more archaid mail deliveries.
-    if tm:
-        if hasattr(mailer, "direct_delivery"):
-            # Not needed for dummy mailer
-            mailer.direct_delivery.transaction_manager = tm
-
-    if immediate is None:
-        immediate = asbool(request.registry.settings.get("mail.immediate", False))
-
-    if not tm:
-        logger.warn("Warning: Implicit immediate email, because no transaction manager: %s", subject)
-        immediate = True
+    if outbox:
+        enqueue_message(request.dbsession, message)
+        return subject, text_body, html_body
 
     if immediate:
         mailer.send_immediately(message)
@@ -161,3 +185,65 @@ def send_templated_mail(request: Request, recipients: t.List, template: str, con
         mailer.send(message)
 
     return subject, text_body, html_body
+
+
+def send_templated_mails(request: Request, template: str, messages: t.Iterable[t.Tuple[t.List[str], dict]], sender=None, immediate=None, tm: t.Optional[TransactionManager]=None, flush_every: int = 100) -> t.Tuple[int, int]:
+    """Send one email template to many recipients, like reminders to thousands of users.
+
+    Works like :py:func:`send_templated_mail`, but the mailer, sender and delivery mode are looked up once for the whole batch and ``messages`` is consumed lazily: each message is rendered and handed over before the next one is pulled from the iterable, so a generator over a large query does not build all the messages up front. Templates are compiled and CSS inlined once, see :py:mod:`tm.system.mail.inlining`, and immediate sends reuse the pooled SMTP connections, see :py:class:`tm.system.mail.mailer.PooledSMTPMailer`.
+
+    Transactional sends and outbox rows are kept until the transaction commits. For very large batches commit every few hundred messages or pass ``immediate=True``.
+
+    A message which cannot be rendered or sent is logged and skipped, it does not stop the batch.
+
+    Example:
+
+    .. code-block:: python
+
+        users = dbsession.query(User).filter(User.activated_at == None).yield_per(100)
+        messages = (([user.email], dict(name=user.friendly_name)) for user in users)
+        sent, failed = send_templated_mails(request, "myapp/email/reminder", messages)
+
+    :param messages: Iterable of (recipient list, template context) tuples
+
+    :param flush_every: With ``mail.outbox`` flush queued rows to the database after this many messages, so that the session does not hold on to them
+
+    See :py:func:`send_templated_mail` for the other parameters.
+
+    :return: Tuple(number of messages sent or queued, number of failed messages)
+    """
+    if not sender:
+        sender = get_default_sender(request.registry)
+
+    mailer, immediate, outbox = _get_delivery(request, immediate, tm, template)
+
+    sent = failed = queued = 0
+    for recipients, context in messages:
+        assert type(recipients) != str, "Please give a list of recipients, not a string"
+        try:
+            subject, text_body, html_body = render_templated_mail(request, template, context)
+            message = Message(subject=subject, sender=sender, recipients=recipients, body=text_body, html=html_body)
+            message.validate()
+
+            logger.debug("Sending out email to:%s subject:%s", recipients, subject)
+
+            if outbox:
+                enqueue_message(request.dbsession, message)
+                queued += 1
+            elif immediate:
+                mailer.send_immediately(message)
+            else:
+                mailer.send(message)
+        except Exception as e:
+            logger.error("Could not send email %s to %s: %s", template, recipients, e)
+            failed += 1
+            continue
+
+        sent += 1
+
+        # Database errors are not per message, let them abort the batch
+        if queued and queued % flush_every == 0:
+            request.dbsession.flush()
+
+    logger.info("Sent out email %s to %d recipients, %d failed", template, sent, failed)
+    return sent, failed
@@ -0,0 +1,281 @@
+"""Cache CSS inlined email templates.
+
+Premailer parses the HTML body with lxml and applies the CSS with cssutils, which costs far more than rendering the Jinja template itself. The result only depends on the per-message context where the template interpolates a value, so we
+
+#. render the template once with unique markers in place of the context values,
+
+#. run premailer over that once and keep the result,
+
+#. and for each message replace the markers with the escaped context values.
+
+A template qualifies when every context variable it uses is plain output like ``{{ link }}`` or ``{{ user.friendly_name }}``. Variables used in tests, loops or filters, and templates using ``request`` or ``now``, are rendered and inlined in full as before. When a template is cached it is also rendered in full with sample values, and the template falls back to full rendering if the results differ.
+
+Template variables (:py:mod:`tm.system.core.vars`) are the same for every message and are baked into the cached HTML, except the ones evaluated per request, which make the template volatile.
+
+The premailer results can be computed at build time with the ``precompile_email_templates`` script and loaded at start up from ``mail.inlined_templates_file``. A stored result is used only if the marker rendered HTML it was computed from is byte for byte the same, so stale files are harmless.
+"""
+# Standard Library
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import typing as t
+
+import lxml.html
+import premailer
+from jinja2 import Environment
+from jinja2 import meta
+from jinja2 import nodes
+from markupsafe import escape
+from pyramid.registry import Registry
+from pyramid.renderers import render
+from pyramid_jinja2 import IJinja2Environment
+
+# System
+from tm.system.core.vars import get_variable_names
+from tm.system.core.warmup import find_templates
+from tm.system.http import Request
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Names whose value changes between renders, templates using them are never cached
+VOLATILE_NAMES = {"request", "req", "context", "view", "now"}
+
+#: Names Pyramid adds to every render
+SYSTEM_NAMES = {"renderer_name", "renderer_info"}
+
+
+class TemplateAnalysis:
+    """Which context variables a template tree uses and how."""
+
+    def __init__(self):
+        #: Attribute paths used as plain output, like ``("user", "friendly_name")``
+        self.paths = set()
+
+        #: Variables used in any other way
+        self.complex_names = set()
+
+        #: Uses something which differs between renders
+        self.volatile = False
+
+
+def _as_path(node: nodes.Node) -> t.Optional[t.Tuple[str, ...]]:
+    if isinstance(node, nodes.Name) and node.ctx == "load":
+        return (node.name, )
+    if isinstance(node, nodes.Getattr):
+        parent = _as_path(node.node)
+        return parent + (node.attr, ) if parent else None
+    return None
+
+
+def _path_root(node: nodes.Node) -> nodes.Name:
+    while isinstance(node, nodes.Getattr):
+        node = node.node
+    return node
+
+
+def analyze_template(env: Environment, name: str) -> TemplateAnalysis:
+    """Inspect a template together with the templates it extends and includes."""
+    analysis = TemplateAnalysis()
+    volatile_names = VOLATILE_NAMES | get_variable_names(per_request=True)
+    static_names = get_variable_names() | SYSTEM_NAMES | set(env.globals)
+
+    seen = set()
+    pending = [name]
+    while pending:
+        template_name = pending.pop()
+        if template_name in seen:
+            continue
+        seen.add(template_name)
+
+        source = env.loader.get_source(env, template_name)[0]
+        ast = env.parse(source)
+
+        pending.extend(ref for ref in meta.find_referenced_templates(ast) if ref)
+
+        plain = set()
+        for output in ast.find_all(nodes.Output):
+            for child in output.nodes:
+                path = _as_path(child)
+                if path:
+                    plain.add(id(_path_root(child)))
+                    if path[0] not in static_names:
+                        analysis.paths.add(path)
+
+        for node in ast.find_all(nodes.Name):
+            if node.name in volatile_names:
+                analysis.volatile = True
+            if node.ctx == "load" and id(node) not in plain and node.name not in static_names:
+                analysis.complex_names.add(node.name)
+
+    return analysis
+
+
+class _MarkerValue:
+    """Stands in for a context value while rendering the marker template."""
+
+    def __init__(self, template: "InlinedTemplate", path: t.Tuple[str, ...]):
+        self._template = template
+        self._path = path
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return _MarkerValue(self._template, self._path + (attr, ))
+
+    def __html__(self):
+        return self._template.marker_for(self._path)
+
+    __str__ = __html__
+
+
+class _SampleValue:
+    """Context value with characters which need escaping, for checking cached output against a full render."""
+
+    def __init__(self, path: t.Tuple[str, ...]):
+        self._path = path
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return _SampleValue(self._path + (attr, ))
+
+    def __str__(self):
+        return "{} <&> \"'\u00e4".format(".".join(self._path))
+
+
+class InlinedTemplate:
+    """Premailer output of one template with markers where context values go."""
+
+    def __init__(self, name: str, analysis: TemplateAnalysis):
+        self.name = name
+        self.analysis = analysis
+        self.nonce = hashlib.sha1(name.encode("utf-8")).hexdigest()[:10]
+        self.pattern = re.compile("tmmail{}v(\\d+)x".format(self.nonce))
+        self.markers = []
+        self.html = None
+
+    def marker_for(self, path: t.Tuple[str, ...]) -> str:
+        if path not in self.markers:
+            self.markers.append(path)
+        return "tmmail{}v{}x".format(self.nonce, self.markers.index(path))
+
+    def marker_context(self) -> dict:
+        return {path[0]: _MarkerValue(self, path[:1]) for path in self.analysis.paths}
+
+    def sample_context(self) -> dict:
+        return {path[0]: _SampleValue(path[:1]) for path in self.analysis.paths}
+
+    def can_render(self, context: dict) -> bool:
+        return not self.analysis.complex_names.intersection(context)
+
+    def render(self, env: Environment, context: dict) -> str:
+        """Fill in context values."""
+        autoescape = env.autoescape(self.name) if callable(env.autoescape) else env.autoescape
+
+        def resolve(match):
+            path = self.markers[int(match.group(1))]
+            value = context.get(path[0], env.undefined(name=path[0]))
+            for attr in path[1:]:
+                value = env.getattr(value, attr)
+            return str(escape(value)) if autoescape else str(value)
+
+        return self.pattern.sub(resolve, self.html)
+
+
+def _same_document(a: str, b: str) -> bool:
+    """Compare HTML documents ignoring differences in escaping and attribute quoting."""
+
+    def normalize(doc: str) -> str:
+        return lxml.html.tostring(lxml.html.document_fromstring(doc), encoding="unicode")
+
+    return a == b or normalize(a) == normalize(b)
+
+
+class InlinedTemplateCache:
+    """Render CSS inlined email bodies, reusing premailer output between messages."""
+
+    def __init__(self, registry: Registry, precompiled: t.Optional[dict] = None):
+        """Initialize InlinedTemplateCache.
+
+        :param precompiled: Premailer results by SHA-256 of their input, as written by :py:meth:`precompile`.
+        """
+        self.registry = registry
+        self.precompiled = precompiled or {}
+        self.templates = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, registry: Registry, path: str) -> "InlinedTemplateCache":
+        """Load precompiled results. A missing file is not an error, templates are then inlined on first use."""
+        precompiled = {}
+        if os.path.exists(path):
+            with open(path, "rt") as f:
+                precompiled = json.load(f)
+        return cls(registry, precompiled)
+
+    @property
+    def env(self) -> Environment:
+        return self.registry.getUtility(IJinja2Environment, name=".html")
+
+    def _inline(self, source_html: str) -> str:
+        digest = hashlib.sha256(source_html.encode("utf-8")).hexdigest()
+        inlined = self.precompiled.get(digest)
+        if inlined is None:
+            inlined = premailer.transform(source_html)
+            self.precompiled[digest] = inlined
+        return inlined
+
+    def compile(self, request: Request, name: str) -> t.Optional[InlinedTemplate]:
+        """Get the cached template, inlining it on first use.
+
+        :return: ``None`` if the template cannot be cached.
+        """
+        with self._lock:
+            if name in self.templates:
+                return self.templates[name]
+
+        analysis = analyze_template(self.env, name)
+        template = None
+        if not analysis.volatile:
+            template = InlinedTemplate(name, analysis)
+            template.html = self._inline(render(name, template.marker_context(), request=request))
+
+            # Check against a full render with awkward values, in case the template does something we did not foresee
+            sample = template.sample_context()
+            expected = self._inline(render(name, sample, request=request))
+            if not _same_document(expected, template.render(self.env, sample)):
+                logger.warning("Cached inlining of email template %s does not match a full render, disabling it", name)
+                template = None
+        else:
+            logger.info("Email template %s uses per-render values and is inlined for every message", name)
+
+        with self._lock:
+            return self.templates.setdefault(name, template)
+
+    def render_html(self, request: Request, name: str, context: dict) -> str:
+        """Render and CSS inline an HTML email body."""
+        template = self.compile(request, name)
+        if template is None or not template.can_render(context):
+            return premailer.transform(render(name, context, request=request))
+        return template.render(self.env, context)
+
+    def precompile(self, request: Request, names: t.Iterable[str]) -> dict:
+        """Inline templates now and return the results for :py:meth:`from_file`."""
+        for name in names:
+            self.compile(request, name)
+        return dict(self.precompiled)
+
+
+def find_email_templates(env: Environment, suffix: str = ".body.html") -> t.List[str]:
+    """List HTML email body templates on the template search path."""
+    return find_templates(env, suffix)
+
+
+def get_inlined_template_cache(registry: Registry) -> t.Optional[InlinedTemplateCache]:
+    """Get the inlined template cache, ``None`` if disabled with ``mail.inline_cache = false``."""
+    return registry.get("mail.inlined_templates")
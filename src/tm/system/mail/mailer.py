@@ -1,4 +1,218 @@
+# Standard Library
+import collections
+import logging
+import smtplib
+import ssl
+import threading
+import time
+import typing as t
+
+from pyramid.settings import asbool
 from pyramid_mailer.mailer import DummyMailer
+from repoze.sendmail.mailer import EHLO_Error
+from repoze.sendmail.mailer import ESMTP_NotSupported
+from repoze.sendmail.mailer import HAVE_SSL
+from repoze.sendmail.mailer import Message
+from repoze.sendmail.mailer import NotAnEmailMessage
+from repoze.sendmail.mailer import SMTPMailer
+from repoze.sendmail.mailer import SSL_NotAvailable
+from repoze.sendmail.mailer import TLS_NotAvailable
+from repoze.sendmail.mailer import encode_message
+
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSMTPMailer(SMTPMailer):
+    """SMTP mailer keeping connections open between messages.
+
+    The stock mailer opens a new connection, and does the TLS handshake and login, for every message. This one keeps up to ``pool_size`` idle connections around and reuses them. A connection is retired after ``max_messages`` messages or when it has been idle for ``max_idle`` seconds, as servers drop idle clients. If a reused connection turns out to be dead the message is sent again over a fresh one.
+
+    Safe to share between threads: every send checks out its own connection.
+    """
+
+    def __init__(self, pool_size: int = 2, max_messages: int = 100, max_idle: float = 30, keyfile: t.Optional[str] = None, certfile: t.Optional[str] = None, **kwargs):
+        """Initialize PooledSMTPMailer.
+
+        :param pool_size: Maximum number of idle connections to keep.
+        :param max_messages: Reconnect after this many messages over one connection.
+        :param max_idle: Do not reuse connections idle for longer than this many seconds.
+        :param keyfile: Private key of the client certificate, if not contained in ``certfile``.
+        :param certfile: Client certificate presented to the server over SSL or STARTTLS.
+        :param kwargs: Server options passed to :py:class:`repoze.sendmail.mailer.SMTPMailer`.
+        """
+        super().__init__(**kwargs)
+        self.keyfile = keyfile
+        self.certfile = certfile
+        self.pool_size = pool_size
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    def ssl_context(self) -> t.Optional[ssl.SSLContext]:
+        """Create the TLS context carrying the client certificate.
+
+        Mirrors what smtplib did with its own ``keyfile`` and ``certfile`` arguments, removed in Python 3.12: the server certificate is not verified.
+
+        :return: None when no client certificate is configured, so smtplib uses its defaults
+        """
+        if not self.certfile:
+            return None
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        context.load_cert_chain(self.certfile, self.keyfile)
+        return context
+
+    def smtp_factory(self) -> smtplib.SMTP:
+        context = self.ssl_context()
+        if not (self.ssl and context):
+            return super().smtp_factory()
+        if self.smtp_ssl is None:
+            raise SSL_NotAvailable()
+        connection = self.smtp_ssl(self.hostname, str(self.port), timeout=10, context=context)
+        connection.set_debuglevel(self.debug_smtp)
+        return connection
+
+    def connect(self) -> smtplib.SMTP:
+        """Open a connection, negotiate TLS and log in."""
+        connection = self.smtp_factory()
+
+        code, response = connection.ehlo()
+        if code < 200 or code >= 300:
+            code, response = connection.helo()
+            if code < 200 or code >= 300:
+                raise EHLO_Error(code, response)
+
+        have_tls = connection.has_extn("starttls")
+        if not have_tls and self.force_tls:
+            raise TLS_NotAvailable()
+
+        if have_tls and HAVE_SSL and not self.no_tls:
+            connection.starttls(context=self.ssl_context())
+            connection.ehlo()
+
+        if connection.does_esmtp:
+            if self.username is not None and self.password is not None:
+                connection.login(self.username, self.password)
+        elif self.username:
+            raise ESMTP_NotSupported()
+
+        return connection
+
+    def _checkout(self) -> t.Tuple[smtplib.SMTP, int]:
+        """Get an idle connection, or a new one.
+
+        :return: Tuple (connection, number of messages sent over it so far)
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, sent, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.max_idle:
+                return connection, sent
+            self._close(connection)
+        return self.connect(), 0
+
+    def _checkin(self, connection: smtplib.SMTP, sent: int):
+        if sent < self.max_messages:
+            with self._lock:
+                if len(self._idle) < self.pool_size:
+                    self._idle.append((connection, sent, time.monotonic()))
+                    return
+        self._close(connection)
+
+    def _reset(self, connection: smtplib.SMTP, sent: int):
+        """Return a connection to the pool after a refused message, unless the server hung up."""
+        try:
+            connection.rset()
+        except Exception:
+            connection.close()
+        else:
+            self._checkin(connection, sent)
+
+    def _close(self, connection: smtplib.SMTP):
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+    def send(self, fromaddr, toaddrs, message):
+        if not isinstance(message, Message):
+            raise NotAnEmailMessage()
+
+        message = encode_message(message)
+
+        connection, sent = self._checkout()
+        try:
+            connection.sendmail(fromaddr, toaddrs, message)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # The server refused this message, the connection may still be good
+            self._reset(connection, sent + 1)
+            raise
+        except OSError as e:
+            # Covers SMTPServerDisconnected and socket errors
+            connection.close()
+            if not sent:
+                raise
+            # Stale connection from the pool, try once more over a new one
+            logger.info("Reconnecting to mail server after: %s", e)
+            connection, sent = self.connect(), 0
+            try:
+                connection.sendmail(fromaddr, toaddrs, message)
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+
+        self._checkin(connection, sent + 1)
+
+    def close(self):
+        """Disconnect all idle connections."""
+        with self._lock:
+            idle, self._idle = list(self._idle), collections.deque()
+        for connection, sent, last_used in idle:
+            self._close(connection)
+
+
+def create_smtp_mailer(settings: dict) -> PooledSMTPMailer:
+    """Create a pooled SMTP mailer from the same ``mail.*`` settings pyramid_mailer uses.
+
+    Pool settings:
+
+    * ``mail.smtp_pool_size``: idle connections to keep, default 2
+
+    * ``mail.smtp_max_messages_per_connection``: default 100
+
+    * ``mail.smtp_max_idle_seconds``: default 30
+
+    ``mail.keyfile`` and ``mail.certfile`` give a client certificate, used over STARTTLS as well as SSL.
+    """
+    username = settings.get("mail.username") or None
+    password = settings.get("mail.password") or None
+    if not (username or password):
+        username = password = None
+
+    tls = asbool(settings.get("mail.tls", False))
+    return PooledSMTPMailer(
+        hostname=settings.get("mail.host", "localhost"),
+        port=int(settings.get("mail.port", 25)),
+        username=username,
+        password=password,
+        no_tls=not tls,
+        force_tls=tls,
+        ssl=asbool(settings.get("mail.ssl", False)),
+        debug_smtp=int(settings.get("mail.debug", 0)),
+        keyfile=settings.get("mail.keyfile") or None,
+        certfile=settings.get("mail.certfile") or None,
+        pool_size=int(settings.get("mail.smtp_pool_size", 2)),
+        max_messages=int(settings.get("mail.smtp_max_messages_per_connection", 100)),
+        max_idle=float(settings.get("mail.smtp_max_idle_seconds", 30)),
+    )
 
 
 class StdoutMailer:
@@ -0,0 +1,69 @@
+"""Outbound mail queue stored in the database."""
+
+# SQLAlchemy
+from sqlalchemy import Column
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy import Text
+from sqlalchemy.ext.declarative.base import _declarative_constructor
+from sqlalchemy_utils.types.json import JSONType
+
+# System
+from tm.system.model.columns import UTCDateTime
+from tm.utils.time import now
+
+
+class OutboxMessage:
+    """A rendered email waiting to be handed to the SMTP server.
+
+    Rows are written in the same transaction as the change that caused the email, so a rolled back request never sends mail and a committed one never loses it. ``mail_outbox_worker`` drains the table.
+    """
+
+    #: Waiting to be sent or retried
+    PENDING = "pending"
+
+    #: Handed to the mail server
+    SENT = "sent"
+
+    #: Gave up after too many attempts
+    FAILED = "failed"
+
+    __tablename__ = "mail_outbox"
+
+    __table_args__ = (
+        Index("ix_mail_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    __init__ = _declarative_constructor
+
+    #: Running counter id
+    id = Column(Integer, autoincrement=True, primary_key=True)
+    created_at = Column(UTCDateTime, default=now)
+    updated_at = Column(UTCDateTime, onupdate=now)
+
+    #: Envelope sender, may include a name part
+    sender = Column(Text, nullable=False)
+
+    #: List of recipient emails
+    recipients = Column(JSONType, nullable=False)
+
+    subject = Column(Text, nullable=False)
+    text_body = Column(Text)
+    html_body = Column(Text)
+
+    status = Column(String(16), nullable=False, default=PENDING)
+
+    #: How many times we have tried to send this
+    attempts = Column(Integer, nullable=False, default=0)
+
+    #: Do not try to send before this
+    next_attempt_at = Column(UTCDateTime, nullable=False, default=now)
+
+    #: Error of the latest failed attempt
+    last_error = Column(Text)
+
+    sent_at = Column(UTCDateTime)
+
+    def __repr__(self):
+        return "#{}: {} to {}".format(self.id, self.status, self.recipients)
@@ -0,0 +1,234 @@
+"""Durable outbound mail queue.
+
+With ``mail.outbox = true`` :py:func:`tm.system.mail.send_templated_mail` does not talk to the mail server. It stores the rendered message in the ``mail_outbox`` table inside the request transaction, so sign up and forgot password responses never wait on SMTP. The ``mail_outbox_worker`` console script sends the messages.
+
+A worker claims a batch of due messages in one short transaction, which counts the attempt and pushes ``next_attempt_at`` forward by the claim timeout so that no other worker picks the messages up. The messages are sent after that transaction has committed, so no row locks are held while talking to the mail server, and the outcome is recorded in another short transaction.
+
+Delivery is at-least-once: if the worker dies after the mail server accepted a message but before the outcome is recorded, the claim expires and the message is sent again.
+
+Settings read by the worker:
+
+* ``mail.outbox.concurrency``: sender threads, default 2
+
+* ``mail.outbox.batch_size``: messages claimed per transaction, default 10
+
+* ``mail.outbox.max_attempts``: give up and mark the message failed after this many attempts, default 8
+
+* ``mail.outbox.retry_backoff_seconds``: wait before the first retry, doubled for every further attempt, default 30
+
+* ``mail.outbox.retry_backoff_max_seconds``: upper limit of the wait, default 3600
+
+* ``mail.outbox.poll_interval_seconds``: how often an idle worker looks for new messages, default 5
+
+* ``mail.outbox.claim_timeout_seconds``: how long a claimed message is left alone before another worker may try it, default 300. Keep it well above the time it takes to send a batch.
+"""
+# Standard Library
+import datetime
+import logging
+import random
+import threading
+import typing as t
+
+import transaction
+from pyramid_mailer import IMailer
+from pyramid_mailer.message import Message
+from sqlalchemy.orm import Session
+
+# System
+from tm.system.mail.models import OutboxMessage
+from tm.system.model.isolation import set_transaction_characteristics
+from tm.system.model.meta import get_tm_session
+from tm.utils.time import now
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_message(dbsession: Session, message: Message) -> OutboxMessage:
+    """Store a message in the outbox. It is sent after the transaction commits.
+
+    :param dbsession: Session of the transaction the message belongs to.
+    :param message: Validated pyramid_mailer message.
+    """
+    row = OutboxMessage(
+        sender=message.sender,
+        recipients=list(message.recipients),
+        subject=message.subject,
+        text_body=message.body,
+        html_body=message.html,
+    )
+    dbsession.add(row)
+    return row
+
+
+def to_message(row: OutboxMessage) -> Message:
+    """Build a pyramid_mailer message from an outbox row."""
+    return Message(subject=row.subject, sender=row.sender, recipients=row.recipients, body=row.text_body, html=row.html_body)
+
+
+def get_retry_delay(attempts: int, base: float, maximum: float) -> float:
+    """Exponential backoff with jitter, so that messages which failed together are not retried together.
+
+    :param attempts: Number of attempts made so far, at least one.
+    :return: Seconds to wait before the next attempt.
+    """
+    delay = min(base * 2 ** (attempts - 1), maximum)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class OutboxWorker:
+    """Send outbox messages from a pool of threads.
+
+    Each thread claims a batch of due messages with ``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of threads and worker processes can drain the same table without sending a message twice.
+    """
+
+    def __init__(self, session_factory, mailer: IMailer, concurrency: int = 2, batch_size: int = 10, max_attempts: int = 8,
+                 retry_backoff: float = 30, retry_backoff_max: float = 3600, poll_interval: float = 5, claim_timeout: float = 300):
+        """Initialize OutboxWorker.
+
+        :param session_factory: Session factory of the application database.
+        :param mailer: Mailer used to hand the messages to the mail server.
+        """
+        self.session_factory = session_factory
+        self.mailer = mailer
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.stopping = threading.Event()
+
+    @classmethod
+    def from_settings(cls, settings: dict, session_factory, mailer: IMailer) -> "OutboxWorker":
+        """Create a worker configured by ``mail.outbox.*`` settings."""
+        return cls(
+            session_factory,
+            mailer,
+            concurrency=int(settings.get("mail.outbox.concurrency", 2)),
+            batch_size=int(settings.get("mail.outbox.batch_size", 10)),
+            max_attempts=int(settings.get("mail.outbox.max_attempts", 8)),
+            retry_backoff=float(settings.get("mail.outbox.retry_backoff_seconds", 30)),
+            retry_backoff_max=float(settings.get("mail.outbox.retry_backoff_max_seconds", 3600)),
+            poll_interval=float(settings.get("mail.outbox.poll_interval_seconds", 5)),
+            claim_timeout=float(settings.get("mail.outbox.claim_timeout_seconds", 300)),
+        )
+
+    def claim(self) -> t.List[t.Tuple[int, Message]]:
+        """Claim a batch of due messages in a short transaction of its own.
+
+        The attempt is counted and ``next_attempt_at`` pushed past the claim timeout before the transaction commits, so the row locks are released before any mail is sent.
+
+        :return: List of (row id, message) tuples
+        """
+        tm = transaction.TransactionManager(explicit=True)
+        with tm:
+            dbsession = get_tm_session(self.session_factory, tm)
+
+            # SKIP LOCKED keeps concurrent claims apart and claimed rows are no longer due, serializable would only add conflicts
+            set_transaction_characteristics(dbsession, "READ COMMITTED")
+
+            rows = dbsession.query(OutboxMessage). \
+                filter(OutboxMessage.status == OutboxMessage.PENDING). \
+                filter(OutboxMessage.next_attempt_at <= now()). \
+                order_by(OutboxMessage.next_attempt_at). \
+                limit(self.batch_size). \
+                with_for_update(skip_locked=True). \
+                all()
+
+            claimed_until = now() + datetime.timedelta(seconds=self.claim_timeout)
+            claimed = []
+            for row in rows:
+                row.attempts += 1
+                row.next_attempt_at = claimed_until
+                claimed.append((row.id, to_message(row)))
+
+        return claimed
+
+    def send(self, message: Message) -> t.Optional[str]:
+        """Hand one claimed message to the mail server.
+
+        :return: ``None`` on success, otherwise the error
+        """
+        try:
+            self.mailer.send_immediately(message)
+        except Exception as e:
+            return "{}: {}".format(e.__class__.__name__, e)
+        return None
+
+    def record(self, outcomes: t.List[t.Tuple[int, t.Optional[str]]]):
+        """Mark sent messages sent and schedule retries of failed ones.
+
+        :param outcomes: List of (row id, error or ``None``) tuples
+        """
+        tm = transaction.TransactionManager(explicit=True)
+        with tm:
+            dbsession = get_tm_session(self.session_factory, tm)
+            set_transaction_characteristics(dbsession, "READ COMMITTED")
+
+            for row_id, error in outcomes:
+                row = dbsession.query(OutboxMessage).get(row_id)
+                row.last_error = error
+                if error is None:
+                    row.status = OutboxMessage.SENT
+                    row.sent_at = now()
+                elif row.attempts >= self.max_attempts:
+                    logger.error("Giving up sending mail %s after %d attempts: %s", row.id, row.attempts, error)
+                    row.status = OutboxMessage.FAILED
+                else:
+                    delay = get_retry_delay(row.attempts, self.retry_backoff, self.retry_backoff_max)
+                    logger.warning("Sending mail %s failed, retrying in %d seconds: %s", row.id, delay, error)
+                    row.next_attempt_at = now() + datetime.timedelta(seconds=delay)
+
+    def process_batch(self) -> int:
+        """Claim, send and record one batch of due messages.
+
+        :return: Number of messages claimed
+        """
+        claimed = self.claim()
+        if claimed:
+            self.record([(row_id, self.send(message)) for row_id, message in claimed])
+        return len(claimed)
+
+    def drain(self) -> int:
+        """Send due messages until there are none left.
+
+        :return: Number of messages processed
+        """
+        total = 0
+        while not self.stopping.is_set():
+            count = self.process_batch()
+            total += count
+            if count < self.batch_size:
+                break
+        return total
+
+    def loop(self):
+        while not self.stopping.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                logger.exception("Mail outbox worker failed: %s", e)
+            self.stopping.wait(self.poll_interval)
+
+    def run(self, once: bool = False):
+        """Run the worker threads.
+
+        :param once: Drain the due messages and return instead of polling forever.
+        """
+        target = self.drain if once else self.loop
+        threads = [threading.Thread(target=target, name="tm-mail-outbox-{}".format(i)) for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        """Ask the threads to finish their current batch and exit."""
+        self.stopping.set()
@@ -1,5 +1,6 @@
 # Pyramid
 from pyramid.registry import Registry
+from pyramid.settings import aslist
 from pyramid.util import DottedNameResolver
 
 from pyramid_mailer import IMailer
@@ -16,6 +17,7 @@ def get_mailer(registry) -> IMailer:
 def create_mailer(registry: Registry) -> IMailer:
     """Create a new mailer instance.
 
+    The application creates one mailer at start up and registers it as :py:class:`pyramid_mailer.IMailer`, use :py:func:`get_mailer` to get it. The default SMTP mailer keeps its connections open between messages, see :py:class:`tm.system.mail.mailer.PooledSMTPMailer`.
     """
 
     settings = registry.settings
@@ -31,8 +33,15 @@ def create_mailer(registry: Registry) -> IMailer:
     if mailer_class in ("mail", ""):
         # TODO: Make mailer_class explicit so we can dynamically load pyramid_mail.Mailer
         # Default
-        from pyramid_mailer import mailer_factory_from_settings
-        mailer = mailer_factory_from_settings(settings)
+        from pyramid_mailer.mailer import Mailer
+        from tm.system.mail.mailer import create_smtp_mailer
+        mailer = Mailer(
+            smtp_mailer=create_smtp_mailer(settings),
+            queue_path=settings.get("mail.queue_path"),
+            default_sender=settings.get("mail.default_sender"),
+            sendmail_app=settings.get("mail.sendmail_app"),
+            sendmail_template=aslist(settings.get("mail.sendmail_template", "")) or None,
+        )
     else:
         # debug backend
         resolver = DottedNameResolver()
@@ -1,13 +1,18 @@
 def config_declarative_models():
+    """Attach the system models to :py:data:`tm.system.model.meta.Base`.
+
+    Scripts call this before touching the database. Calling it again, e.g. when tests create several applications in one process, does nothing.
+    """
     from tm.system.model.meta import Base
     from tm.system.user import models
-
+    from tm.system.mail import models as mail_models
 
     attach_model_to_base(models.User, Base)
     attach_model_to_base(models.Group, Base)
     attach_model_to_base(models.Activation, Base)
     attach_model_to_base(models.UserGroup, Base)
     attach_model_to_base(models.AuthorizationCode, Base)
+    attach_model_to_base(mail_models.OutboxMessage, Base)
 
 
 def attach_model_to_base(ModelClass: type, Base: type):
@@ -18,4 +23,6 @@ def attach_model_to_base(ModelClass: type, Base: type):
     Directly inheriting from SQLAlchemy Base class has non-undoable side effects. All models automatically pollute SQLAlchemy namespace and may e.g. cause problems with conflicting table names. This also allows @declared_attr to access Pyramid registry.
     """
     from sqlalchemy.ext.declarative import instrument_declarative
+    if "__table__" in ModelClass.__dict__:
+        return
     instrument_declarative(ModelClass, registry=Base._decl_class_registry, metadata=Base.metadata)
@@ -0,0 +1,171 @@
+"""Per-view transaction isolation.
+
+The engine runs every transaction as ``SERIALIZABLE`` unless ``tm.db.isolation_level`` says otherwise. Views which do not need it can ask for a weaker level or a read-only transaction::
+
+    @view_config(route_name="users", isolation_level="READ COMMITTED")
+    def users(request):
+        ...
+
+    @service.get(read_only=True)
+    def get_thing(request):
+        ...
+
+Cornice passes both options through to ``add_view``.
+
+A read-only view without an explicit level runs as ``REPEATABLE READ READ ONLY``. It sees one consistent snapshot, but unlike ``SERIALIZABLE`` a read-only transaction on that level never fails with a serialization error, so it is never retried.
+
+The level is applied with ``SET TRANSACTION`` as the first statement of the transaction. It only takes effect if the view is the first one to touch the database in the request, which is why the view deriver runs ahead of the permission check (that loads the user).
+
+Serialization failures are counted per route in the ``db.serialization_failures`` metric, labelled with whether the request is going to be retried.
+"""
+# Standard Library
+import logging
+import typing as t
+
+# Pyramid
+from pyramid import tweens
+from pyramid import viewderivers
+from pyramid_retry import is_last_attempt
+
+# SQLAlchemy
+import sqlalchemy.exc
+from sqlalchemy import event
+
+# System
+from tm.system.core.utils import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+ISOLATION_LEVELS = ("SERIALIZABLE", "REPEATABLE READ", "READ COMMITTED", "READ UNCOMMITTED")
+
+#: Level used by ``read_only=True`` views which do not give one
+READ_ONLY_ISOLATION_LEVEL = "REPEATABLE READ"
+
+#: PostgreSQL error codes pyramid_retry retries on: serialization_failure and deadlock_detected
+SERIALIZATION_FAILURE_CODES = ("40001", "40P01")
+
+
+def normalize_isolation_level(level: str) -> str:
+    """Turn ``read_committed`` or ``read committed`` into ``READ COMMITTED``."""
+    normalized = level.replace("_", " ").upper()
+    if normalized not in ISOLATION_LEVELS:
+        raise ValueError("Unknown transaction isolation level: {}".format(level))
+    return normalized
+
+
+def set_transaction_characteristics(session, isolation_level: t.Optional[str] = None, read_only: bool = False):
+    """Ask the next transaction of a session to run with given characteristics.
+
+    :return: False if the session has already started its transaction and it is too late.
+    """
+    if session.info.get("tm.isolation.begun"):
+        return False
+
+    if read_only and not isolation_level:
+        isolation_level = READ_ONLY_ISOLATION_LEVEL
+
+    session.info["tm.isolation"] = (isolation_level, read_only)
+    return True
+
+
+def transaction_isolation(view, info):
+    """View deriver applying ``isolation_level`` and ``read_only`` view options to ``request.dbsession``."""
+    isolation_level = info.options.get("isolation_level")
+    read_only = bool(info.options.get("read_only", False))
+
+    if not isolation_level and not read_only:
+        return view
+
+    if isolation_level:
+        isolation_level = normalize_isolation_level(isolation_level)
+
+    def wrapper(context, request):
+        if not set_transaction_characteristics(request.dbsession, isolation_level, read_only):
+            logger.warning("Transaction already started before view %s, cannot change its isolation level", info.original_view)
+        return view(context, request)
+
+    return wrapper
+
+
+transaction_isolation.options = ("isolation_level", "read_only")
+
+
+def after_begin(session, transaction, connection):
+    """Apply requested transaction characteristics as the first statement of the transaction.
+
+    This runs for every connection the transaction uses, i.e. both the primary and the read replica.
+    """
+    session.info["tm.isolation.begun"] = True
+
+    isolation_level, read_only = session.info.get("tm.isolation", (None, False))
+    if not isolation_level and not read_only:
+        return
+
+    if isolation_level == "SERIALIZABLE" and connection.engine is getattr(session, "replica_bind", None):
+        # Hot standbys refuse serializable transactions
+        isolation_level = READ_ONLY_ISOLATION_LEVEL
+
+    statement = "SET TRANSACTION"
+    if isolation_level:
+        statement += " ISOLATION LEVEL " + isolation_level
+    if read_only:
+        statement += " READ ONLY"
+    connection.execute(statement)
+
+
+def after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("tm.isolation.begun", None)
+        session.info.pop("tm.isolation", None)
+
+
+def is_serialization_failure(exc: BaseException) -> bool:
+    """Check if an exception, or one it was raised from, is a PostgreSQL serialization failure or deadlock."""
+    while exc is not None:
+        if isinstance(exc, sqlalchemy.exc.DBAPIError):
+            if getattr(exc.orig, "pgcode", None) in SERIALIZATION_FAILURE_CODES:
+                return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def serialization_failure_tween_factory(handler, registry):
+    """Count serialization failures per route.
+
+    Sits outside of ``pyramid_tm``, so that failures raised on commit are seen too.
+    """
+    metrics = get_metrics(registry)
+
+    def record(request, exc):
+        route = request.matched_route.name if request.matched_route else None
+        retried = not is_last_attempt(request)
+        metrics.incr("db.serialization_failures", route=route, retried=retried)
+        logger.info("Serialization failure on route %s, retried: %s", route, retried)
+
+    def tween(request):
+        try:
+            response = handler(request)
+        except Exception as e:
+            if is_serialization_failure(e):
+                record(request, e)
+            raise
+
+        exc = getattr(request, "exception", None)
+        if exc is not None and is_serialization_failure(exc):
+            record(request, exc)
+
+        return response
+
+    return tween
+
+
+def includeme(config):
+    """Set up per-view isolation levels on the application session factory."""
+    session_factory = config.registry["dbsession_factory"]
+    event.listen(session_factory, "after_begin", after_begin)
+    event.listen(session_factory, "after_transaction_end", after_transaction_end)
+
+    config.add_view_deriver(transaction_isolation, under=viewderivers.INGRESS, over="secured_view")
+    config.add_tween("tm.system.model.isolation.serialization_failure_tween_factory", under=tweens.INGRESS)
@@ -20,6 +20,13 @@ from sqlalchemy.orm import sessionmaker
 # from sqlalchemy.orm import configure_mappers
 import zope.sqlalchemy
 
+from tm.system.core.utils import get_metrics
+
+from tm.system.model.pool import InstrumentedQueuePool
+from tm.system.model.pool import get_pool_options
+from tm.system.model.pool import instrument_engine
+from tm.system.model.replica import RoutingSession
+
 # import or define all models here to ensure they are attached to the
 # Base.metadata prior to any initialization routines
 
@@ -28,18 +35,50 @@ import zope.sqlalchemy
 # configure_mappers()
 
 
-def get_engine(settings, prefix='sqlalchemy.', isolation_level='SERIALIZABLE'):
+def get_engine(settings, prefix='sqlalchemy.', isolation_level=None):
+    """Create the database engine.
+
+    Transactions run as ``SERIALIZABLE`` unless ``tm.db.isolation_level`` or ``isolation_level`` says otherwise.
+    Views can pick their own level, see :py:mod:`tm.system.model.isolation`.
+
+    The pool is sized after ``tm.db.server_threads``, see :py:mod:`tm.system.model.pool`.
+    """
+    if isolation_level is None:
+        isolation_level = settings.get('tm.db.isolation_level', 'SERIALIZABLE').replace('_', ' ').upper()
+
+    # Nested keys like sqlalchemy.replica.url belong to other engines
+    settings = {key: value for key, value in settings.items() if not (key.startswith(prefix) and '.' in key[len(prefix):])}
+
     return engine_from_config(settings, prefix,
                               connect_args={"options": "-c timezone=utc"},
                               client_encoding='utf8',
                               isolation_level=isolation_level,
+                              poolclass=InstrumentedQueuePool,
+                              **get_pool_options(settings, prefix),
                               # json_serializer=json_serializer
                               )
 
 
-def get_session_factory(engine):
-    factory = sessionmaker()
-    factory.configure(bind=engine)
+def get_replica_engine(settings, prefix='sqlalchemy.replica.'):
+    """Create the read replica engine or return ``None`` if no replica is configured.
+
+    Hot standbys refuse ``SERIALIZABLE``, so replica transactions run as ``REPEATABLE READ`` unless
+    ``tm.db.replica_isolation_level`` says otherwise.
+    """
+    if not settings.get(prefix + 'url'):
+        return None
+    isolation_level = settings.get('tm.db.replica_isolation_level', 'REPEATABLE READ').replace('_', ' ').upper()
+    return get_engine(settings, prefix, isolation_level=isolation_level)
+
+
+def get_session_factory(engine, replica_engine=None):
+    """Create a session factory.
+
+    :param engine: The primary database engine.
+    :param replica_engine: Optional read replica, see :py:mod:`tm.system.model.replica`.
+    """
+    factory = sessionmaker(class_=RoutingSession)
+    factory.configure(bind=engine, replica_bind=replica_engine)
     return factory
 
 
@@ -87,7 +126,15 @@ def includeme(config):
     # use pyramid_retry to retry a request when transient exceptions occur
     config.include('pyramid_retry')
 
-    session_factory = get_session_factory(get_engine(settings))
+    engine = get_engine(settings)
+    replica_engine = get_replica_engine(settings)
+
+    metrics = get_metrics(config.registry)
+    instrument_engine(engine, metrics, 'primary')
+    if replica_engine is not None:
+        instrument_engine(replica_engine, metrics, 'replica')
+
+    session_factory = get_session_factory(engine, replica_engine)
     config.registry['dbsession_factory'] = session_factory
 
     # make request.dbsession available for use in Pyramid
@@ -0,0 +1,115 @@
+"""Connection pool sizing and health metrics.
+
+The pool is sized after the number of WSGI server threads, because each request thread holds at most one connection per engine:
+
+* ``tm.db.server_threads``: threads of the WSGI server, keep in sync with ``threads`` of ``[server:main]``. Defaults to 4, the waitress default.
+
+* ``sqlalchemy.pool_size``: defaults to the number of server threads
+
+* ``sqlalchemy.max_overflow``: defaults to half of the server threads, room for console scripts and background jobs sharing the process
+
+* ``sqlalchemy.pool_recycle``: defaults to 1800 seconds, so that idle connections are not silently dropped by firewalls
+
+* ``sqlalchemy.pool_pre_ping``: defaults to false, set true if the database restarts often and stale connections show up as errors
+
+The same keys under ``sqlalchemy.replica.`` configure the replica pool.
+
+Pool health is exported through :py:class:`tm.system.core.interfaces.IMetrics`, labelled with the engine name:
+
+* ``db.pool.checkout_wait_seconds``: time spent waiting for a connection from the pool
+
+* ``db.pool.checkout_timeouts``: checkouts which gave up after ``pool_timeout``
+
+* ``db.pool.connects``: new database connections opened
+
+* ``db.pool.invalidations``: connections thrown away after errors or failed pre-pings
+
+* ``db.pool.checked_out``, ``db.pool.overflow``, ``db.pool.size``: gauges
+"""
+# Standard Library
+import time
+
+# Pyramid
+from pyramid.settings import asbool
+
+# SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+# System
+from tm.system.core.interfaces import IMetrics
+
+
+#: Waitress default
+DEFAULT_SERVER_THREADS = 4
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool reporting how long checkouts wait for a free connection."""
+
+    #: Callable ``observer(seconds, timed_out)`` or ``None``
+    checkout_observer = None
+
+    def _do_get(self):
+        if self.checkout_observer is None:
+            return super()._do_get()
+
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.checkout_observer(time.perf_counter() - start, True)
+            raise
+        self.checkout_observer(time.perf_counter() - start, False)
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkout_observer = self.checkout_observer
+        return pool
+
+
+def get_pool_options(settings: dict, prefix: str = "sqlalchemy.") -> dict:
+    """Work out pool arguments for ``engine_from_config`` which are not set explicitly under ``prefix``."""
+    threads = int(settings.get("tm.db.server_threads", DEFAULT_SERVER_THREADS))
+    defaults = {
+        "pool_size": threads,
+        "max_overflow": max(threads // 2, 1),
+        "pool_recycle": 1800,
+        "pool_pre_ping": False,
+    }
+    options = {key: value for key, value in defaults.items() if prefix + key not in settings}
+
+    # engine_from_config does not coerce this one
+    if prefix + "pool_pre_ping" in settings:
+        options["pool_pre_ping"] = asbool(settings[prefix + "pool_pre_ping"])
+
+    return options
+
+
+def instrument_engine(engine: Engine, metrics: IMetrics, name: str):
+    """Export pool events of an engine created by :py:func:`tm.system.model.meta.get_engine`.
+
+    :param name: Label of the engine in metrics, like ``primary`` or ``replica``.
+    """
+
+    def observe_checkout(seconds: float, timed_out: bool):
+        metrics.observe("db.pool.checkout_wait_seconds", seconds, engine=name)
+        if timed_out:
+            metrics.incr("db.pool.checkout_timeouts", engine=name)
+
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.checkout_observer = observe_checkout
+
+    event.listen(engine, "connect", lambda dbapi_connection, connection_record: metrics.incr("db.pool.connects", engine=name))
+    event.listen(engine, "invalidate", lambda dbapi_connection, connection_record, exception: metrics.incr("db.pool.invalidations", engine=name))
+
+    def pool():
+        # Engine.dispose() replaces the pool, so always look at the current one
+        return engine.pool
+
+    metrics.gauge("db.pool.checked_out", lambda: pool().checkedout(), engine=name)
+    metrics.gauge("db.pool.size", lambda: pool().size(), engine=name)
+    metrics.gauge("db.pool.overflow", lambda: max(pool().overflow(), 0) if isinstance(pool(), QueuePool) else 0, engine=name)
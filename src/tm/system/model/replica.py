@@ -0,0 +1,74 @@
+"""Route reads to a read replica.
+
+Configure the replica with the same keys as the primary database under ``sqlalchemy.replica.``::
+
+    sqlalchemy.url = postgresql://db-primary/tm
+    sqlalchemy.replica.url = postgresql://db-replica/tm
+
+The session sends statements to the replica when
+
+* the view is declared ``read_only=True``, see :py:mod:`tm.system.model.isolation`, or
+
+* the code asks for it with :py:func:`replica_reads`, e.g. the user lookup of authentication
+
+and nothing has been written in the session yet. Flushes and ``INSERT``, ``UPDATE`` and ``DELETE`` statements always go to the primary. After the first write the session sticks to the primary, so that the rest of the request reads its own writes.
+
+Without ``sqlalchemy.replica.url`` everything goes to the primary.
+"""
+# Standard Library
+import contextlib
+
+# SQLAlchemy
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+
+#: Session.info key set when the session has written to the primary
+STICKY = "tm.db.sticky"
+
+#: Session.info key set when reads may go to the replica
+REPLICA_READS = "tm.db.replica_reads"
+
+
+class RoutingSession(Session):
+    """Session choosing between the primary and the replica engine per statement."""
+
+    def __init__(self, replica_bind=None, **kwargs):
+        """Initialize RoutingSession.
+
+        :param replica_bind: Engine of the read replica. If ``None`` all statements go to ``bind``.
+        """
+        super().__init__(**kwargs)
+        self.replica_bind = replica_bind
+
+    def reads_from_replica(self) -> bool:
+        """Check if the next read would go to the replica."""
+        if self.replica_bind is None or self.info.get(STICKY):
+            return False
+
+        _, read_only = self.info.get("tm.isolation", (None, False))
+        return bool(read_only or self.info.get(REPLICA_READS))
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info[STICKY] = True
+        elif self.reads_from_replica():
+            return self.replica_bind
+        return super().get_bind(mapper=mapper, clause=clause)
+
+
+@contextlib.contextmanager
+def replica_reads(session: Session):
+    """Let reads in the block go to the replica, unless the session has already written something.
+
+    Example::
+
+        with replica_reads(request.dbsession):
+            user = dbsession.query(User).get(user_id)
+    """
+    previous = session.info.get(REPLICA_READS, False)
+    session.info[REPLICA_READS] = True
+    try:
+        yield session
+    finally:
+        session.info[REPLICA_READS] = previous
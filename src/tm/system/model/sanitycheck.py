@@ -1,9 +1,15 @@
 # Standard Library
+import hashlib
+import json
 import logging
+import os
+import typing as t
 
 # SQLAlchemy
 import sqlalchemy
+from sqlalchemy import bindparam
 from sqlalchemy import inspect
+from sqlalchemy import text
 from sqlalchemy.ext.declarative.clsregistry import _ModuleMarker
 from sqlalchemy.orm import RelationshipProperty
 from sqlalchemy.orm import Session
@@ -12,7 +18,67 @@ from sqlalchemy.orm import Session
 logger = logging.getLogger(__name__)
 
 
-def is_sane_database(Base, session: Session):
+def get_database_schema(connection, table_names: t.Iterable[str]) -> dict:
+    """Read the live columns of the given tables and the alembic revision with two cheap catalog queries.
+
+    :return: Column names by table name, and the alembic revision if the database has one
+    """
+    table_names = sorted(set(table_names) | {"alembic_version"})
+    query = text(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name IN :table_names"
+    ).bindparams(bindparam("table_names", expanding=True))
+
+    columns = {}
+    for table_name, column_name in connection.execute(query, table_names=table_names):
+        columns.setdefault(table_name, []).append(column_name)
+
+    revision = None
+    if columns.pop("alembic_version", None):
+        revision = [row[0] for row in connection.execute(text("SELECT version_num FROM alembic_version"))]
+
+    return {"columns": {name: sorted(names) for name, names in columns.items()}, "alembic_revision": revision}
+
+
+def model_schema_fingerprint(Base, connection) -> str:
+    """Hash the tables and columns declared by the models together with the live schema of the database they are checked against.
+
+    Migrations and manual DDL change the live columns or the alembic revision, and with them the fingerprint, so a stored fingerprint never vouches for a database which has changed since the check. The password is left out of the database URL.
+
+    :param Base: Declarative Base for SQLAlchemy models
+
+    :param connection: Connection to the checked database
+
+    :return: Hex digest
+    """
+    url = connection.engine.url
+    tables = Base.metadata.tables
+    schema = {
+        "database": [url.drivername, url.host, url.port, url.database],
+        "tables": {name: sorted(c.name for c in table.columns) for name, table in tables.items()},
+        "live": get_database_schema(connection, (table.name for table in tables.values())),
+    }
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def read_fingerprint(cache_file: str) -> t.Optional[str]:
+    """Read the fingerprint stored by a previous successful check."""
+    try:
+        with open(cache_file, "rt") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_fingerprint(cache_file: str, fingerprint: str):
+    """Atomically store the fingerprint of a successful check."""
+    tmp = "{}.{}.tmp".format(cache_file, os.getpid())
+    with open(tmp, "wt") as f:
+        f.write(fingerprint)
+    os.replace(tmp, cache_file)
+
+
+def is_sane_database(Base, session: Session, cache_file: t.Optional[str] = None):
     """Check whether the current database matches the models declared in model base.
 
     Currently we check that all tables exist with all columns. What is not checked
@@ -21,14 +87,26 @@ def is_sane_database(Base, session: Session):
 
     * Relationships are not verified at all (TODO)
 
+    Each table is reflected once, no matter how many models or columns refer to it.
+
     :param Base: Declarative Base for SQLAlchemy models to check
 
     :param session: SQLAlchemy session bound to an engine
 
+    :param cache_file: Optional path where a fingerprint of the model and database schemas is stored after a successful check. If neither has changed since, the reflection is skipped altogether.
+
     :return: True if all declared models have corresponding tables and columns.
     """
 
     engine = session.get_bind()
+
+    fingerprint = None
+    if cache_file:
+        fingerprint = model_schema_fingerprint(Base, session.connection())
+        if read_fingerprint(cache_file) == fingerprint:
+            logger.info("Database schema fingerprint unchanged, skipping sanity check")
+            return True
+
     iengine = inspect(engine)
 
     errors = False
@@ -36,6 +114,17 @@ def is_sane_database(Base, session: Session):
     # Get tables currently in the database
     tables = iengine.get_table_names()
 
+    # Reflected column names by table name, None if the table does not exist
+    reflected = {}
+
+    def get_columns(table_name: str) -> t.Optional[t.Set[str]]:
+        if table_name not in reflected:
+            try:
+                reflected[table_name] = {c["name"] for c in iengine.get_columns(table_name)}
+            except sqlalchemy.exc.NoSuchTableError:
+                reflected[table_name] = None
+        return reflected[table_name]
+
     # Go through all SQLAlchemy models
     for name, klass in Base._decl_class_registry.items():
 
@@ -72,9 +161,8 @@ def is_sane_database(Base, session: Session):
                 table_name = column.table.name
 
                 # Get columns from the actual table the ORM referes to
-                try:
-                    columns = [c["name"] for c in iengine.get_columns(table_name)]
-                except sqlalchemy.exc.NoSuchTableError:
+                columns = get_columns(table_name)
+                if columns is None:
                     logger.error("Model %s declares table %s which does not exist in database %s", klass, table_name, engine)
                     errors = True
                     break
@@ -84,4 +172,7 @@ def is_sane_database(Base, session: Session):
                     logger.error("Model %s declares column %s which does not exist in database %s", klass, column.key, engine)
                     errors = True
 
+    if cache_file and not errors:
+        write_fingerprint(cache_file, fingerprint)
+
     return not errors
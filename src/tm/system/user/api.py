@@ -8,8 +8,10 @@
 """
 # Standard Library
 import logging
+from itertools import islice
 
 # Pyramid
+from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.httpexceptions import HTTPUnauthorized, HTTPUnprocessableEntity
 from pyramid.httpexceptions import HTTPNotFound
 from pyramid.response import Response
@@ -17,6 +19,7 @@ from pyramid.security import Allow, Everyone
 from pyramid.view import view_config
 
 # System
+from tm.system.core.throttle import check_throttle
 from tm.system.user.userregistry import UserRegistry
 from tm.system.user.interfaces import AuthenticationFailure
 from tm.system.user.interfaces import CannotResetPasswordException
@@ -24,12 +27,15 @@ from tm.system.http import Request
 from tm.system.user.schemas import LoginSchema, AuthorizationCodeSchema, SignUpSchema, ActivateSchema
 from tm.system.user.schemas import ForgotPasswordSchema
 from tm.system.user.schemas import ResetPasswordSchema
+from tm.system.user.schemas import UsersQuerySchema
 from tm.system.user.utils import get_oauth_login_service
 from tm.system.user.services.login import LoginService
 from tm.system.user.services.signup import SignUpService
 from tm.system.user.services.credentialactivity import CredentialService
+from tm.utils.jsonstream import iter_json_array
 
 # Schema validations
+import colander as c
 from marshmallow import ValidationError
 
 logger = logging.getLogger(__name__)
@@ -54,11 +60,33 @@ from cornice import Service
 from cornice.validators import colander_body_validator as body_validator
 from cornice.validators import colander_querystring_validator as querystring_validator
 
-@view_config(route_name="users", request_method="GET", permission="authenticated")
+@view_config(route_name="users", request_method="GET", permission="authenticated", read_only=True)
 def users(request: Request) -> Response:
+    """List full names of users as a JSON array, in id order.
+
+    Without ``limit`` all users are streamed. With ``limit`` at most that many users after the user id ``after`` are returned, and a ``Link`` header points to the next page if there is one.
+    """
+    try:
+        params = UsersQuerySchema().deserialize(request.GET.mixed())
+    except c.Invalid as e:
+        raise HTTPBadRequest(json=e.asdict())
+
     user_registry = UserRegistry(request)
-    result = list(map(lambda u: u.full_name, user_registry.all()))
-    return Response(json=result)
+    after, limit = params["after"], params["limit"]
+
+    if limit is None:
+        rows = user_registry.iter_full_names(after)
+        return Response(app_iter=iter_json_array(full_name for id, full_name in rows), content_type="application/json")
+
+    # One extra row tells if there is a next page
+    names = user_registry.iter_full_names(after, chunk_size=limit + 1)
+    rows = list(islice(names, limit + 1))
+    names.close()
+    response = Response(app_iter=iter_json_array(full_name for id, full_name in rows[:limit]), content_type="application/json")
+    if len(rows) > limit:
+        next_url = request.current_route_url(_query={"after": rows[limit - 1][0], "limit": limit})
+        response.headers["Link"] = '<{}>; rel="next"'.format(next_url)
+    return response
 
 
 account = Service(name="account",
@@ -84,6 +112,7 @@ def signup(request: Request) -> Response:
     :param request: Pyramid request.
     :return: Pyramid Response
     """
+    check_throttle(request, "signup", request.validated.get("email"))
     signup_service = SignUpService(request)
     return signup_service.sign_up(user_data=request.validated)
 
@@ -123,8 +152,9 @@ def forgot_password(request: Request) -> Response:
     :param request: Pyramid request.
     :return: Response
     """
-    credential_activity_service = CredentialService(request)
     email = request.validated["email"]
+    check_throttle(request, "forgot_password", email)
+    credential_activity_service = CredentialService(request)
     try:
         return credential_activity_service.create_forgot_password_request(email)
     except CannotResetPasswordException as e:
@@ -205,6 +235,7 @@ def login(request: Request) -> Response:
     """
     username = request.validated["username"]
     password = request.validated["password"]
+    check_throttle(request, "login", username)
     login_service = LoginService(request)
 
     try:
@@ -0,0 +1,106 @@
+"""Storage of OAuth authorization codes.
+
+After a social login the user is redirected to the UI with an authorization code, which the UI exchanges for an access token within seconds. By default the codes are kept in the database, so any web process can exchange a code issued by another.
+
+Keeping the codes in process memory with :py:class:`MemoryAuthorizationCodeStore` saves the database writes of issuing and consuming them, but only works when the code is exchanged with the same process which issued it, like with a single multi-threaded waitress process.
+"""
+# Standard Library
+from datetime import timedelta
+
+# Pyramid
+from pyramid.path import DottedNameResolver
+from pyramid.registry import Registry
+from zope.interface import implementer
+
+# SQLAlchemy
+from sqlalchemy.orm import joinedload
+
+# System
+from tm.system.http import Request
+from tm.system.user.interfaces import IAuthorizationCodeStore
+from tm.system.user.models import AuthorizationCode
+from tm.system.user.models import User
+from tm.utils.cache import LRUCache
+from tm.utils.crypt import generate_random_string
+from tm.utils.time import now
+
+
+@implementer(IAuthorizationCodeStore)
+class MemoryAuthorizationCodeStore:
+    """Keep authorization codes in process memory."""
+
+    def __init__(self, max_size: int = 10000):
+        """Initialize MemoryAuthorizationCodeStore.
+
+        :param max_size: Maximum number of outstanding codes. The oldest codes are dropped first.
+        """
+        self.cache = LRUCache(max_size=max_size)
+
+    def create(self, request: Request, user: User, expires_in: int) -> str:
+        code = generate_random_string(32)
+        self.cache.set(code, user.id, ttl=expires_in)
+        return code
+
+    def consume(self, request: Request, user_id: int, code: str) -> bool:
+        # Used up even if presented with the wrong user id
+        owner = self.cache.pop(code)
+        return owner is not None and str(owner) == str(user_id)
+
+
+@implementer(IAuthorizationCodeStore)
+class SQLAuthorizationCodeStore:
+    """Keep authorization codes in the ``user_authorization_code`` table, shared by all processes using the database."""
+
+    def create(self, request: Request, user: User, expires_in: int) -> str:
+        auth_code = AuthorizationCode()
+        auth_code.expires_at = now() + timedelta(seconds=expires_in)
+        request.dbsession.add(auth_code)
+        request.dbsession.flush()
+        user.authorization_code = auth_code
+
+        assert user.authorization_code.code, "Could not generate the authorization code"
+        return auth_code.code
+
+    def consume(self, request: Request, user_id: int, code: str) -> bool:
+        dbsession = request.dbsession
+        result = dbsession.query(User, AuthorizationCode). \
+            options(joinedload(User.groups)). \
+            filter(User.authorization_code_id == AuthorizationCode.id). \
+            filter(User.id == user_id). \
+            filter(AuthorizationCode.code == code).one_or_none()
+        if not result:
+            return False
+
+        user, auth_code = result
+        dbsession.delete(auth_code)  # consume the auth code
+        return not auth_code.is_expired()
+
+
+def memory_authorization_code_store_factory(registry: Registry) -> IAuthorizationCodeStore:
+    """Build the in-process store from ``tm.oauth.code_store.*`` settings, for single process deployments."""
+    max_size = int(registry.settings.get("tm.oauth.code_store.max_size", 10000))
+    return MemoryAuthorizationCodeStore(max_size=max_size)
+
+
+def sql_authorization_code_store_factory(registry: Registry) -> IAuthorizationCodeStore:
+    """Build the default, database backed store."""
+    return SQLAuthorizationCodeStore()
+
+
+def get_authorization_code_store(registry: Registry) -> IAuthorizationCodeStore:
+    """Get the configured authorization code store."""
+    return registry.getUtility(IAuthorizationCodeStore)
+
+
+def includeme(config):
+    """Register the authorization code store.
+
+    Settings:
+
+    * ``tm.oauth.code_store.factory``: dotted name of a callable ``factory(registry) -> IAuthorizationCodeStore``. Defaults to the database backed store. Single process deployments can use ``tm.system.user.authcodes.memory_authorization_code_store_factory`` to keep the codes in memory.
+
+    * ``tm.oauth.code_store.max_size``: in-process store sizing
+    """
+    factory = config.registry.settings.get("tm.oauth.code_store.factory")
+    factory = DottedNameResolver().resolve(factory) if factory else sql_authorization_code_store_factory
+    config.registry.registerUtility(factory(config.registry), IAuthorizationCodeStore)
@@ -0,0 +1,254 @@
+"""Cache user rows and group memberships between requests.
+
+Authenticated requests resolve ``request.user`` from the user id in the JWT. Instead of loading the row from the database on every request we keep a snapshot of the user columns, except the password hash, and attach it to the request session with ``Session.merge(load=False)``, which does not emit SQL.
+
+Snapshots are invalidated on login, on :py:class:`tm.system.user.events.UserAuthSensitiveOperation` and whenever a flush touches a user row.
+
+Group memberships are cached as sets of group names and invalidated whenever a flush changes ``Group.users``, ``User.groups`` or ``UserGroup`` rows.
+
+Invalidation only sees ORM flushes in the same process. Changes made by other processes, or with Core and bulk statements which bypass the flush, are picked up when the snapshot expires after ``tm.user_cache.ttl_seconds`` (``tm.group_cache.ttl_seconds`` for groups). Until then e.g. a user disabled by another process stays logged in. Code changing users with bulk statements should call :py:func:`invalidate_users`, and deployments running several processes should keep the TTLs short or plug in a shared cache.
+"""
+# Standard Library
+import copy
+import logging
+import typing as t
+
+# Pyramid
+from pyramid.registry import Registry
+from pyramid.settings import asbool
+from pyramid.path import DottedNameResolver
+from zope.interface import implementer
+
+# SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import PASSIVE_NO_INITIALIZE
+from sqlalchemy.orm.attributes import get_history
+
+# System
+from tm.system.user.interfaces import IGroupMembershipCache
+from tm.system.user.interfaces import IUserCache
+from tm.system.user.models import Group
+from tm.system.user.models import User
+from tm.system.user.models import UserGroup
+from tm.utils.cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+
+@implementer(IUserCache)
+class LRUUserCache:
+    """Keep user snapshots in process memory."""
+
+    def __init__(self, max_size: int = 10000, ttl: t.Optional[float] = 60):
+        """Initialize LRUUserCache.
+
+        :param max_size: Maximum number of users to remember.
+        :param ttl: Seconds before a snapshot is reloaded from the database even if nothing invalidated it.
+        """
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get(self, user_id: int) -> t.Optional[dict]:
+        return self.cache.get(user_id)
+
+    def set(self, user_id: int, state: dict):
+        self.cache.set(user_id, state)
+
+    def invalidate(self, user_id: int):
+        self.cache.invalidate(user_id)
+
+
+@implementer(IGroupMembershipCache)
+class LRUGroupMembershipCache:
+    """Keep group names of users in process memory."""
+
+    def __init__(self, max_size: int = 10000, ttl: t.Optional[float] = 300):
+        """Initialize LRUGroupMembershipCache.
+
+        :param max_size: Maximum number of users to remember.
+        :param ttl: Seconds before membership is reloaded from the database even if nothing invalidated it.
+        """
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get(self, user_id: int) -> t.Optional[t.FrozenSet[str]]:
+        return self.cache.get(user_id)
+
+    def set(self, user_id: int, group_names: t.FrozenSet[str]):
+        self.cache.set(user_id, frozenset(group_names))
+
+    def invalidate(self, user_id: int):
+        self.cache.invalidate(user_id)
+
+    def clear(self):
+        self.cache.clear()
+
+
+#: User attributes never put in a snapshot. Password hashes must not end up in a shared cache backend, and the login paths load the row from the database anyway.
+UNCACHED_ATTRIBUTES = frozenset(["hashed_password"])
+
+
+def snapshot_user(user: User) -> dict:
+    """Capture column values of a user so that it can be rebuilt without a query."""
+    mapper = inspect(user).mapper
+    return copy.deepcopy({attr.key: getattr(user, attr.key) for attr in mapper.column_attrs if attr.key not in UNCACHED_ATTRIBUTES})
+
+
+def restore_user(dbsession: Session, user_class: t.Type[User], state: dict) -> User:
+    """Attach a user built from a snapshot to the session without touching the database.
+
+    Relationships like ``groups``, and columns left out of the snapshot like ``hashed_password``, still load on access.
+    """
+    user = user_class(**copy.deepcopy(state))
+    make_transient_to_detached(user)
+    return dbsession.merge(user, load=False)
+
+
+def get_user_cache(registry: Registry) -> t.Optional[IUserCache]:
+    """Get the configured user cache or ``None`` if caching is disabled."""
+    return registry.queryUtility(IUserCache)
+
+
+def get_group_membership_cache(registry: Registry) -> t.Optional[IGroupMembershipCache]:
+    """Get the configured group membership cache or ``None`` if caching is disabled."""
+    return registry.queryUtility(IGroupMembershipCache)
+
+
+def invalidate_users(registry: Registry, user_ids: t.Iterable[int]):
+    """Drop cached users and their group memberships after changing them with statements which bypass the ORM flush."""
+    caches = [cache for cache in (get_user_cache(registry), get_group_membership_cache(registry)) if cache is not None]
+    for user_id in user_ids:
+        for cache in caches:
+            cache.invalidate(user_id)
+
+
+def lru_user_cache_factory(registry: Registry) -> IUserCache:
+    """Build the default in-process cache from ``tm.user_cache.*`` settings."""
+    settings = registry.settings
+    max_size = int(settings.get("tm.user_cache.max_size", 10000))
+    ttl = float(settings.get("tm.user_cache.ttl_seconds", 60))
+    return LRUUserCache(max_size=max_size, ttl=ttl)
+
+
+def lru_group_membership_cache_factory(registry: Registry) -> IGroupMembershipCache:
+    """Build the default in-process membership cache from ``tm.group_cache.*`` settings."""
+    settings = registry.settings
+    max_size = int(settings.get("tm.group_cache.max_size", 10000))
+    ttl = float(settings.get("tm.group_cache.ttl_seconds", 300))
+    return LRUGroupMembershipCache(max_size=max_size, ttl=ttl)
+
+
+def watch_user_changes(session_factory, cache: IUserCache):
+    """Invalidate cached users whenever a session flushes changes to them.
+
+    Ids are invalidated again after the commit, so that a concurrent request cannot re-cache the old row between our flush and commit.
+    """
+
+    def after_flush(session, flush_context):
+        changed = session.info.setdefault("tm.user_cache.changed", set())
+        for obj in session.dirty | session.deleted:
+            if isinstance(obj, User) and obj.id is not None:
+                changed.add(obj.id)
+                cache.invalidate(obj.id)
+
+    def after_commit(session):
+        for user_id in session.info.pop("tm.user_cache.changed", ()):
+            cache.invalidate(user_id)
+
+    def after_rollback(session):
+        session.info.pop("tm.user_cache.changed", None)
+
+    event.listen(session_factory, "after_flush", after_flush)
+    event.listen(session_factory, "after_commit", after_commit)
+    event.listen(session_factory, "after_soft_rollback", lambda session, previous_transaction: after_rollback(session))
+
+
+def _membership_changes(session) -> t.Tuple[t.Set[int], bool]:
+    """Find users whose group membership the pending flush changes.
+
+    :return: Tuple (affected user ids, whether all memberships must be dropped)
+    """
+    user_ids = set()
+    clear_all = False
+
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, UserGroup):
+            history = get_history(obj, "user_id", passive=PASSIVE_NO_INITIALIZE)
+            user_ids.update(uid for uid in history.sum() if uid is not None)
+        elif isinstance(obj, Group):
+            if obj in session.deleted or get_history(obj, "name", passive=PASSIVE_NO_INITIALIZE).has_changes():
+                # We cannot tell whose membership this touches without loading the group
+                clear_all = True
+            history = get_history(obj, "users", passive=PASSIVE_NO_INITIALIZE)
+            user_ids.update(u.id for u in list(history.added or ()) + list(history.deleted or ()))
+        elif isinstance(obj, User):
+            if get_history(obj, "groups", passive=PASSIVE_NO_INITIALIZE).has_changes() or obj in session.deleted:
+                user_ids.add(obj.id)
+
+    user_ids.discard(None)
+    return user_ids, clear_all
+
+
+def watch_group_membership_changes(session_factory, cache: IGroupMembershipCache):
+    """Invalidate cached memberships whenever a session flushes changes to them.
+
+    Like :py:func:`watch_user_changes` ids are invalidated again after the commit.
+    """
+
+    def after_flush(session, flush_context):
+        user_ids, clear_all = _membership_changes(session)
+        changed = session.info.setdefault("tm.group_cache.changed", set())
+        changed.update(user_ids)
+        if clear_all:
+            session.info["tm.group_cache.clear"] = True
+            cache.clear()
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+
+    def after_commit(session):
+        if session.info.pop("tm.group_cache.clear", False):
+            cache.clear()
+        for user_id in session.info.pop("tm.group_cache.changed", ()):
+            cache.invalidate(user_id)
+
+    def after_rollback(session):
+        session.info.pop("tm.group_cache.clear", None)
+        session.info.pop("tm.group_cache.changed", None)
+
+    event.listen(session_factory, "after_flush", after_flush)
+    event.listen(session_factory, "after_commit", after_commit)
+    event.listen(session_factory, "after_soft_rollback", lambda session, previous_transaction: after_rollback(session))
+
+
+def includeme(config):
+    """Register the user and group membership caches.
+
+    Settings:
+
+    * ``tm.user_cache.enabled``: set false to always load users from the database
+
+    * ``tm.user_cache.factory``: dotted name of a callable ``factory(registry) -> IUserCache``, e.g. for a shared cache backend. Defaults to the in-process LRU cache.
+
+    * ``tm.user_cache.max_size``, ``tm.user_cache.ttl_seconds``: in-process cache sizing. The TTL bounds how long changes made by other processes or by bulk statements go unnoticed, see the module documentation.
+
+    * ``tm.group_cache.enabled``, ``tm.group_cache.factory``, ``tm.group_cache.max_size``, ``tm.group_cache.ttl_seconds``: the same for group memberships
+    """
+    settings = config.registry.settings
+    resolver = DottedNameResolver()
+    session_factory = config.registry["dbsession_factory"]
+
+    if asbool(settings.get("tm.user_cache.enabled", True)):
+        factory = settings.get("tm.user_cache.factory")
+        factory = resolver.resolve(factory) if factory else lru_user_cache_factory
+        cache = factory(config.registry)
+        config.registry.registerUtility(cache, IUserCache)
+        watch_user_changes(session_factory, cache)
+
+    if asbool(settings.get("tm.group_cache.enabled", True)):
+        factory = settings.get("tm.group_cache.factory")
+        factory = resolver.resolve(factory) if factory else lru_group_membership_cache_factory
+        cache = factory(config.registry)
+        config.registry.registerUtility(cache, IGroupMembershipCache)
+        watch_group_membership_changes(session_factory, cache)
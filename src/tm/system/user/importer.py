@@ -0,0 +1,333 @@
+"""Bulk import of user accounts, like when migrating from a legacy system.
+
+Creating users one by one with :py:func:`tm.scripts.createuser.create` costs a lookup query, an Argon 2 hash in the calling thread and an insert per user. The importer instead works through the input in chunks:
+
+#. records with a missing or malformed email, and emails or usernames already seen earlier in the input, are skipped,
+
+#. existing users are looked up for the whole chunk with one query on ``lower(email)``,
+
+#. the remaining plain text passwords are hashed in a process pool,
+
+#. and the chunk is inserted in one transaction with PostgreSQL ``COPY``, or with executemany on other databases.
+
+Input records are dicts with ``email`` and optional ``username``, ``password``, ``hashed_password`` and ``full_name``, read from CSV with a header row or from JSON lines. ``password`` is always plain text and gets hashed. ``hashed_password`` is stored as is and must be an Argon 2 hash, as other schemes like bcrypt or PBKDF2 cannot be verified at login; such records are counted invalid. If a record has both, the hash is used.
+
+The importer only inserts users whose email and username are not taken, so no existing user row changes and the user cache needs no invalidation, see :py:mod:`tm.system.user.cache`.
+"""
+# Standard Library
+import concurrent.futures
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import time
+import typing as t
+import uuid
+
+import argon2
+
+# SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import IntegrityError
+
+# System
+from tm.system.user.models import DEFAULT_USER_DATA
+from tm.system.user.models import User
+from tm.utils.time import now
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Prefix of the Argon 2 hashes we accept as already hashed passwords
+ARGON2_PREFIX = "$argon2"
+
+#: Input formats by file name extension
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+#: Columns written by the importer, in ``COPY`` order
+COLUMNS = (
+    "uuid",
+    "email",
+    "username",
+    "password",
+    "created_at",
+    "activated_at",
+    "enabled",
+    "user_data",
+    "last_auth_sensitive_operation_at",
+)
+
+
+def is_password_hash(value: str) -> bool:
+    """Is this an Argon 2 hash instead of a plain text password."""
+    return value.startswith(ARGON2_PREFIX)
+
+
+def guess_format(path: str) -> str:
+    """Input format by file name, CSV unless the extension says otherwise."""
+    return FORMATS.get(os.path.splitext(path)[1].lower(), "csv")
+
+
+def read_records(stream: t.TextIO, input_format: str = "csv") -> t.Iterator[dict]:
+    """Read user records from a CSV file with a header row or from JSON lines.
+
+    :param input_format: ``csv`` or ``jsonl``
+    """
+    if input_format == "csv":
+        yield from csv.DictReader(stream)
+    elif input_format == "jsonl":
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        raise ValueError("Unknown input format: {}".format(input_format))
+
+
+def chunked(iterable: t.Iterable, size: int) -> t.Iterator[list]:
+    """Split an iterable to lists of ``size`` items, consuming it lazily."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportStats:
+    """Counters of an import run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.inserted = 0
+        self.existing = 0
+        self.duplicate = 0
+        self.invalid = 0
+
+    @property
+    def rate(self) -> float:
+        """Records processed per second."""
+        return self.read / max(time.perf_counter() - self.started, 1e-9)
+
+    def __str__(self):
+        return "{} read, {} inserted, {} existing, {} duplicate, {} invalid, {:.0f} records/s".format(
+            self.read, self.inserted, self.existing, self.duplicate, self.invalid, self.rate)
+
+
+#: Argon 2 hasher of a worker process, set by :py:func:`_init_worker`
+_worker_hasher = None
+
+
+def _init_worker(hasher: argon2.PasswordHasher):
+    global _worker_hasher
+    _worker_hasher = hasher
+
+
+def _hash_passwords(passwords: t.List[str]) -> t.List[str]:
+    """Hash a batch of passwords in a worker process."""
+    return [_worker_hasher.hash(password) for password in passwords]
+
+
+class UserImporter:
+    """Insert users in bulk."""
+
+    def __init__(self, engine: Engine, hasher: t.Optional[argon2.PasswordHasher] = None, workers: t.Optional[int] = None, source: str = "import", activate: bool = True, dry_run: bool = False):
+        """Initialize UserImporter.
+
+        :param engine: Engine of the primary database.
+        :param hasher: Hash plain text passwords with these Argon 2 parameters. Defaults to the argon2_cffi defaults.
+        :param workers: Number of hashing processes. Defaults to the number of CPUs.
+        :param source: Stored as the ``registration_source`` of the imported users.
+        :param activate: Mark imported users activated, as if they had confirmed their email.
+        :param dry_run: Check and hash the records, but do not insert anything.
+        """
+        self.engine = engine
+        self.hasher = hasher or argon2.PasswordHasher()
+        self.workers = workers or os.cpu_count() or 1
+        self.source = source
+        self.activate = activate
+        self.dry_run = dry_run
+        self.stats = ImportStats()
+
+        #: Lowercased emails and usernames seen earlier in the input
+        self.seen_emails = set()
+        self.seen_usernames = set()
+        self.executor = None
+
+    def __enter__(self) -> "UserImporter":
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.hasher, ))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.executor.shutdown()
+        self.executor = None
+
+    def clean(self, records: t.Iterable[dict]) -> t.List[dict]:
+        """Drop invalid records and records repeating an email or a username seen earlier in the input."""
+        cleaned = []
+        for record in records:
+            self.stats.read += 1
+            email = (record.get("email") or "").strip()
+            if "@" not in email:
+                logger.warning("Skipping record %d without a valid email", self.stats.read)
+                self.stats.invalid += 1
+                continue
+
+            hashed_password = record.get("hashed_password") or None
+            if hashed_password and not is_password_hash(hashed_password):
+                logger.warning("Skipping record %d with a password hash which is not Argon 2", self.stats.read)
+                self.stats.invalid += 1
+                continue
+
+            username = (record.get("username") or "").strip() or None
+            if email.lower() in self.seen_emails or (username and username.lower() in self.seen_usernames):
+                self.stats.duplicate += 1
+                continue
+            self.seen_emails.add(email.lower())
+            if username:
+                self.seen_usernames.add(username.lower())
+
+            cleaned.append({
+                "email": email,
+                "username": username,
+                "password": None if hashed_password else record.get("password") or None,
+                "hashed_password": hashed_password,
+                "full_name": record.get("full_name") or None,
+            })
+        return cleaned
+
+    def drop_existing(self, connection, records: t.List[dict]) -> t.List[dict]:
+        """Drop records whose email or username is already taken in the database, with one query for each."""
+        users = User.__table__
+        emails = [record["email"].lower() for record in records]
+        usernames = [record["username"].lower() for record in records if record["username"]]
+
+        taken_emails = {row[0] for row in connection.execute(select([func.lower(users.c.email)]).where(func.lower(users.c.email).in_(emails)))}
+        taken_usernames = set()
+        if usernames:
+            taken_usernames = {row[0] for row in connection.execute(select([func.lower(users.c.username)]).where(func.lower(users.c.username).in_(usernames)))}
+
+        fresh = [
+            record for record in records
+            if record["email"].lower() not in taken_emails and (record["username"] or "").lower() not in taken_usernames
+        ]
+        self.stats.existing += len(records) - len(fresh)
+        return fresh
+
+    def hash_passwords(self, records: t.List[dict]):
+        """Hash plain text passwords to ``hashed_password``, spreading the work evenly over the worker processes."""
+        plain = [record for record in records if record["password"]]
+        if not plain:
+            return
+
+        batch_size = -(-len(plain) // self.workers)
+        batches = chunked((record["password"] for record in plain), batch_size)
+        hashes = itertools.chain.from_iterable(self.executor.map(_hash_passwords, batches))
+        for record, hashed in zip(plain, hashes):
+            record["hashed_password"] = hashed
+            record["password"] = None
+
+    def make_rows(self, records: t.List[dict]) -> t.List[dict]:
+        """Turn records into ``users`` table rows."""
+        timestamp = now()
+        rows = []
+        for record in records:
+            user_data = dict(DEFAULT_USER_DATA, full_name=record["full_name"], registration_source=self.source)
+            rows.append({
+                "uuid": uuid.uuid4(),
+                "email": record["email"],
+                "username": record["username"],
+                "password": record["hashed_password"],
+                "created_at": timestamp,
+                "activated_at": timestamp if self.activate else None,
+                "enabled": True,
+                "user_data": user_data,
+                "last_auth_sensitive_operation_at": timestamp,
+            })
+        return rows
+
+    def copy_rows(self, connection, rows: t.List[dict]):
+        """Insert rows with ``COPY`` when the driver supports it, executemany otherwise."""
+        raw = connection.connection
+        cursor = raw.cursor()
+        if not hasattr(cursor, "copy_expert"):
+            cursor.close()
+            connection.execute(User.__table__.insert(), rows)
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                row["uuid"],
+                row["email"],
+                row["username"],
+                row["password"],
+                row["created_at"].isoformat(),
+                row["activated_at"].isoformat() if row["activated_at"] else None,
+                "t",
+                json.dumps(row["user_data"]),
+                row["last_auth_sensitive_operation_at"].isoformat(),
+            ])
+        buffer.seek(0)
+        statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(User.__tablename__, ", ".join(COLUMNS))
+        dbapi = connection.dialect.dbapi
+        try:
+            cursor.copy_expert(statement, buffer)
+        except dbapi.Error as e:
+            # The raw cursor bypasses SQLAlchemy, wrap driver errors like it does, e.g. unique violations to IntegrityError
+            raise DBAPIError.instance(statement, None, e, dbapi.Error) from e
+        finally:
+            cursor.close()
+
+    def insert(self, records: t.List[dict]) -> int:
+        """Insert one chunk of cleaned records in its own transaction.
+
+        :return: Number of inserted users
+        """
+        with self.engine.connect() as connection:
+            # Unique indexes catch users created concurrently, serializable would only fail big chunks more often
+            connection = connection.execution_options(isolation_level="READ COMMITTED")
+            for attempt in range(2):
+                try:
+                    with connection.begin():
+                        fresh = self.drop_existing(connection, records)
+                        if not fresh:
+                            return 0
+                        if not self.dry_run:
+                            self.copy_rows(connection, self.make_rows(fresh))
+                        return len(fresh)
+                except IntegrityError:
+                    # Someone signed up with one of the emails after we looked, check again
+                    if attempt:
+                        raise
+                    self.stats.existing -= len(records) - len(fresh)
+                    logger.warning("Conflicting users were created during the import, retrying the chunk")
+
+    def run(self, records: t.Iterable[dict], chunk_size: int = 1000, report: t.Optional[t.Callable[[ImportStats], None]] = None) -> ImportStats:
+        """Import users.
+
+        :param records: Input records, consumed lazily
+        :param chunk_size: Records checked, hashed and inserted together
+        :param report: Called with the stats after every chunk
+        """
+        assert self.executor, "Use UserImporter as a context manager"
+        for chunk in chunked(records, chunk_size):
+            cleaned = self.clean(chunk)
+            if cleaned:
+                # Check before hashing, so that we do not hash passwords of users we already have
+                with self.engine.connect() as connection:
+                    cleaned = self.drop_existing(connection, cleaned)
+                self.hash_passwords(cleaned)
+            if cleaned:
+                self.stats.inserted += self.insert(cleaned)
+            if report:
+                report(self.stats)
+        return self.stats
@@ -2,6 +2,8 @@
 # Pyramid
 import zope
 from pyramid.httpexceptions import HTTPException
+from pyramid.httpexceptions import HTTPServiceUnavailable
+from pyramid.httpexceptions import HTTPTooManyRequests
 from pyramid.interfaces import IResponse
 from pyramid.interfaces import IRequest
 from zope.interface import Interface
@@ -152,6 +154,51 @@ class IUserRegistry(Interface):
     """
 
 
+class IUserCache(Interface):
+    """Cache user column snapshots keyed by user id between requests.
+
+    The default implementation lives in process memory. A shared backend (e.g. Redis) must store the snapshot dictionaries as is; values are plain Python types, UUIDs, datetimes and IP addresses.
+    """
+
+    def get(user_id: int) -> dict:
+        """Get the cached snapshot or ``None``."""
+
+    def set(user_id: int, state: dict):
+        """Store a snapshot."""
+
+    def invalidate(user_id: int):
+        """Forget a user, e.g. after the account has been modified."""
+
+
+class IGroupMembershipCache(Interface):
+    """Cache the names of the groups a user belongs to, keyed by user id."""
+
+    def get(user_id: int) -> frozenset:
+        """Get the cached group names or ``None``."""
+
+    def set(user_id: int, group_names: frozenset):
+        """Store group names."""
+
+    def invalidate(user_id: int):
+        """Forget membership of a user."""
+
+    def clear():
+        """Forget all memberships, e.g. after a group was renamed or deleted."""
+
+
+class IAuthorizationCodeStore(Interface):
+    """Keep OAuth authorization codes until they are exchanged for an access token.
+
+    Codes live for seconds and are used once. The default implementation lives in process memory, deployments running several web processes need a store shared between them.
+    """
+
+    def create(request: IRequest, user: IUser, expires_in: int) -> str:
+        """Issue a new code for the user."""
+
+    def consume(request: IRequest, user_id: int, code: str) -> bool:
+        """Use up a code. Return true if it was issued to the user and has not expired."""
+
+
 class CannotResetPasswordException(HTTPException):
     """Password reset is disabled for this user e.g. due to disabled account."""
 
@@ -160,6 +207,14 @@ class CannotCreateAuthorizationCodeException(HTTPException):
     """Authorization code exchange is disabled for this user e.g. due to disabled account."""
 
 
+class PasswordHashingBusy(HTTPServiceUnavailable):
+    """All password hashing workers are busy and the wait queue is full. The client should retry later."""
+
+
+class Throttled(HTTPTooManyRequests):
+    """The client made too many login, sign up or password reset attempts and should retry later, see :py:mod:`tm.system.core.throttle`."""
+
+
 class ICredentialService(Interface):
     """User password and activation related activities. """
 
@@ -218,3 +273,9 @@ class IPasswordHasher(Interface):
 
         :return: True if the password matches, False otherwise.
         """
+
+    def needs_rehash(hashed_password: str) -> bool:
+        """Check if a stored hash uses outdated parameters.
+
+        :return: True if the password should be hashed again after the next successful verification.
+        """
@@ -5,6 +5,7 @@ This module defines what fields the default user implementation can have.
 
 # Standard Library
 import datetime
+import typing as t
 from uuid import uuid4
 
 from sqlalchemy.ext.declarative.base import _declarative_constructor
@@ -16,6 +17,8 @@ from sqlalchemy import Column
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import func
 from sqlalchemy import inspection
 from sqlalchemy.ext.indexable import index_property
 from sqlalchemy_utils.types.ip_address import IPAddressType
@@ -100,6 +103,13 @@ class User:
 
     email = Column(String(256), nullable=True, unique=True)
 
+    #: Lookups compare lowercased username and email, see :py:meth:`tm.system.user.userregistry.UserRegistry.get_by_email`.
+    #: Plain unique indexes cannot serve ``lower(email) = ?``, so index the expression itself.
+    __table_args__ = (
+        Index("ix_users_username_lower", func.lower(username)),
+        Index("ix_users_email_lower", func.lower(email)),
+    )
+
     # : Stores the password + hash + cycles as password hasher internal format.. By default uses Argon 2 format.
     hashed_password = Column('password', String(256), nullable=True)
 
@@ -180,20 +190,31 @@ class User:
         # TODO: is_active defined in Horus
         return self.enabled and self.is_activated()
 
+    @property
+    def group_names(self) -> t.FrozenSet[str]:
+        """Names of the groups this user belongs to.
+
+        Walks ``groups`` once. Load users with ``joinedload(User.groups)`` to avoid a separate query.
+        """
+        return frozenset(g.name for g in self.groups)
+
     def is_in_group(self, name) -> bool:
+        """Is this user member of a named group.
 
-        # TODO: groups - defined in Horus
-        for g in self.groups:
-            if g.name == name:
-                return True
-        return False
+        Walks ``groups``. Request handling code should use :py:meth:`tm.system.user.userregistry.UserRegistry.is_in_group`, which is served from the group membership cache.
+        """
+        return name in self.group_names
 
-    def is_admin(self) -> bool:
+    def is_admin(self, group_names: t.Optional[t.FrozenSet[str]] = None) -> bool:
         """Does this user the see the main admin interface link.
 
-        TODO: This is very suboptimal, wasted database cycles, etc. Change this.
+        Request handling code should use :py:meth:`tm.system.user.userregistry.UserRegistry.is_admin`, which is served from the group membership cache.
+
+        :param group_names: Already resolved :py:attr:`group_names`, so that callers building principals do not walk the groups twice.
         """
-        return self.is_in_group(Group.DEFAULT_ADMIN_GROUP_NAME)
+        if group_names is None:
+            group_names = self.group_names
+        return Group.DEFAULT_ADMIN_GROUP_NAME in group_names
 
     def is_valid_session(self, session_created_at: datetime.datetime) -> bool:
         """Check if the current session is still valid for this user."""
@@ -267,14 +288,14 @@ class AuthorizationCode:
     created_at = Column(UTCDateTime, default=now)
     updated_at = Column(UTCDateTime, onupdate=now)
 
-    #: All authorization code must have expiring time
-    expires_at = Column(UTCDateTime, nullable=False)
+    #: All authorization code must have expiring time. Indexed for :py:mod:`tm.system.user.sweeper`.
+    expires_at = Column(UTCDateTime, nullable=False, index=True)
 
     code = Column(String(32), nullable=False, unique=True, default=lambda: generate_random_string(32))
 
     def is_expired(self):
         """The activation best before is past and we should not use it anymore."""
-        return self.expires_at < now()
+        return self.expires_at < datetime.datetime.now(datetime.timezone.utc)
 
 
 @implementer(IActivationModel)
@@ -293,14 +314,14 @@ class Activation:
     created_at = Column(UTCDateTime, default=now)
     updated_at = Column(UTCDateTime, onupdate=now)
 
-    #: All activation tokens must have expiring time
-    expires_at = Column(UTCDateTime, nullable=False)
+    #: All activation tokens must have expiring time. Indexed for :py:mod:`tm.system.user.sweeper`.
+    expires_at = Column(UTCDateTime, nullable=False, index=True)
 
     code = Column(String(32), nullable=False, unique=True, default=lambda: generate_random_string(32))
 
     def is_expired(self):
         """The activation best before is past and we should not use it anymore."""
-        return self.expires_at < now()
+        return self.expires_at < datetime.datetime.now(datetime.timezone.utc)
 
 
 class UserGroup:
@@ -9,15 +9,143 @@ More information
 * https://password-hashing.net/
 """
 # Standard Library
+import concurrent.futures
+import logging
+import os
+import statistics
+import threading
+import time
+import typing as t
+
 import argon2
+from zope.interface import implementer
+
+# System
+from tm.system.user.interfaces import IPasswordHasher
+from tm.system.user.interfaces import PasswordHashingBusy
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Argon 2 cost settings and their ``argon2.PasswordHasher`` arguments
+PARAMETER_SETTINGS = {
+    "tm.password.time_cost": "time_cost",
+    "tm.password.memory_cost": "memory_cost",
+    "tm.password.parallelism": "parallelism",
+}
+
+
+def get_argon2_parameters(settings: dict) -> t.Dict[str, int]:
+    """Read Argon 2 cost parameters from settings.
+
+    * ``tm.password.time_cost``: number of iterations
+
+    * ``tm.password.memory_cost``: memory use in KiB
+
+    * ``tm.password.parallelism``: number of lanes
+
+    :return: Keyword arguments for ``argon2.PasswordHasher``. Parameters not set use the argon2_cffi defaults.
+    """
+    return {argument: int(settings[key]) for key, argument in PARAMETER_SETTINGS.items() if settings.get(key)}
+
 
+def _hash(hasher: argon2.PasswordHasher, plain_text: str) -> str:
+    """Hash a password. Module level so that it can be pickled to a worker process."""
+    return hasher.hash(plain_text)
 
+
+def _verify(hasher: argon2.PasswordHasher, hashed_password: str, plain_text: str) -> bool:
+    """Verify a password. Module level so that it can be pickled to a worker process."""
+    try:
+        hasher.verify(hashed_password, plain_text)
+        return True
+    except argon2.exceptions.VerifyMismatchError:
+        return False
+
+
+class HashingPool:
+    """Bounded worker pool running password hashing outside of the request thread.
+
+    Argon 2 is deliberately CPU and memory hungry. Running it on the web server threads lets a burst of logins pin
+    every thread and starve unrelated requests. The pool caps the number of hashing jobs in flight: when all workers
+    are busy and the wait queue is full, :py:class:`tm.system.user.interfaces.PasswordHashingBusy` is raised right
+    away instead of stacking latency.
+    """
+
+    def __init__(self, kind: str = "thread", workers: t.Optional[int] = None, max_queue: t.Optional[int] = None, timeout: t.Optional[float] = None):
+        """Initialize HashingPool.
+
+        :param kind: ``thread`` or ``process``. argon2_cffi releases the GIL while hashing, so threads are usually enough.
+        :param workers: Number of hashing workers. Defaults to the number of CPUs.
+        :param max_queue: How many jobs may wait for a free worker before we start rejecting. Defaults to ``workers``.
+        :param timeout: Maximum seconds a caller waits for a result before giving up. A job already running cannot be interrupted: it keeps its worker and its place in the pool until it finishes, so the pool never runs more than ``workers`` jobs.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers if max_queue is None else max_queue
+        self.timeout = timeout
+
+        if kind == "thread":
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tm-hashing")
+        elif kind == "process":
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            raise ValueError("Unknown hashing pool kind: {}".format(kind))
+
+        self.kind = kind
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+
+    def run(self, func: t.Callable, *args) -> t.Any:
+        """Run a hashing function in the pool and wait for its result.
+
+        :raise PasswordHashingBusy: If the pool queue is full or the result did not arrive in time.
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Password hashing pool full, rejecting request")
+            raise PasswordHashingBusy(json={"message": "Server busy, please try again later."}, headers={"Retry-After": "1"})
+
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        # The slot is freed when the job is done or cancelled, not when the caller stops waiting
+        future.add_done_callback(self._release)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            # Only drops a job still waiting in the queue, a running job finishes and then frees its slot
+            future.cancel()
+            logger.warning("Password hashing did not complete in %s seconds", self.timeout)
+            raise PasswordHashingBusy(json={"message": "Server busy, please try again later."}, headers={"Retry-After": "1"})
+
+    def _release(self, future: concurrent.futures.Future):
+        self._slots.release()
+
+    def shutdown(self):
+        """Stop the workers."""
+        self.executor.shutdown(wait=False)
+
+
+@implementer(IPasswordHasher)
 class Argon2Hasher:
     """The default password hashing implementation using Argon 2."""
 
-    def __init__(self):
-        """Initialize Argon2Hasher."""
-        self.hasher = argon2.PasswordHasher()
+    def __init__(self, pool: t.Optional[HashingPool] = None, **parameters):
+        """Initialize Argon2Hasher.
+
+        :param pool: Offload hashing to this worker pool. If not given hash in the calling thread.
+        :param parameters: Cost parameters ``time_cost``, ``memory_cost`` and ``parallelism`` for new hashes, see :py:func:`get_argon2_parameters`. Existing hashes are verified with the parameters stored in them.
+        """
+        self.hasher = argon2.PasswordHasher(**parameters)
+        self.pool = pool
+
+    def _run(self, func: t.Callable, *args) -> t.Any:
+        if self.pool:
+            return self.pool.run(func, self.hasher, *args)
+        return func(self.hasher, *args)
 
     def hash_password(self, plain_text: str) -> str:
         """Hash plain text password.
@@ -25,7 +153,7 @@ class Argon2Hasher:
         :param plain_text: Password.
         :return: Hash of the password.
         """
-        return self.hasher.hash(plain_text)
+        return self._run(_hash, plain_text)
 
     def verify_password(self, hashed_password: str, plain_text: str) -> bool:
         """Validate if given hash and password match.
@@ -34,9 +162,51 @@ class Argon2Hasher:
         :param plain_text: Plain text password
         :return: Boolean indicating if plain_text relates to hashed_password.
         """
+        return self._run(_verify, hashed_password, plain_text)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Was the hash created with other parameters than we use now.
+
+        :param hashed_password: Password hash.
+        :return: True if the password should be hashed again when we next see it in plain text.
+        """
         try:
-            self.hasher.verify(hashed_password, plain_text)
-            verification = True
-        except argon2.exceptions.VerifyMismatchError:
-            verification = False
-        return verification
+            return self.hasher.check_needs_rehash(hashed_password)
+        except argon2.exceptions.InvalidHashError:
+            return False
+
+
+def measure_verify(hasher: argon2.PasswordHasher, samples: int = 5) -> float:
+    """Median seconds to verify a password with the given parameters on this machine."""
+    hashed = hasher.hash("calibration")
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.verify(hashed, "calibration")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate(target: float, memory_cost: int = 65536, parallelism: int = 4, min_memory_cost: int = 19456, max_time_cost: int = 100, samples: int = 5) -> t.Tuple[t.Dict[str, int], float]:
+    """Find the cheapest Argon 2 parameters whose verification takes at least ``target`` seconds on this machine.
+
+    Memory is the more valuable cost against GPU attacks, so we keep ``memory_cost`` and raise ``time_cost`` until the target is met. If a single iteration is already too slow, memory is halved down to ``min_memory_cost``.
+
+    :param target: Wanted verification latency in seconds
+    :param samples: Verifications timed per candidate
+    :return: Tuple(``argon2.PasswordHasher`` keyword arguments, measured seconds)
+    """
+    while True:
+        parameters = dict(time_cost=1, memory_cost=memory_cost, parallelism=parallelism)
+        elapsed = measure_verify(argon2.PasswordHasher(**parameters), samples)
+        if elapsed <= target or memory_cost // 2 < min_memory_cost:
+            break
+        memory_cost //= 2
+
+    while elapsed < target and parameters["time_cost"] < max_time_cost:
+        # Latency grows linearly with iterations, jump close to the target and step from there
+        estimate = int(parameters["time_cost"] * target / elapsed) if elapsed else parameters["time_cost"] + 1
+        parameters["time_cost"] = min(max(estimate, parameters["time_cost"] + 1), max_time_cost)
+        elapsed = measure_verify(argon2.PasswordHasher(**parameters), samples)
+
+    return parameters, elapsed
@@ -5,6 +5,10 @@ import typing as t
 # Pyramid
 from pyramid.interfaces import IRequest
 
+# SQLAlchemy
+from sqlalchemy import func
+
+from tm.system.model.replica import replica_reads
 from tm.system.user.models import User
 from tm.system.user.userregistry import UserRegistry
 
@@ -13,6 +17,9 @@ from tm.system.user.userregistry import UserRegistry
 import colander as c
 
 PASSWORD_MIN_LENGTH = 6
+
+#: Largest page of the user list
+USERS_MAX_PAGE_SIZE = 1000
 password = c.SchemaNode(c.String(), validator=c.Length(min=PASSWORD_MIN_LENGTH), required=True)
 
 
@@ -31,8 +38,10 @@ class SignUpSchema(c.Schema):
 
         request = node.bindings["request"]
         dbsession = request.dbsession
-        value = value.strip()
-        if dbsession.query(User).filter_by(email=value).one_or_none():
+        value = value.strip().lower()
+        with replica_reads(dbsession):
+            taken = dbsession.query(User.id).filter(func.lower(User.email) == value).first()
+        if taken:
             raise c.Invalid(node, "Email address already taken")
 
     email = c.SchemaNode(
@@ -69,6 +78,15 @@ class AuthorizationCodeSchema(c.Schema):
     client_id = c.SchemaNode(c.Int(), required=True)
 
 
+class UsersQuerySchema(c.Schema):
+    """User list pagination.
+
+    Pages are keyed by the id of the last user on the previous page, so that deep pages are as fast as the first one.
+    """
+    after = c.SchemaNode(c.Int(), missing=0, validator=c.Range(min=0))
+    limit = c.SchemaNode(c.Int(), missing=None, validator=c.Range(min=1, max=USERS_MAX_PAGE_SIZE))
+
+
 class ResetPasswordSchema(c.Schema):
     """Reset password schema."""
     user = c.SchemaNode(c.String(), missing=c.null)
@@ -53,8 +53,7 @@ class LoginService:
     def check_credentials(self, username: str, password: str) -> User:
         """Check if the user password matches.
 
-        * First try username + password
-        + Then try with email + password
+        Username and email (if ``tm.login.allow_email_auth`` is on) are looked up with a single query and the password is verified only once, as failed logins are the most expensive and most abused path.
 
         :param username: username or email
         :param password:
@@ -63,15 +62,10 @@ class LoginService:
         """
         request = self.request
         settings = request.registry.settings
-        allow_email_auth = settings.get('tm.login.allow_email_auth', True)
+        allow_email_auth = asbool(settings.get('tm.login.allow_email_auth', True))
 
-        # Check login with username
         user_registry = UserRegistry(request)
-        user = user_registry.get_authenticated_user_by_username(username, password)
-
-        # Check login with email
-        if allow_email_auth and not user:
-            user = user_registry.get_authenticated_user_by_email(username, password)
+        user = user_registry.get_authenticated_user(username, password, allow_email=allow_email_auth)
 
         if not user:
             raise AuthenticationFailure('Invalid username or password.')
@@ -155,8 +149,13 @@ class LoginService:
         if not user.can_login():
             raise AuthenticationFailure('This user account cannot log in at the moment.')
 
+        # Resolve group membership through the registry. This warms the membership cache, which answers the admin
+        # claim below and the group principals of later requests, see tm.system.auth.principals.
+        user_registry = UserRegistry(self.request)
+        group_names = user_registry.get_group_names(user)
+
         principals = [Authenticated]
-        principals += ['group:{}'.format(g.name) for g in user.groups]
+        principals += ['group:{}'.format(name) for name in sorted(group_names)]
         principals.append('user:{}'.format(user.id))
 
         request = self.request
@@ -173,7 +172,7 @@ class LoginService:
 
         token = self.request.create_jwt_token(user.id,
                                               name=user.username,
-                                              admin=user.is_admin(),
+                                              admin=user_registry.is_admin(user),
                                               principals=principals)
         return token
 
@@ -1,6 +1,7 @@
 """Sign up form service."""
 # Standard Library
 import logging
+import typing as t
 
 # Pyramid
 from pyramid.httpexceptions import HTTPNoContent
@@ -80,20 +81,29 @@ class SignUpService:
 
         :param user: User object.
         """
+        context = self.create_email_activation_context(user)
+
+        logger.info("Sending sign up email to %s", user.email)
+
+        # TODO: Broken abstraction, we assume user.email is a attribute
+        send_templated_mail(self.request, [user.email], "login/email/activate", context)
+
+    def create_email_activation_context(self, user: User, activation_code: t.Optional[str] = None) -> dict:
+        """Create a new activation token for the user and the context for the activation email template.
+
+        :param user: User object.
+        :param activation_code: Use this code for the token instead of generating one.
+        :return: Context for ``login/email/activate`` templates.
+        """
         user_registry = UserRegistry(self.request)
-        activation_code, expiration_seconds = user_registry.create_email_activation_token(user)
+        activation_code, expiration_seconds = user_registry.create_email_activation_token(user, activation_code)
         activation_url_str = self.settings.get('tm.registry.site_user_activation_url')
 
-        context = {
+        return {
             'link':  '%s/%s' % (activation_url_str, activation_code),
             'expiration_hours': int(expiration_seconds / 3600),
         }
 
-        logger.info("Sending sign up email to %s", user.email)
-
-        # TODO: Broken abstraction, we assume user.email is a attribute
-        send_templated_mail(self.request, [user.email], "login/email/activate", context)
-
     def activate_by_email(self, activation_code: str, location: str = None) -> Response:
         """Active a user after user after the activation email.
 
@@ -7,6 +7,7 @@ from pyramid.request import Request
 from zope.interface import implementer
 
 # SQLAlchemy
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.attributes import flag_modified
 
@@ -103,7 +104,7 @@ class EmailSocialLoginMapper:
         :param email: User email.
         :return: User object.
         """
-        user = dbsession.query(user_model).filter_by(email=email).first()
+        user = dbsession.query(user_model).filter(func.lower(user_model.email) == email.lower()).first()
         return user
 
     def get_or_create_user_by_social_medial_email(self, request: Request, user: authomatic.core.User) -> User:
@@ -0,0 +1,164 @@
+"""Delete expired activation and authorization code rows.
+
+Tokens are only deleted when they are used, so abandoned sign ups, password resets and OAuth flows leave expired rows behind. The sweeper deletes them in batches, each batch in its own short transaction, using the ``expires_at`` indexes. Rows are claimed with ``FOR UPDATE SKIP LOCKED``, so several processes can sweep at the same time.
+
+Run it from cron with the ``sweep_expired_tokens`` console script, or in the web process with ``tm.sweeper.enabled = true``. Settings:
+
+* ``tm.sweeper.enabled``: run a background thread in every web process, default false
+
+* ``tm.sweeper.interval_seconds``: time between sweeps of the background thread, default 3600
+
+* ``tm.sweeper.batch_size``: rows deleted per transaction, default 1000
+
+Deleted rows are counted in the ``user.sweeper.deleted`` metric labelled with the table name, the duration of sweeps in ``user.sweeper.seconds``.
+
+The references to the deleted rows are cleared with a bulk ``UPDATE`` of ``users``, which the user cache does not see. The background thread drops the affected users from the caches of its process after each batch, see :py:func:`tm.system.user.cache.invalidate_users`. Other processes, including web processes when the console script sweeps, keep their snapshots until the cache TTL.
+"""
+# Standard Library
+import logging
+import threading
+import time
+import typing as t
+
+# Pyramid
+from pyramid.events import ApplicationCreated
+from pyramid.registry import Registry
+from pyramid.settings import asbool
+
+# SQLAlchemy
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+# System
+from tm.system.core.interfaces import IMetrics
+from tm.system.core.utils import get_metrics
+from tm.system.user.cache import invalidate_users
+from tm.system.user.models import Activation
+from tm.system.user.models import AuthorizationCode
+from tm.system.user.models import User
+from tm.utils.time import now
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Token models and the user columns pointing to them
+SWEPT_MODELS = (
+    (Activation, "activation_id"),
+    (AuthorizationCode, "authorization_code_id"),
+)
+
+
+def delete_expired_batch(engine: Engine, model, reference: str, batch_size: int, registry: t.Optional[Registry] = None) -> int:
+    """Delete one batch of expired rows in its own transaction.
+
+    :param reference: Name of the user column referring to the rows, cleared first
+    :param registry: Drop the users whose reference was cleared from the user caches of this registry after the commit, optional.
+    :return: Number of deleted rows
+    """
+    table = model.__table__
+    users = User.__table__
+    with engine.connect() as connection:
+        # Concurrent sweepers skip each other's rows, and an expired token cannot be renewed, so serializable would only add conflicts
+        connection = connection.execution_options(isolation_level="READ COMMITTED")
+        with connection.begin():
+            expired = select([table.c.id]). \
+                where(table.c.expires_at < now()). \
+                order_by(table.c.expires_at). \
+                limit(batch_size). \
+                with_for_update(skip_locked=True)
+            ids = [row[0] for row in connection.execute(expired)]
+            if not ids:
+                return 0
+
+            cleared = users.update().where(users.c[reference].in_(ids)).values({reference: None}).returning(users.c.id)
+            user_ids = [row[0] for row in connection.execute(cleared)]
+            connection.execute(table.delete().where(table.c.id.in_(ids)))
+
+    if registry is not None:
+        invalidate_users(registry, user_ids)
+    return len(ids)
+
+
+class Sweeper:
+    """Delete expired tokens."""
+
+    def __init__(self, engine: Engine, batch_size: int = 1000, interval: float = 3600, metrics: t.Optional[IMetrics] = None, registry: t.Optional[Registry] = None):
+        """Initialize Sweeper.
+
+        :param engine: Engine of the primary database.
+        :param metrics: Where to report deleted rows, optional.
+        :param registry: Registry whose user caches are invalidated for the changed users, optional.
+        """
+        self.engine = engine
+        self.registry = registry
+        self.batch_size = batch_size
+        self.interval = interval
+        self.metrics = metrics
+        self.stopping = threading.Event()
+
+    @classmethod
+    def from_settings(cls, settings: dict, engine: Engine, metrics: t.Optional[IMetrics] = None, registry: t.Optional[Registry] = None) -> "Sweeper":
+        """Create a sweeper configured by ``tm.sweeper.*`` settings."""
+        return cls(
+            engine,
+            batch_size=int(settings.get("tm.sweeper.batch_size", 1000)),
+            interval=float(settings.get("tm.sweeper.interval_seconds", 3600)),
+            metrics=metrics,
+            registry=registry,
+        )
+
+    def sweep(self) -> t.Dict[str, int]:
+        """Delete all expired tokens.
+
+        :return: Number of deleted rows by table name
+        """
+        start = time.perf_counter()
+        counts = {}
+        for model, reference in SWEPT_MODELS:
+            table_name = model.__tablename__
+            counts[table_name] = 0
+            while not self.stopping.is_set():
+                deleted = delete_expired_batch(self.engine, model, reference, self.batch_size, self.registry)
+                counts[table_name] += deleted
+                if self.metrics and deleted:
+                    self.metrics.incr("user.sweeper.deleted", deleted, table=table_name)
+                if deleted < self.batch_size:
+                    break
+
+        if self.metrics:
+            self.metrics.observe("user.sweeper.seconds", time.perf_counter() - start)
+        logger.info("Deleted expired tokens: %s", counts)
+        return counts
+
+    def loop(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.exception("Sweeping expired tokens failed: %s", e)
+
+    def start(self) -> threading.Thread:
+        """Sweep periodically in a daemon thread."""
+        thread = threading.Thread(target=self.loop, name="tm-sweeper", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopping.set()
+
+
+def includeme(config):
+    """Start the background sweeper when ``tm.sweeper.enabled`` is set."""
+    settings = config.registry.settings
+    if not asbool(settings.get("tm.sweeper.enabled", False)):
+        return
+
+    def on_application_created(event):
+        registry = event.app.registry
+        engine = registry["dbsession_factory"].kw["bind"]
+        sweeper = Sweeper.from_settings(registry.settings, engine, get_metrics(registry), registry)
+        registry["tm.sweeper"] = sweeper
+        sweeper.start()
+
+    config.add_subscriber(on_application_created, ApplicationCreated)
@@ -1,17 +1,35 @@
 """Default user object generator."""
 # Standard Library
 from datetime import timedelta
+import logging
 import typing as t
 
 # Pyramid
+from pyramid.settings import asbool
 from zope.interface import implementer
 
 # SQLAlchemy
 from sqlalchemy import func
+from sqlalchemy import inspect
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 
 from tm.utils.time import now
 from tm.system.user.interfaces import IUserRegistry
+from tm.system.user.interfaces import PasswordHashingBusy
+from tm.system.user.authcodes import get_authorization_code_store
+from tm.system.user.cache import get_group_membership_cache
+from tm.system.user.cache import get_user_cache
+from tm.system.user.cache import restore_user
+from tm.system.user.cache import snapshot_user
 from tm.system.user.models import User
+from tm.system.user.models import UserGroup
+from tm.system.user.utils import get_password_hasher
+
+
+logger = logging.getLogger(__name__)
+
 
 @implementer(IUserRegistry)
 class UserRegistry:
@@ -25,6 +43,7 @@ class UserRegistry:
 
         :param request:Pyramid request.
         """
+        self.request = request
         self.dbsession = request.dbsession
         self.registry = request.registry
 
@@ -67,14 +86,38 @@ class UserRegistry:
     def all(self):
         return self.dbsession.query(self.User).all()
 
+    def iter_full_names(self, after_id: int = 0, chunk_size: int = 1000) -> t.Iterator[t.Tuple[int, t.Optional[str]]]:
+        """Iterate ``(id, full_name)`` of users in id order, without loading User objects.
+
+        Rows are read in chunks of ``chunk_size`` with keyset pagination on ``id``. All chunks are read on one connection in one ``REPEATABLE READ`` transaction, so the listing is a consistent snapshot even when users sign up or are deleted while it is consumed. The transaction is separate from the request transaction and only starts when the iterator is first advanced, so the iterator can still be consumed while a response is streamed after the view has returned. Reads go to the replica if the request reads from it.
+
+        :param after_id: Start after this user id
+        """
+        engine = self.dbsession.get_bind()
+        users = self.User.__table__
+        full_name = func.json_extract_path_text(users.c.user_data, "full_name")
+
+        def _iter(after_id):
+            with engine.connect() as connection:
+                connection = connection.execution_options(isolation_level="REPEATABLE READ")
+                with connection.begin():
+                    while True:
+                        query = select([users.c.id, full_name]).where(users.c.id > after_id).order_by(users.c.id).limit(chunk_size)
+                        rows = connection.execute(query).fetchall()
+                        yield from rows
+                        if len(rows) < chunk_size:
+                            return
+                        after_id = rows[-1][0]
+
+        return _iter(after_id)
+
     def set_password(self, user, password):
         """Hash a password for persistent storage.
 
         :param user: User object.
         :param password: User password.
         """
-        from .password import Argon2Hasher
-        hasher = Argon2Hasher()
+        hasher = get_password_hasher(self.registry)
         hashed = hasher.hash_password(password)
         user.hashed_password = hashed
 
@@ -89,9 +132,17 @@ class UserRegistry:
             # User password not set, always fail
             return False
 
-        from .password import Argon2Hasher
-        hasher = Argon2Hasher()
-        return hasher.verify_password(user.hashed_password, password)
+        hasher = get_password_hasher(self.registry)
+        if not hasher.verify_password(user.hashed_password, password):
+            return False
+
+        # Upgrade hashes created with older cost parameters while we have the plain text password at hand
+        if asbool(self.registry.settings.get("tm.password.rehash_on_login", True)) and hasher.needs_rehash(user.hashed_password):
+            try:
+                user.hashed_password = hasher.hash_password(password)
+            except PasswordHashingBusy:
+                logger.info("Hashing pool busy, not upgrading the password hash of user %s", user.id)
+        return True
 
     def get_by_username(self, username):
         """Return the User with the given username.
@@ -142,9 +193,52 @@ class UserRegistry:
         """
         return user.groups
 
+    def get_group_names(self, user) -> t.FrozenSet[str]:
+        """Names of the groups a user belongs to, served from the group membership cache when possible.
+
+        If the groups of this user object are already loaded they are used as is and stored in the cache.
+
+        :param user: User object.
+        :return: Set of group names.
+        """
+        cache = get_group_membership_cache(self.registry)
+        if cache is None:
+            return user.group_names
+
+        if "groups" not in inspect(user).unloaded:
+            group_names = user.group_names
+            cache.set(user.id, group_names)
+            return group_names
+
+        group_names = cache.get(user.id)
+        if group_names is None:
+            query = self.dbsession.query(self.Group.name).join(UserGroup, UserGroup.group_id == self.Group.id).filter(UserGroup.user_id == user.id)
+            group_names = frozenset(name for name, in query)
+            cache.set(user.id, group_names)
+        return group_names
+
+    def is_in_group(self, user, name) -> bool:
+        """Is the user member of a named group.
+
+        :param user: User object.
+        :param name: Group name.
+        :return: Boolean
+        """
+        return name in self.get_group_names(user)
+
+    def is_admin(self, user) -> bool:
+        """Is the user member of the admin group.
+
+        :param user: User object.
+        :return: Boolean
+        """
+        return self.is_in_group(user, self.Group.DEFAULT_ADMIN_GROUP_NAME)
+
     def create_authorization_code(self, user: User, login_source: str = None):
         """Sets authorization code for user.
 
+        Codes are kept in the configured :py:class:`tm.system.user.interfaces.IAuthorizationCodeStore`.
+
         :param user: User
         :return: [User, authorization_code, authorization_code_expiry_seconds]. ``None`` if user is not allowed to login
         """
@@ -154,17 +248,10 @@ class UserRegistry:
 
         authorization_code_expiry_seconds = int(self.registry.settings.get("tm.oauth.authorization_code_expiry_seconds", 30))
 
-        auth_code = self.AuthorizationCode()
-        auth_code.expires_at = now() + timedelta(seconds=authorization_code_expiry_seconds)
-        self.dbsession.add(auth_code)
-        self.dbsession.flush()
-        user.authorization_code = auth_code
-
-        assert user.authorization_code.code, "Could not generate the authorization code"
-
-        return user, auth_code.code, authorization_code_expiry_seconds
-
+        store = get_authorization_code_store(self.registry)
+        code = store.create(self.request, user, authorization_code_expiry_seconds)
 
+        return user, code, authorization_code_expiry_seconds
 
     def create_password_reset_token(self, email):
         """Sets password reset token for user.
@@ -190,13 +277,14 @@ class UserRegistry:
 
         return user, activation.code, activation_token_expiry_seconds
 
-    def create_email_activation_token(self, user):
+    def create_email_activation_token(self, user, code: t.Optional[str] = None):
         """Create activation token for the user to be used in the email
 
         :param user: User object.
+        :param code: Activation code minted in advance, like one of a batch from :py:func:`tm.utils.crypt.generate_random_strings`. By default a new random code.
         :return: Tuple (email activation code, expiration in seconds)
         """
-        activation = self.Activation()
+        activation = self.Activation(code=code) if code else self.Activation()
         activation_token_expiry_seconds = int(self.registry.settings.get("tm.registry.activation_token_expiry_seconds", 24 * 3600))
         activation.expires_at = now() + timedelta(seconds=activation_token_expiry_seconds)
 
@@ -229,6 +317,34 @@ class UserRegistry:
             return user
         return None
 
+    def get_authenticated_user(self, login, password, allow_email=True):
+        """Authenticate incoming user using username or email and password.
+
+        Both the username and the email are matched in one indexed query and the password is verified at most once. If the login matches one user's username and another user's email, the username match wins.
+
+        :param login: Provided username or email.
+        :param password: Provided password.
+        :param allow_email: Also match the login against user emails.
+        :return: User instance of none if password does not match
+        """
+        login = login.lower()
+        user_class = self.User
+
+        criteria = func.lower(user_class.username) == login
+        if allow_email:
+            criteria = or_(criteria, func.lower(user_class.email) == login)
+
+        # Groups are needed to mint the token right after, fetch them in the same query
+        query = self.dbsession.query(user_class).options(joinedload(user_class.groups))
+        candidates = query.filter(criteria).limit(2).all()
+        if not candidates:
+            return None
+
+        user = next((u for u in candidates if u.username and u.username.lower() == login), candidates[0])
+        if self.verify_password(user, password):
+            return user
+        return None
+
     def get_user_by_id(self, id):
         """Resolve the authenticated user by a session token reference.
 
@@ -237,6 +353,28 @@ class UserRegistry:
         """
         return self.dbsession.query(self.User).get(id)
 
+    def get_cached_user_by_id(self, id):
+        """Resolve the authenticated user, using the user cache when one is configured.
+
+        On a cache hit the user is attached to the session without a database round trip.
+
+        :param id: user id
+        :return: User object.
+        """
+        cache = get_user_cache(self.registry)
+        if cache is None:
+            return self.get_user_by_id(id)
+
+        id = int(id)
+        state = cache.get(id)
+        if state is not None:
+            return restore_user(self.dbsession, self.User, state)
+
+        user = self.get_user_by_id(id)
+        if user is not None:
+            cache.set(id, snapshot_user(user))
+        return user
+
     def get_user_by_password_reset_token(self, token):
         """Get user by a password token issued earlier.
 
@@ -264,18 +402,12 @@ class UserRegistry:
         :param authorization_code: Authorization code
         :return: User instance or none if code is not found.
         """
-        result = self.dbsession.query(self.User, self.AuthorizationCode). \
-                                   filter(self.User.authorization_code_id == self.AuthorizationCode.id).\
-                                   filter(self.User.id == client_id).\
-                                   filter(self.AuthorizationCode.code == authorization_code).one_or_none()
-        user = None
-        if result:
-            user, auth_code = result
-            if auth_code.is_expired():
-                user = None
-            self.dbsession.delete(auth_code) # consume the auth code
+        store = get_authorization_code_store(self.registry)
+        if not store.consume(self.request, client_id, authorization_code):
+            return None
 
-        return user
+        # Groups are needed to mint the token right after, fetch them in the same query
+        return self.dbsession.query(self.User).options(joinedload(self.User.groups)).get(client_id)
 
     def activate_user_by_email_token(self, token):
         """Get user by a password token issued earlier.
@@ -16,6 +16,7 @@ from tm.system.user.interfaces import ICredentialService
 from tm.system.user.interfaces import IGroupModel
 from tm.system.user.interfaces import ILoginService
 from tm.system.user.interfaces import IOAuthLoginService
+from tm.system.user.interfaces import IPasswordHasher
 from tm.system.user.interfaces import IRegistrationService
 from tm.system.user.interfaces import IFirstLoginManager
 from tm.system.user.interfaces import ISocialLoginMapper
@@ -62,6 +63,21 @@ def get_first_login_manager(registry: Registry) -> IFirstLoginManager:
     return first_login_manager
 
 
+def get_password_hasher(registry: Registry) -> IPasswordHasher:
+    """Get the configured password hasher.
+
+    Falls back to a plain :py:class:`tm.system.user.password.Argon2Hasher` hashing in the calling thread if none is registered.
+
+    :param registry: Pyramid registry.
+    :return: Implementation of IPasswordHasher.
+    """
+    hasher = registry.queryUtility(IPasswordHasher)
+    if hasher is None:
+        from tm.system.user.password import Argon2Hasher
+        hasher = Argon2Hasher()
+    return hasher
+
+
 def get_authomatic(registry: Registry) -> Authomatic:
     """Get active Authomatic instance from the registry.
 
@@ -0,0 +1,94 @@
+"""In-process caching helpers."""
+# Standard Library
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+
+_missing = object()
+
+
+class LRUCache:
+    """Thread safe least-recently-used cache with an optional time-to-live.
+
+    Entries are evicted when the cache grows over ``max_size`` or when they are older than ``ttl`` seconds.
+
+    Example::
+
+        cache = LRUCache(max_size=1000, ttl=60)
+        cache.set(1, "foo")
+        cache.get(1)  # "foo"
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: t.Optional[float] = None, clock: t.Callable[[], float] = time.monotonic):
+        """Initialize LRUCache.
+
+        :param max_size: Maximum number of entries to hold.
+        :param ttl: Seconds an entry stays valid. ``None`` to keep entries until evicted.
+        :param clock: Monotonic time source, can be replaced in tests.
+        """
+        assert max_size > 0
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        """Get a cached value.
+
+        :param key: Cache key.
+        :param default: Returned if the key is not present or has expired.
+        """
+        with self._lock:
+            entry = self._data.get(key, _missing)
+            if entry is _missing:
+                return default
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: t.Hashable, value: t.Any, ttl: t.Optional[float] = None):
+        """Store a value.
+
+        :param key: Cache key.
+        :param value: Value to store.
+        :param ttl: Override the default time-to-live for this entry.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = self.clock() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        """Remove a value from the cache and return it if it was still valid."""
+        with self._lock:
+            entry = self._data.pop(key, _missing)
+        if entry is _missing:
+            return default
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= self.clock():
+            return default
+        return value
+
+    def invalidate(self, key: t.Hashable):
+        """Drop a key from the cache, if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -1,15 +1,61 @@
 """Cryptographic utilities."""
 # Standard Library
-import random
+import functools
+import os
+import secrets
 import string
+import typing as t
 
 _default = string.ascii_lowercase + string.ascii_uppercase + string.digits
 
 
+@functools.lru_cache(maxsize=16)
+def _get_translation(letters: str) -> t.Optional[t.Tuple[bytes, bytes]]:
+    """Map random bytes to letters with ``bytes.translate``.
+
+    Bytes at and above the largest multiple of ``len(letters)`` are deleted instead of mapped, so that every letter is equally likely.
+
+    :return: Tuple(translation table, bytes to delete) or ``None`` if the letters are not ASCII or too many
+    """
+    size = len(letters)
+    if not 0 < size <= 256 or not all(ord(c) < 128 for c in letters):
+        return None
+    limit = 256 - 256 % size
+    table = bytes(ord(letters[b % size]) for b in range(256))
+    return table, bytes(range(limit, 256))
+
+
+def _random_letters(count: int, letters: str) -> str:
+    """Read ``count`` random letters with as few ``os.urandom`` calls as possible."""
+    translation = _get_translation(letters)
+    if translation is None:
+        return ''.join(secrets.choice(letters) for _ in range(count))
+
+    table, rejected = translation
+    # Expected number of bytes to read, with some slack so that one read is nearly always enough
+    ratio = 256 / (256 - len(rejected))
+    result = b''
+    while len(result) < count:
+        missing = count - len(result)
+        result += os.urandom(int(missing * ratio) + 16).translate(table, rejected)
+    return result[:count].decode('ascii')
+
+
 def generate_random_string(length: int, letters: str = _default) -> str:
     """Generate cryptographically safe random string.
 
     :param length: String length
     :param letters: Choose from this letter pool
     """
-    return ''.join(random.SystemRandom().choice(letters) for _ in range(length))
+    return _random_letters(length, letters)
+
+
+def generate_random_strings(count: int, length: int, letters: str = _default) -> t.List[str]:
+    """Generate many cryptographically safe random strings at once, like codes for a batch of activations.
+
+    :param count: Number of strings
+    :param length: Length of each string
+    :param letters: Choose from this letter pool
+    """
+    pool = _random_letters(count * length, letters)
+    return [pool[i:i + length] for i in range(0, count * length, length)]
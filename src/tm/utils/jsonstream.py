@@ -0,0 +1,25 @@
+"""Encode large JSON responses piece by piece."""
+# Standard Library
+import json
+import typing as t
+
+
+def iter_json_array(values: t.Iterable, buffer_size: int = 8192) -> t.Iterator[bytes]:
+    """Encode an iterable as a JSON array without building the whole document in memory.
+
+    Use as the ``app_iter`` of a response. Items are encoded one at a time and written out in chunks of roughly ``buffer_size`` bytes.
+    """
+    buffer = ["["]
+    size = 1
+    separator = ""
+    for value in values:
+        item = separator + json.dumps(value)
+        separator = ","
+        buffer.append(item)
+        size += len(item)
+        if size >= buffer_size:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    buffer.append("]")
+    yield "".join(buffer).encode("utf-8")
@@ -0,0 +1,81 @@
+"""In-process application metrics.
+
+Counters, timing observations and gauges are kept in memory and can be read with :py:meth:`Metrics.snapshot`, e.g. to ship them to a monitoring backend. Administrators can read the snapshot from the ``/metrics`` view. Labels are passed as keyword arguments::
+
+    metrics.incr("db.serialization_failures", route="users")
+    metrics.observe("db.pool.checkout_wait_seconds", 0.002)
+    metrics.gauge("db.pool.checked_out", pool.checkedout)
+"""
+# Standard Library
+import threading
+import typing as t
+
+
+def _key(name: str, labels: dict) -> t.Tuple:
+    return (name, ) + tuple(sorted(labels.items()))
+
+
+def _format_key(key: t.Tuple) -> str:
+    name, labels = key[0], key[1:]
+    if not labels:
+        return name
+    return "{}{{{}}}".format(name, ",".join("{}={}".format(k, v) for k, v in labels))
+
+
+class Metrics:
+    """Thread safe store of counters, observations and gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._observations = {}
+        self._gauges = {}
+
+    def incr(self, name: str, value: int = 1, **labels):
+        """Increment a counter.
+
+        :param name: Metric name.
+        :param value: Amount to add.
+        :param labels: Labels distinguishing series of the same metric.
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a measurement, like a duration. Count, sum and maximum are kept."""
+        key = _key(name, labels)
+        with self._lock:
+            count, total, maximum = self._observations.get(key, (0, 0.0, value))
+            self._observations[key] = (count + 1, total + value, max(maximum, value))
+
+    def gauge(self, name: str, value: t.Union[float, t.Callable[[], float]], **labels):
+        """Set a gauge.
+
+        :param value: Current value, or a callable which is asked for the value when a snapshot is taken.
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def snapshot(self) -> dict:
+        """Get the current values of all metrics.
+
+        :return: Dictionary with ``counters``, ``observations`` and ``gauges``. Series are keyed by ``name{label=value,...}``.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            observations = dict(self._observations)
+            gauges = dict(self._gauges)
+
+        return {
+            "counters": {_format_key(k): v for k, v in counters.items()},
+            "observations": {_format_key(k): {"count": c, "sum": s, "max": m} for k, (c, s, m) in observations.items()},
+            "gauges": {_format_key(k): v() if callable(v) else v for k, v in gauges.items()},
+        }
+
+    def reset(self):
+        """Drop counters and observations. Gauges stay."""
+        with self._lock:
+            self._counters.clear()
+            self._observations.clear()
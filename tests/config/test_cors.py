@@ -0,0 +1,128 @@
+"""Test CORS headers."""
+import pytest
+from pyramid.config import Configurator
+from pyramid.response import Response
+from webtest import TestApp
+
+from tm.config.cors import get_cors_policies
+
+
+def test_origin_list():
+    """Allowed origins are echoed back, others get no CORS headers."""
+    default, routes = get_cors_policies({
+        "tm.cors.allow_origins": "https://a.example.com https://b.example.com",
+        "tm.cors.route.home.allow_origins": "*",
+        "tm.cors.skip_routes": "health",
+    })
+
+    headers = dict(default.get_response_headers("https://b.example.com"))
+    assert headers["Access-Control-Allow-Origin"] == "https://b.example.com"
+    assert headers["Access-Control-Allow-Credentials"] == "true"
+    assert headers["Vary"] == "Origin"
+
+    assert dict(default.get_response_headers("https://evil.example.com")) == {"Vary": "Origin"}
+    assert dict(default.get_preflight_headers(None)) == {"Content-Type": "application/json", "Vary": "Origin"}
+
+    headers = dict(routes["home"].get_preflight_headers("https://evil.example.com"))
+    assert headers["Access-Control-Allow-Origin"] == "*"
+    assert "Access-Control-Allow-Credentials" not in headers
+
+    assert routes["health"] is None
+
+
+calls = []
+
+
+def view(request):
+    calls.append(request.matched_route.name)
+    return Response("ok")
+
+
+def own_origin_view(request):
+    return Response("ok", headers={"Access-Control-Allow-Origin": "https://own.example.com"})
+
+
+def request_id_tween_factory(handler, registry):
+    """Outer tween stamping every response, like request id or timing middleware do."""
+    counter = iter(range(1000))
+
+    def tween(request):
+        response = handler(request)
+        response.headerlist.append(("X-Request-Id", str(next(counter))))
+        return response
+
+    return tween
+
+
+@pytest.fixture
+def app(tmpdir):
+    tmpdir.join("style.css").write("body {}")
+    calls.clear()
+
+    config = Configurator(settings={
+        "tm.cors.allow_origins": "https://a.example.com",
+        "tm.cors.route.public.allow_origins": "*",
+        "tm.cors.skip_routes": "internal",
+    })
+    config.include("tm.config.cors")
+    config.add_tween(__name__ + ".request_id_tween_factory", over="tm.config.cors.cors_preflight_tween_factory")
+    for name in ("api", "public", "internal", "own"):
+        config.add_route(name, "/" + name)
+    config.add_view(view, route_name="api")
+    config.add_view(view, route_name="public")
+    config.add_view(view, route_name="internal")
+    config.add_view(own_origin_view, route_name="own")
+    config.add_static_view("static", str(tmpdir))
+    return TestApp(config.make_wsgi_app())
+
+
+def test_preflight_skips_view(app):
+    """OPTIONS is answered by the tween with the policy of the matched route."""
+    response = app.options("/api", headers={"Origin": "https://a.example.com"})
+    assert response.body == b"{}"
+    assert response.content_type == "application/json"
+    assert response.headers["Access-Control-Allow-Origin"] == "https://a.example.com"
+    assert response.headers["Access-Control-Allow-Methods"] == "POST,GET,DELETE,PUT,OPTIONS"
+    assert response.headers["Access-Control-Max-Age"] == "1728000"
+    assert calls == []
+
+    response = app.options("/api", headers={"Origin": "https://evil.example.com"})
+    assert "Access-Control-Allow-Origin" not in response.headers
+    assert response.headers["Vary"] == "Origin"
+
+
+def test_preflight_responses_are_not_shared(app):
+    """Each preflight gets its own response, so headers set by outer tweens do not leak into the next one."""
+    first = app.options("/api", headers={"Origin": "https://a.example.com"})
+    second = app.options("/api", headers={"Origin": "https://a.example.com"})
+    assert first.headers.getall("X-Request-Id") == ["0"]
+    assert second.headers.getall("X-Request-Id") == ["1"]
+
+
+def test_route_override(app):
+    response = app.get("/public", headers={"Origin": "https://evil.example.com"})
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+    assert "Vary" not in response.headers
+
+    response = app.get("/api", headers={"Origin": "https://a.example.com"})
+    assert response.headers["Access-Control-Allow-Origin"] == "https://a.example.com"
+    assert response.headers["Access-Control-Allow-Credentials"] == "true"
+    assert response.headers["Access-Control-Expose-Headers"] == "Authorization, Link"
+    assert calls == ["public", "api"]
+
+
+def test_skipped_and_static_routes(app):
+    """Skipped routes and static views get no CORS headers, not even for preflights."""
+    for path in ("/internal", "/static/style.css"):
+        response = app.get(path, headers={"Origin": "https://a.example.com"})
+        assert not [name for name in response.headers if name.startswith("Access-Control-")]
+
+        response = app.options(path, headers={"Origin": "https://a.example.com"})
+        assert not [name for name in response.headers if name.startswith("Access-Control-")]
+
+
+def test_existing_origin_kept(app):
+    """A view setting its own Access-Control-Allow-Origin is left alone."""
+    response = app.get("/own", headers={"Origin": "https://a.example.com"})
+    assert response.headers.getall("Access-Control-Allow-Origin") == ["https://own.example.com"]
+    assert "Access-Control-Expose-Headers" not in response.headers
@@ -0,0 +1,85 @@
+"""Test the startup database sanity check."""
+import multiprocessing
+import time
+
+import pytest
+from pyramid.config import Configurator
+from sqlalchemy import event
+
+from tm.config.system.sanity_check import exclusive_lock
+from tm.config.system.sanity_check import sanity_check_callback
+from tm.system.model import sanitycheck
+from tm.system.model.meta import Base
+from tm.system.model.meta import get_engine
+from tm.system.model.meta import get_session_factory
+from tm.system.model.sanitycheck import model_schema_fingerprint
+from tm.system.model.sanitycheck import read_fingerprint
+
+
+def make_config(engine, **settings):
+    config = Configurator(settings=dict({"sqlalchemy.url": str(engine.url)}, **settings))
+    config.registry["dbsession_factory"] = get_session_factory(engine)
+    return config
+
+
+def check_without_reflection(url, lock_file):
+    """Run the check in a child process, failing if it reflects the database instead of trusting the fingerprint."""
+
+    def inspect(*args):
+        raise AssertionError("Database was reflected")
+
+    sanitycheck.inspect = inspect
+    engine = get_engine({"sqlalchemy.url": url})
+    sanity_check_callback(make_config(engine, **{"tm.sanity_check.lock_file": lock_file}))
+
+
+def test_borrows_and_disposes_engine(engine):
+    """The check runs on the engine of the session factory and leaves no pooled connections behind."""
+    check_engine = get_engine({"sqlalchemy.url": str(engine.url)})
+    check_engine.connect().close()
+    pool = check_engine.pool
+    assert pool.checkedin() == 1
+
+    statements = []
+    event.listen(check_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    sanity_check_callback(make_config(check_engine))
+    assert statements
+    assert check_engine.pool is not pool
+    assert check_engine.pool.checkedin() == 0
+
+
+def test_waiting_process_skips_check(engine, tmpdir):
+    """A worker waiting for the lock finds the fingerprint written by the worker holding it and skips the reflection."""
+    lock_file = str(tmpdir.join("sanity.lock"))
+    context = multiprocessing.get_context("fork")
+
+    with exclusive_lock(lock_file):
+        worker = context.Process(target=check_without_reflection, args=(str(engine.url), lock_file))
+        worker.start()
+        time.sleep(0.5)
+        assert worker.is_alive(), "Worker did not wait for the lock"
+
+        with engine.connect() as connection:
+            fingerprint = model_schema_fingerprint(Base, connection)
+        sanitycheck.write_fingerprint(lock_file + ".fingerprint", fingerprint)
+
+    worker.join(30)
+    assert worker.exitcode == 0
+    assert read_fingerprint(lock_file + ".fingerprint") == fingerprint
+
+
+def test_failing_check_raises(engine, tmpdir):
+    """A failed check does not store a fingerprint."""
+    from tm.config.system.sanity_check import SanityCheckFailed
+
+    cache_file = str(tmpdir.join("sanity.fingerprint"))
+    with engine.begin() as connection:
+        connection.execute("ALTER TABLE users DROP COLUMN last_login_ip")
+    try:
+        with pytest.raises(SanityCheckFailed):
+            sanity_check_callback(make_config(get_engine({"sqlalchemy.url": str(engine.url)}), **{"tm.sanity_check.cache_file": cache_file}))
+        assert read_fingerprint(cache_file) is None
+    finally:
+        with engine.begin() as connection:
+            connection.execute("ALTER TABLE users ADD COLUMN last_login_ip varchar(50)")
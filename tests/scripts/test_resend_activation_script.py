@@ -0,0 +1,47 @@
+"""Test resending activation emails."""
+import datetime
+
+from tm.scripts import resend_activation_script
+from tm.scripts.resend_activation_script import main
+from tm.system.mail.models import OutboxMessage
+from tm.system.user.models import Activation
+from tm.system.user.models import User
+from tm.utils.time import now
+
+
+def test_resend_activation_emails(make_config_uri, dbsession, capsys, monkeypatch):
+    """Unactivated users get a new activation link and their old link stops working."""
+    batches = []
+
+    def generate_random_strings(count, length):
+        batches.append(count)
+        return ["code{}".format(i).ljust(length, "x") for i in range(count)]
+
+    monkeypatch.setattr(resend_activation_script, "generate_random_strings", generate_random_strings)
+    old_activation = Activation(code="old", expires_at=now() + datetime.timedelta(days=1))
+    waiting = User(email="waiting@example.com", activation=old_activation)
+    new = User(email="new@example.com")
+    activated = User(email="activated@example.com", activated_at=now())
+    dbsession.add_all([waiting, new, activated])
+    dbsession.commit()
+
+    config_uri = make_config_uri(**{"mail.outbox": "true"})
+
+    main(["resend_activation_emails", config_uri, "--dry-run"])
+    assert "Would send activation emails to 2 users" in capsys.readouterr().out
+    assert dbsession.query(OutboxMessage).count() == 0
+    dbsession.rollback()
+
+    main(["resend_activation_emails", config_uri])
+    assert "Sent activation emails to 2 users, 0 failed" in capsys.readouterr().out
+
+    assert dbsession.query(Activation).filter_by(code="old").count() == 0
+    codes = {user.email: user.activation.code for user in dbsession.query(User).filter(User.activated_at.is_(None))}
+    messages = {row.recipients[0]: row.text_body for row in dbsession.query(OutboxMessage)}
+    assert set(messages) == {"waiting@example.com", "new@example.com"}
+    for email, code in codes.items():
+        assert "/activate/{}".format(code) in messages[email]
+
+    # Both codes came from one batch
+    assert batches == [2]
+    assert sorted(codes.values()) == ["code0".ljust(32, "x"), "code1".ljust(32, "x")]
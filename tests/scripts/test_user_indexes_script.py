@@ -0,0 +1,32 @@
+"""Test the lookup index migration."""
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from tm.scripts.user_indexes_script import create_missing_indexes
+from tm.scripts.user_indexes_script import get_create_index_ddl
+
+
+def get_index_names(engine) -> set:
+    return {row[0] for row in engine.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'users'"))}
+
+
+def test_create_index_ddl():
+    """Indexes are built concurrently and only if missing, without changing the declared index."""
+    from tm.system.model import config_declarative_models
+    from tm.system.user.models import User
+
+    config_declarative_models()
+
+    statements = [get_create_index_ddl(index, postgresql.dialect()) for index in User.__table__.indexes]
+    assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_lower ON users (lower(email))" in statements
+    assert not any(index.dialect_kwargs.get("postgresql_concurrently") for index in User.__table__.indexes)
+
+
+def test_create_missing_indexes(engine):
+    """Missing indexes are created, existing ones left alone."""
+    from tm.system.user.models import User
+
+    engine.execute("DROP INDEX ix_users_email_lower")
+    assert create_missing_indexes(engine, User.__table__) == ["ix_users_email_lower"]
+    assert "ix_users_email_lower" in get_index_names(engine)
+    assert create_missing_indexes(engine, User.__table__) == []
@@ -0,0 +1,45 @@
+"""Test exporting metrics to administrators."""
+import pytest
+
+from tm.scripts.createuser import create
+from tm.system.user.models import Group
+from tm.system.user.password import Argon2Hasher
+
+
+@pytest.fixture
+def login(make_app, dbsession):
+    """Log in to a fresh application as an admin or a regular user."""
+    hasher = Argon2Hasher(time_cost=1, memory_cost=1024, parallelism=1)
+    if not dbsession.query(Group).filter_by(name="admin").count():
+        dbsession.add(Group(name="admin"))
+        dbsession.flush()
+    create(dbsession, "admin", "admin@example.com", "secret", admin=True, hasher=hasher)
+    create(dbsession, "alice", "alice@example.com", "secret", hasher=hasher)
+    dbsession.commit()
+
+    def login(username):
+        app = make_app()
+        response = app.post("/oauth/token", {"grant_type": "password", "username": username, "password": "secret"})
+        app.authorization = ("Bearer", response.headers["Authorization"].split()[1])
+        return app
+
+    return login
+
+
+def test_admin_reads_metrics(login):
+    app = login("admin")
+    app.get("/users", headers={"Accept": "application/json"})
+
+    metrics = app.get("/metrics", headers={"Accept": "application/json"}).json
+    assert set(metrics) == {"counters", "observations", "gauges"}
+    assert metrics["gauges"]["db.pool.checked_out{engine=primary}"] >= 0
+    assert metrics["observations"]["db.pool.checkout_wait_seconds{engine=primary}"]["count"] >= 1
+
+
+def test_metrics_need_admin(login):
+    app = login("alice")
+    app.get("/metrics", headers={"Accept": "application/json"}, status=403)
+
+    app.authorization = None
+    response = app.get("/metrics", headers={"Accept": "application/json"}, expect_errors=True)
+    assert response.status_int in (401, 403)
@@ -0,0 +1,84 @@
+"""Test throttling."""
+import pytest
+
+from tm.system.core.throttle import MemoryThrottleStore
+from tm.system.core.throttle import Throttle
+from tm.system.core.throttle import client_network
+from tm.system.core.throttle import parse_rate
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills():
+    """Clients may burst up to the limit and then continue at the sustained rate."""
+    clock = Clock()
+    store = MemoryThrottleStore(clock=clock)
+    assert [store.take("k", 3, 60) for _ in range(3)] == [0, 0, 0]
+    assert store.take("k", 3, 60) == pytest.approx(20)
+
+    clock.now = 20
+    assert store.take("k", 3, 60) == 0
+    assert store.take("k", 3, 60) > 0
+    assert store.take("other", 3, 60) == 0
+
+
+def test_ip_limit_spares_account():
+    """Attempts rejected by the IP limit do not use up the account limit."""
+    store = MemoryThrottleStore(clock=Clock())
+    throttle = Throttle(store, {"login.ip": (2, 60), "login.account": (3, 60)})
+    assert throttle.check("login", "10.0.0.1", "Foo") == 0
+    assert throttle.check("login", "10.0.0.1", "foo") == 0
+    assert throttle.check("login", "10.0.0.1", "foo") > 0
+    assert throttle.check("login", "10.0.0.2", "FOO") == 0
+    assert throttle.check("login", "10.0.0.3", "foo") > 0
+    assert throttle.check("signup", "10.0.0.1", "foo") == 0
+
+
+def test_account_limit_spares_ip():
+    """Attempts rejected by the account limit do not use up the limit of the address, which may be shared by many users."""
+    store = MemoryThrottleStore(clock=Clock())
+    throttle = Throttle(store, {"login.ip": (3, 60), "login.account": (1, 60)})
+    assert throttle.check("login", "10.0.0.1", "foo") == 0
+    assert throttle.check("login", "10.0.0.1", "foo") > 0
+    assert throttle.check("login", "10.0.0.1", "foo") > 0
+    assert throttle.check("login", "10.0.0.1", "bar") == 0
+    assert throttle.check("login", "10.0.0.1", "baz") == 0
+    assert throttle.check("login", "10.0.0.1", "qux") > 0
+
+
+def test_refund_is_capped():
+    store = MemoryThrottleStore(clock=Clock())
+    store.refund("k", 2, 60)
+    assert [store.take("k", 2, 60) for _ in range(3)] == [0, 0, pytest.approx(30)]
+
+
+def test_throttled_login(make_app):
+    """Rejected attempts get 429 with Retry-After before the password is checked."""
+    app = make_app(**{"tm.throttle.login.ip": "1/60"})
+    params = {"grant_type": "password", "username": "foo@example.com", "password": "wrong password"}
+    app.post("/oauth/token", params, extra_environ={"REMOTE_ADDR": "10.0.0.1"}, status=401)
+
+    response = app.post("/oauth/token", params, extra_environ={"REMOTE_ADDR": "10.0.0.1"}, status=429)
+    assert response.headers["Retry-After"] == "60"
+    assert response.json["message"] == "Too many attempts, please try again later."
+
+    app.post("/oauth/token", params, extra_environ={"REMOTE_ADDR": "10.0.0.2"}, status=401)
+
+
+def test_client_network():
+    assert client_network("2001:db8::1") == client_network("2001:db8::ffff") == "2001:db8::/64"
+    assert client_network("::ffff:10.0.0.1") == "10.0.0.1"
+    assert client_network("10.0.0.1") == "10.0.0.1"
+
+
+def test_parse_rate():
+    assert parse_rate("10/300") == (10, 300)
+    assert parse_rate("0") is None
+    with pytest.raises(ValueError):
+        parse_rate("10")
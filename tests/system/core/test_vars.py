@@ -0,0 +1,38 @@
+"""Test template variables."""
+from jinja2 import DictLoader
+from jinja2 import Environment
+
+from tm.system.core.vars import find_template_variables
+from tm.system.core.vars import get_variable_names
+from tm.system.core.vars import var
+
+
+def test_find_template_variables():
+    """Names are collected through inheritance and includes, but not local assignments."""
+    env = Environment(loader=DictLoader({
+        "base.html": "{{ site_name }}{% block content %}{% endblock %}",
+        "footer.html": "{{ site_author }}",
+        "page.html": '{% extends "base.html" %}{% block content %}{% set x = 1 %}{{ x }}{{ link }}{% include "footer.html" %}{% endblock %}',
+        "dynamic.html": "{% include template_name %}",
+    }))
+    assert find_template_variables(env, "page.html") == {"site_name", "site_author", "link"}
+    assert find_template_variables(env, "dynamic.html") is None
+    assert find_template_variables(env, "missing.html") is None
+
+
+def test_get_variable_names():
+    """Variables are listed as static or per request depending on how they were last declared."""
+    from tm.system.core import vars
+
+    try:
+        var("test_volatile", per_request=True)(lambda request, registry, settings: request)
+        assert "test_volatile" in get_variable_names(per_request=True)
+        assert "test_volatile" not in get_variable_names()
+        assert "site_name" in get_variable_names()
+
+        var("test_volatile")(lambda request, registry, settings: None)
+        assert "test_volatile" not in get_variable_names(per_request=True)
+        assert "test_volatile" in get_variable_names()
+    finally:
+        vars._template_variables.pop("test_volatile", None)
+        vars._per_request_variables.discard("test_volatile")
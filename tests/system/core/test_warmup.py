@@ -0,0 +1,56 @@
+"""Test compiling templates at start up."""
+import logging
+
+import pytest
+from jinja2 import Environment
+from jinja2 import FileSystemLoader
+from pyramid import testing
+from pyramid_jinja2 import IJinja2Environment
+
+from tm.system.core.warmup import compile_template
+from tm.system.core.warmup import find_templates
+from tm.system.core.warmup import warm_up_templates
+
+
+@pytest.fixture
+def env(tmpdir):
+    """Environment over a template directory, loading each template at most once."""
+    tmpdir.join("base.html").write("<h1>{% block title %}{% endblock %}</h1>")
+    tmpdir.mkdir("email").join("welcome.body.html").write('{% extends "base.html" %}{% block title %}Hi{% endblock %}{% include "email/footer.txt" %}')
+    tmpdir.join("email", "footer.txt").write("Bye")
+    return Environment(loader=FileSystemLoader(str(tmpdir)), auto_reload=False)
+
+
+def test_find_templates(env):
+    assert find_templates(env, ".html") == ["base.html", "email/welcome.body.html"]
+    assert find_templates(env, ".txt") == ["email/footer.txt"]
+
+
+def test_compile_template(env):
+    """Extended and included templates are compiled with the referring one."""
+    seen = set()
+    compile_template(env, "email/welcome.body.html", seen)
+    assert seen == {"email/welcome.body.html", "base.html", "email/footer.txt"}
+    assert set(name for loader, name in env.cache.keys()) == seen
+
+
+def test_broken_template_is_skipped(env, tmpdir, caplog):
+    """A template which does not compile is logged, the others are still compiled."""
+    tmpdir.join("broken.html").write("{% if %}")
+    registry = testing.setUp().registry
+    registry.registerUtility(env, IJinja2Environment, name=".html")
+    try:
+        with caplog.at_level(logging.WARNING):
+            assert warm_up_templates(registry) == 3
+    finally:
+        testing.tearDown()
+
+    assert "Could not compile template broken.html: TemplateSyntaxError" in caplog.text
+    assert "email/welcome.body.html" in set(name for loader, name in env.cache.keys())
+
+
+def test_warm_up_on_application_created(make_app):
+    """Templates are compiled when the application is created."""
+    app = make_app(**{"tm.templates.warmup": "true"})
+    env = app.app.registry.getUtility(IJinja2Environment, name=".html")
+    assert "login/email/activate.body.html" in set(name for loader, name in env.cache.keys())
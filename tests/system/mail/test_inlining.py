@@ -0,0 +1,144 @@
+"""Test caching of CSS inlined email templates."""
+import json
+
+import pytest
+from jinja2 import DictLoader
+from jinja2 import Environment
+from premailer import transform
+from pyramid.registry import Registry
+from pyramid_jinja2 import IJinja2Environment
+
+from tm.system.mail import inlining
+from tm.system.mail.inlining import InlinedTemplate
+from tm.system.mail.inlining import InlinedTemplateCache
+from tm.system.mail.inlining import analyze_template
+
+
+TEMPLATES = {
+    "base.html": "<title>{{ subject }}</title>{% block content %}{% endblock %}",
+    "plain.html": '{% extends "base.html" %}{% block content %}<a href="{{ link }}">Hi {{ user.name }}</a>{% endblock %}',
+    "conditional.html": '{% extends "base.html" %}{% block content %}{% if link %}{{ link }}{% endif %}{% endblock %}',
+    "volatile.html": "{{ request.route_url('home') }}",
+    "styled.html": "<html><head><style>p {color: red}</style></head><body><p>{{ link }}</p></body></html>",
+    "css_value.html": "<html><head><style>p {color: {{ color }}}</style></head><body><p>Hi</p></body></html>",
+}
+
+
+def make_env():
+    return Environment(loader=DictLoader(TEMPLATES), autoescape=True)
+
+
+def test_analyze_template():
+    """Plain output is found through template inheritance, other uses make the variable complex."""
+    env = make_env()
+
+    analysis = analyze_template(env, "plain.html")
+    assert analysis.paths == {("subject", ), ("link", ), ("user", "name")}
+    assert not analysis.complex_names
+    assert not analysis.volatile
+
+    analysis = analyze_template(env, "conditional.html")
+    assert "link" in analysis.complex_names
+
+    assert analyze_template(env, "volatile.html").volatile
+
+
+def test_render_fills_markers():
+    """Context values are escaped into the cached output like Jinja would do."""
+    env = make_env()
+    template = InlinedTemplate("plain.html", analyze_template(env, "plain.html"))
+    template.html = env.get_template("plain.html").render(template.marker_context())
+
+    class User:
+        name = "<Mikko>"
+
+    context = dict(link="http://example.com/?a=1&b=2", user=User())
+    assert template.render(env, context) == env.get_template("plain.html").render(context)
+    assert template.can_render(context)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Inlined template cache over the test templates, counting premailer runs."""
+    env = Environment(loader=DictLoader(dict(TEMPLATES)), autoescape=True)
+    registry = Registry()
+    registry.registerUtility(env, IJinja2Environment, name=".html")
+    monkeypatch.setattr(inlining, "render", lambda name, context, request=None: env.get_template(name).render(context))
+
+    transforms = []
+
+    def counting_transform(html):
+        transforms.append(html)
+        return transform(html)
+
+    monkeypatch.setattr(inlining.premailer, "transform", counting_transform)
+
+    def make_cache(precompiled=None):
+        transforms.clear()
+        return InlinedTemplateCache(registry, precompiled)
+
+    make_cache.env = env
+    make_cache.transforms = transforms
+    return make_cache
+
+
+def full_render(cache, name, context):
+    return transform(cache.env.get_template(name).render(context))
+
+
+def test_cached_template_matches_full_render(cache):
+    """Messages are rendered from the premailer output of the first one."""
+    inlined = cache()
+    context = dict(link="http://example.com/?a=1&b=2")
+    html = inlined.render_html(None, "styled.html", context)
+    assert 'style="color:red"' in html
+    assert html == full_render(cache, "styled.html", context)
+
+    # Marker and sample renders
+    assert len(cache.transforms) == 2
+    inlined.render_html(None, "styled.html", dict(link="http://example.com/other"))
+    assert len(cache.transforms) == 2
+
+
+def test_sample_mismatch_falls_back(cache):
+    """A value inside the stylesheet does not survive premailer as a marker, so the template is rendered in full."""
+    inlined = cache()
+    assert inlined.compile(None, "css_value.html") is None
+
+    html = inlined.render_html(None, "css_value.html", dict(color="blue"))
+    assert html == full_render(cache, "css_value.html", dict(color="blue"))
+    assert 'style="color:blue"' in html
+
+
+def test_complex_names_render_in_full(cache):
+    """A context value the template tests is not filled into cached output."""
+    inlined = cache()
+    template = inlined.compile(None, "conditional.html")
+    assert template is not None
+    assert not template.can_render(dict(link="http://example.com/"))
+
+    html = inlined.render_html(None, "conditional.html", dict(subject="Hi", link="http://example.com/"))
+    assert "http://example.com/" in html
+    assert html == full_render(cache, "conditional.html", dict(subject="Hi", link="http://example.com/"))
+
+
+def test_precompiled_file(cache, tmpdir):
+    """Precompiled results are reused by the SHA-256 of their input, stale ones are ignored."""
+    path = str(tmpdir.join("inlined.json"))
+    assert InlinedTemplateCache.from_file(Registry(), path).precompiled == {}
+
+    with open(path, "wt") as f:
+        json.dump(cache().precompile(None, ["styled.html"]), f)
+
+    context = dict(link="http://example.com/")
+    inlined = InlinedTemplateCache.from_file(cache().registry, path)
+    cache.transforms.clear()
+    assert inlined.render_html(None, "styled.html", context) == full_render(cache, "styled.html", context)
+    assert cache.transforms == []
+
+    # The template changed after the file was written
+    cache.env.loader.mapping["styled.html"] = TEMPLATES["styled.html"].replace("red", "green")
+    inlined = InlinedTemplateCache.from_file(cache().registry, path)
+    html = inlined.render_html(None, "styled.html", context)
+    assert 'style="color:green"' in html
+    assert len(cache.transforms) == 2
@@ -0,0 +1,111 @@
+"""Test pooled SMTP mailer."""
+import shutil
+import smtplib
+import subprocess
+from email.message import Message
+
+import pytest
+
+from tm.system.mail.mailer import PooledSMTPMailer
+
+
+class FakeSMTP:
+    """Record connections and optionally drop the first message."""
+
+    connections = []
+
+    def __init__(self, hostname, port, timeout=None):
+        self.sent = []
+        self.does_esmtp = True
+        self.fail_next = False
+        FakeSMTP.connections.append(self)
+
+    def set_debuglevel(self, level):
+        pass
+
+    def ehlo(self):
+        return 250, b"ok"
+
+    def has_extn(self, name):
+        return False
+
+    def sendmail(self, fromaddr, toaddrs, message):
+        if self.fail_next:
+            raise smtplib.SMTPServerDisconnected("gone")
+        self.sent.append(toaddrs)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_message():
+    message = Message()
+    message["Subject"] = "Hello"
+    message.set_payload("Hi")
+    return message
+
+
+def test_connections_are_reused_and_retired():
+    """Messages share a connection until max_messages is reached."""
+    FakeSMTP.connections = []
+    mailer = PooledSMTPMailer(max_messages=2)
+    mailer.smtp = FakeSMTP
+    for i in range(5):
+        mailer.send("a@example.com", ["b@example.com"], make_message())
+    assert [len(c.sent) for c in FakeSMTP.connections] == [2, 2, 1]
+
+
+def test_reconnect_on_stale_connection():
+    """A pooled connection the server has dropped is replaced transparently."""
+    FakeSMTP.connections = []
+    mailer = PooledSMTPMailer()
+    mailer.smtp = FakeSMTP
+    mailer.send("a@example.com", ["b@example.com"], make_message())
+    FakeSMTP.connections[0].fail_next = True
+    mailer.send("a@example.com", ["b@example.com"], make_message())
+    assert len(FakeSMTP.connections) == 2
+    assert len(FakeSMTP.connections[1].sent) == 1
+
+
+def test_mailer_from_settings(tmpdir):
+    """Client certificate and sendmail settings of pyramid_mailer are honoured."""
+    from pyramid.registry import Registry
+    from tm.system.mail.utils import create_mailer
+
+    if not shutil.which("openssl"):
+        pytest.skip("openssl command not available")
+
+    keyfile, certfile = str(tmpdir.join("client.key")), str(tmpdir.join("client.pem"))
+    subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-subj", "/CN=client", "-keyout", keyfile, "-out", certfile], stderr=subprocess.DEVNULL)
+
+    registry = Registry()
+    registry.settings = {
+        "mail.host": "smtp.example.com",
+        "mail.port": "465",
+        "mail.ssl": "true",
+        "mail.keyfile": keyfile,
+        "mail.certfile": certfile,
+        "mail.sendmail_app": "/usr/local/bin/sendmail",
+        "mail.sendmail_template": "{sendmail_app} -t -i -f {sender}",
+    }
+    mailer = create_mailer(registry)
+
+    assert mailer.sendmail_mailer.sendmail_app == "/usr/local/bin/sendmail"
+    assert mailer.sendmail_mailer.sendmail_template == ["{sendmail_app}", "-t", "-i", "-f", "{sender}"]
+
+    opened = []
+
+    def smtp_ssl(hostname, port, timeout=None, context=None):
+        opened.append((hostname, port, context))
+        return FakeSMTP(hostname, port, timeout)
+
+    smtp_mailer = mailer.smtp_mailer
+    smtp_mailer.smtp_ssl = smtp_ssl
+    smtp_mailer.send("a@example.com", ["b@example.com"], make_message())
+
+    (hostname, port, context), = opened
+    assert (hostname, port) == ("smtp.example.com", "465")
+    assert context is not None
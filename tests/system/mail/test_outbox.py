@@ -0,0 +1,116 @@
+"""Test the mail outbox and its worker."""
+import datetime
+import smtplib
+
+import pytest
+from pyramid_mailer.mailer import DummyMailer
+from pyramid_mailer.message import Message
+
+from tm.system.mail.models import OutboxMessage
+from tm.system.mail.outbox import OutboxWorker
+from tm.system.mail.outbox import enqueue_message
+from tm.system.mail.outbox import get_retry_delay
+from tm.system.mail.outbox import to_message
+from tm.system.model.meta import get_session_factory
+from tm.utils.time import now
+
+
+def test_retry_delay_grows_and_is_capped():
+    """Retries back off exponentially with jitter, up to the maximum."""
+    for attempts, low, high in ((1, 15, 30), (2, 30, 60), (3, 60, 120), (20, 1800, 3600)):
+        delay = get_retry_delay(attempts, base=30, maximum=3600)
+        assert low <= delay <= high
+
+
+@pytest.fixture
+def worker(engine):
+    return OutboxWorker(get_session_factory(engine), DummyMailer(), max_attempts=2)
+
+
+@pytest.fixture
+def queued(dbsession):
+    """Id of a message waiting in the outbox."""
+    row = enqueue_message(dbsession, Message(subject="Hello", sender="noreply@example.com", recipients=["foo@example.com"], body="Hi"))
+    dbsession.commit()
+    return row.id
+
+
+def load(dbsession, row_id) -> OutboxMessage:
+    """Load the row as committed by the worker, in a fresh transaction."""
+    dbsession.rollback()
+    return dbsession.query(OutboxMessage).get(row_id)
+
+
+class FailingMailer:
+
+    def send_immediately(self, message):
+        raise smtplib.SMTPServerDisconnected("gone")
+
+
+def test_enqueue(queued, dbsession):
+    row = load(dbsession, queued)
+    assert row.status == OutboxMessage.PENDING
+    assert row.attempts == 0
+    assert row.recipients == ["foo@example.com"]
+    assert to_message(row).subject == "Hello"
+
+
+def test_claim(queued, worker, dbsession):
+    """Claimed messages count an attempt and are not due again until the claim expires."""
+    claimed = worker.claim()
+    assert [(row_id, message.subject) for row_id, message in claimed] == [(queued, "Hello")]
+    assert worker.claim() == []
+
+    row = load(dbsession, queued)
+    assert row.attempts == 1
+    assert row.next_attempt_at > now() + datetime.timedelta(seconds=worker.claim_timeout - 60)
+
+
+def test_send_without_row_locks(queued, worker, engine):
+    """The message is sent after the claim has committed and released its locks."""
+    locked = []
+
+    class LockCheckingMailer(DummyMailer):
+
+        def send_immediately(self, message, fail_silently=False):
+            with engine.begin() as connection:
+                connection.execute("SET LOCAL lock_timeout = '1s'")
+                locked.append(connection.execute("SELECT id FROM mail_outbox WHERE id = %s FOR UPDATE NOWAIT", queued).scalar())
+            super().send_immediately(message, fail_silently)
+
+    worker.mailer = LockCheckingMailer()
+    assert worker.drain() == 1
+    assert locked == [queued]
+    assert len(worker.mailer.outbox) == 1
+
+
+def test_sent(queued, worker, dbsession):
+    assert worker.process_batch() == 1
+    assert [message.recipients for message in worker.mailer.outbox] == [["foo@example.com"]]
+
+    row = load(dbsession, queued)
+    assert row.status == OutboxMessage.SENT
+    assert row.sent_at
+    assert row.last_error is None
+
+
+def test_retry_and_give_up(queued, worker, dbsession):
+    """Failed messages are retried later and given up after max_attempts."""
+    worker.mailer = FailingMailer()
+    assert worker.process_batch() == 1
+
+    row = load(dbsession, queued)
+    assert row.status == OutboxMessage.PENDING
+    assert row.attempts == 1
+    assert row.last_error == "SMTPServerDisconnected: gone"
+    assert row.next_attempt_at > now()
+
+    # Make the retry due
+    row.next_attempt_at = now()
+    dbsession.commit()
+    assert worker.process_batch() == 1
+
+    row = load(dbsession, queued)
+    assert row.status == OutboxMessage.FAILED
+    assert row.attempts == 2
+    assert worker.process_batch() == 0
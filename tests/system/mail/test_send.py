@@ -0,0 +1,61 @@
+"""Test sending templated email."""
+from email.header import decode_header
+from email.header import make_header
+from email.utils import parseaddr
+
+import pytest
+from pyramid import testing
+from pyramid.scripting import prepare
+
+from tm.system.mail import get_default_sender
+from tm.system.mail import send_templated_mails
+from tm.system.mail.models import OutboxMessage
+
+
+def test_default_sender():
+    registry = testing.setUp(settings={"mail.default_sender": "noreply@example.com"}).registry
+    try:
+        assert get_default_sender(registry) == "noreply@example.com"
+        registry.settings["mail.default_sender_name"] = "Åke's Shop"
+        name, address = parseaddr(get_default_sender(registry))
+        assert str(make_header(decode_header(name))) == "Åke's Shop"
+        assert address == "noreply@example.com"
+    finally:
+        testing.tearDown()
+
+
+@pytest.fixture
+def request_(make_app):
+    """Request of an application with the mail outbox, inside a transaction."""
+    app = make_app(**{"mail.outbox": "true"})
+    env = prepare(registry=app.app.registry)
+    request = env["request"]
+    request.tm.begin()
+    yield request
+    request.tm.abort()
+    env["closer"]()
+
+
+def test_send_templated_mails(request_, monkeypatch):
+    """Failed messages are skipped and queued rows are flushed after every flush_every queued messages."""
+    flushed = []
+    flush = request_.dbsession.flush
+
+    def counting_flush(*args, **kwargs):
+        flushed.append(sum(isinstance(obj, OutboxMessage) for obj in request_.dbsession.new))
+        flush(*args, **kwargs)
+
+    monkeypatch.setattr(request_.dbsession, "flush", counting_flush)
+
+    context = {"link": "http://localhost:8080/activate/abc", "expiration_hours": 24}
+    recipients = [[], ["a@example.com"], ["b@example.com"], [], ["c@example.com"]]
+    messages = ((r, context) for r in recipients)
+
+    sent, failed = send_templated_mails(request_, "login/email/activate", messages, flush_every=2)
+    assert (sent, failed) == (3, 2)
+    assert flushed == [2]
+
+    rows = request_.dbsession.query(OutboxMessage).order_by(OutboxMessage.id).all()
+    assert [row.recipients for row in rows] == [["a@example.com"], ["b@example.com"], ["c@example.com"]]
+    assert rows[0].sender == "noreply@example.com"
+    assert "http://localhost:8080/activate/abc" in rows[0].text_body
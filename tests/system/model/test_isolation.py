@@ -0,0 +1,86 @@
+"""Test per-view transaction isolation helpers."""
+import pytest
+import sqlalchemy.exc
+
+from tm.system.model.isolation import is_serialization_failure
+from tm.system.model.isolation import normalize_isolation_level
+
+
+class FakePgError(Exception):
+
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def test_normalize_isolation_level():
+    """Setting style names are turned into SQL."""
+    assert normalize_isolation_level("read_committed") == "READ COMMITTED"
+    assert normalize_isolation_level("Serializable") == "SERIALIZABLE"
+    with pytest.raises(ValueError):
+        normalize_isolation_level("chaos")
+
+
+def test_is_serialization_failure():
+    """Serialization failures are recognized also when wrapped in another exception."""
+    failure = sqlalchemy.exc.OperationalError("COMMIT", {}, FakePgError("40001"))
+    assert is_serialization_failure(failure)
+
+    try:
+        try:
+            raise failure
+        except Exception as e:
+            raise RuntimeError("Commit failed") from e
+    except RuntimeError as e:
+        assert is_serialization_failure(e)
+
+    assert not is_serialization_failure(sqlalchemy.exc.IntegrityError("INSERT", {}, FakePgError("23505")))
+    assert not is_serialization_failure(ValueError())
+
+
+def show_transaction(request):
+    connection = request.dbsession.connection()
+    return {name: connection.execute("SHOW " + name).scalar() for name in ("transaction_isolation", "transaction_read_only")}
+
+
+def conflict(request):
+    request.dbsession.execute("DO $$ BEGIN RAISE EXCEPTION USING ERRCODE = 'serialization_failure'; END $$")
+
+
+def includeme(config):
+    """Views declaring transaction characteristics, included through ``pyramid.includes``."""
+    for name, options in (("default", {}), ("read_only", {"read_only": True}), ("read_committed", {"isolation_level": "read_committed"})):
+        config.add_route("isolation_" + name, "/isolation/" + name)
+        config.add_view(show_transaction, route_name="isolation_" + name, renderer="json", **options)
+
+    config.add_route("isolation_conflict", "/isolation/conflict")
+    config.add_view(conflict, route_name="isolation_conflict", renderer="json")
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(**{"pyramid.includes": __name__, "retry.attempts": "3"})
+
+
+@pytest.mark.parametrize("view, isolation_level, read_only", [
+    ("default", "serializable", "off"),
+    ("read_only", "repeatable read", "on"),
+    ("read_committed", "read committed", "off"),
+])
+def test_view_transaction(app, view, isolation_level, read_only):
+    """Views run in the transaction they declared."""
+    response = app.get("/isolation/" + view)
+    assert response.json == {"transaction_isolation": isolation_level, "transaction_read_only": read_only}
+
+
+def test_serialization_failures_counted_per_route(app):
+    """Every attempt failing on a serialization error is counted, labelled with whether it is retried."""
+    from tm.system.core.utils import get_metrics
+
+    with pytest.raises(sqlalchemy.exc.OperationalError):
+        app.get("/isolation/conflict")
+
+    counters = get_metrics(app.app.registry).snapshot()["counters"]
+    assert counters["db.serialization_failures{retried=True,route=isolation_conflict}"] == 2
+    assert counters["db.serialization_failures{retried=False,route=isolation_conflict}"] == 1
+    assert not any(key.startswith("db.serialization_failures") and "route=isolation_default" in key for key in counters)
@@ -0,0 +1,72 @@
+"""Test connection pool sizing and metrics."""
+import pytest
+import sqlalchemy.exc
+from sqlalchemy import create_engine
+
+from tm.system.model.pool import InstrumentedQueuePool
+from tm.system.model.pool import get_pool_options
+from tm.system.model.pool import instrument_engine
+from tm.utils.metrics import Metrics
+
+
+def test_pool_sized_after_server_threads():
+    """Pool size and overflow follow the server thread count unless set explicitly."""
+    options = get_pool_options({"tm.db.server_threads": "8"})
+    assert options["pool_size"] == 8
+    assert options["max_overflow"] == 4
+
+    options = get_pool_options({"tm.db.server_threads": "8", "sqlalchemy.pool_size": "20", "sqlalchemy.pool_pre_ping": "false"})
+    assert "pool_size" not in options
+    assert options["pool_pre_ping"] is False
+
+
+@pytest.fixture
+def engine(tmpdir):
+    """Instrumented engine with room for one pooled and one overflow connection."""
+    engine = create_engine("sqlite:///" + str(tmpdir.join("pool.sqlite")), poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=1, pool_timeout=0.1)
+    yield engine
+    engine.dispose()
+
+
+def test_pool_metrics(engine):
+    """Checkouts past the pool size show up as overflow, waits and timeouts are observed, invalidations counted."""
+    metrics = Metrics()
+    instrument_engine(engine, metrics, "primary")
+
+    first, second = engine.connect(), engine.connect()
+    snapshot = metrics.snapshot()
+    assert snapshot["gauges"] == {"db.pool.checked_out{engine=primary}": 2, "db.pool.size{engine=primary}": 1, "db.pool.overflow{engine=primary}": 1}
+    assert snapshot["counters"]["db.pool.connects{engine=primary}"] == 2
+
+    with pytest.raises(sqlalchemy.exc.TimeoutError):
+        engine.connect()
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["db.pool.checkout_timeouts{engine=primary}"] == 1
+    wait = snapshot["observations"]["db.pool.checkout_wait_seconds{engine=primary}"]
+    assert wait["count"] == 3
+    assert wait["max"] >= 0.1
+
+    first.invalidate()
+    first.close()
+    second.close()
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["db.pool.invalidations{engine=primary}"] == 1
+    assert snapshot["gauges"]["db.pool.checked_out{engine=primary}"] == 0
+    assert snapshot["gauges"]["db.pool.overflow{engine=primary}"] == 0
+
+
+def test_metrics_follow_disposed_pool(engine):
+    """Engine.dispose() replaces the pool, gauges and checkout observation move to the new one."""
+    metrics = Metrics()
+    instrument_engine(engine, metrics, "primary")
+    engine.connect().close()
+
+    engine.dispose()
+    connection = engine.connect()
+
+    snapshot = metrics.snapshot()
+    assert snapshot["gauges"]["db.pool.checked_out{engine=primary}"] == 1
+    assert snapshot["observations"]["db.pool.checkout_wait_seconds{engine=primary}"]["count"] == 2
+    connection.close()
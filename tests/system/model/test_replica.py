@@ -0,0 +1,97 @@
+"""Test routing reads to a read replica."""
+import pytest
+from sqlalchemy import Column
+from sqlalchemy import MetaData
+from sqlalchemy import String
+from sqlalchemy import Table
+from sqlalchemy import create_engine
+from sqlalchemy import select
+
+from tm.system.model.meta import get_engine
+from tm.system.model.meta import get_replica_engine
+from tm.system.model.meta import get_session_factory
+from tm.system.model.replica import replica_reads
+
+
+metadata = MetaData()
+
+source = Table("source", metadata, Column("name", String))
+
+
+@pytest.fixture
+def session():
+    """Session over two SQLite databases, telling which one answered."""
+    engines = {}
+    for name in ("primary", "replica"):
+        engines[name] = create_engine("sqlite://")
+        metadata.create_all(engines[name])
+        engines[name].execute(source.insert().values(name=name))
+
+    session = get_session_factory(engines["primary"], engines["replica"])()
+    yield session
+    session.close()
+
+
+def read(session) -> str:
+    return session.execute(select([source.c.name]).limit(1)).scalar()
+
+
+def test_reads_go_to_primary_by_default(session):
+    assert read(session) == "primary"
+
+
+def test_replica_reads(session):
+    with replica_reads(session):
+        assert read(session) == "replica"
+        with replica_reads(session):
+            assert read(session) == "replica"
+        assert read(session) == "replica"
+    assert read(session) == "primary"
+
+
+def test_read_only_transaction_reads_replica(session):
+    session.info["tm.isolation"] = ("REPEATABLE READ", True)
+    assert read(session) == "replica"
+
+
+def test_sticky_after_write(session):
+    """Writes go to the primary and later reads of the session follow them."""
+    with replica_reads(session):
+        assert read(session) == "replica"
+        session.execute(source.insert().values(name="written"))
+        assert read(session) == "primary"
+        assert session.execute(select([source.c.name]).where(source.c.name == "written")).scalar() == "written"
+    session.commit()
+
+    with replica_reads(session):
+        assert read(session) == "primary"
+
+
+def test_no_replica():
+    """Without a replica everything goes to the primary."""
+    assert get_replica_engine({"sqlalchemy.url": "sqlite://"}) is None
+
+    engine = create_engine("sqlite://")
+    session = get_session_factory(engine)()
+    with replica_reads(session):
+        assert session.get_bind() is engine
+    session.close()
+
+
+def test_replica_engine_settings():
+    """Replica keys are nested under the primary ones and only picked by the replica engine."""
+    settings = {
+        "sqlalchemy.url": "postgresql://db-primary/tm",
+        "sqlalchemy.pool_size": "3",
+        "sqlalchemy.replica.url": "postgresql://db-replica/tm",
+        "sqlalchemy.replica.pool_size": "7",
+    }
+
+    engine = get_engine(settings)
+    assert engine.url.host == "db-primary"
+    assert engine.pool.size() == 3
+
+    replica_engine = get_replica_engine(settings)
+    assert replica_engine.url.host == "db-replica"
+    assert replica_engine.pool.size() == 7
+    assert replica_engine.dialect.isolation_level == "REPEATABLE READ"
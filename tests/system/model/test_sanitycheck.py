@@ -0,0 +1,54 @@
+"""Test the database sanity check and its fingerprint cache."""
+import pytest
+
+from tm.system.model import sanitycheck
+from tm.system.model.meta import Base
+from tm.system.model.sanitycheck import is_sane_database
+from tm.system.model.sanitycheck import model_schema_fingerprint
+from tm.system.model.sanitycheck import read_fingerprint
+from tm.system.model.sanitycheck import write_fingerprint
+
+
+@pytest.fixture
+def cache_file(tmpdir):
+    return str(tmpdir.join("sanity.fingerprint"))
+
+
+def test_fingerprint_read_write(cache_file):
+    assert read_fingerprint(cache_file) is None
+    write_fingerprint(cache_file, "abc")
+    assert read_fingerprint(cache_file) == "abc"
+    write_fingerprint(cache_file, "def")
+    assert read_fingerprint(cache_file) == "def"
+
+
+def test_unchanged_schema_skips_reflection(dbsession, cache_file, monkeypatch):
+    """A stored fingerprint of a passed check skips the reflection."""
+    assert is_sane_database(Base, dbsession, cache_file)
+    assert read_fingerprint(cache_file) == model_schema_fingerprint(Base, dbsession.connection())
+
+    def inspect(*args):
+        raise AssertionError("Database was reflected")
+
+    monkeypatch.setattr(sanitycheck, "inspect", inspect)
+    assert is_sane_database(Base, dbsession, cache_file)
+
+
+def test_changed_schema_checks_again(engine, dbsession, cache_file):
+    """Changes to the live database schema invalidate the stored fingerprint."""
+    assert is_sane_database(Base, dbsession, cache_file)
+    before = read_fingerprint(cache_file)
+    dbsession.close()
+
+    with engine.begin() as connection:
+        connection.execute("ALTER TABLE users DROP COLUMN last_login_ip")
+    try:
+        assert model_schema_fingerprint(Base, dbsession.connection()) != before
+        assert not is_sane_database(Base, dbsession, cache_file)
+        assert read_fingerprint(cache_file) == before
+    finally:
+        dbsession.close()
+        with engine.begin() as connection:
+            connection.execute("ALTER TABLE users ADD COLUMN last_login_ip varchar(50)")
+
+    assert model_schema_fingerprint(Base, dbsession.connection()) == before
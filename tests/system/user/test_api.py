@@ -0,0 +1,62 @@
+"""Test the user API views."""
+import pytest
+
+from tm.scripts.createuser import create
+from tm.system.user.models import User
+from tm.system.user.password import Argon2Hasher
+
+
+@pytest.fixture
+def app(make_app, dbsession):
+    """Application with five named users, authenticated as the first one."""
+    hasher = Argon2Hasher(time_cost=1, memory_cost=1024, parallelism=1)
+    create(dbsession, "alice", "alice@example.com", "secret", hasher=hasher)
+    dbsession.add_all([User(email="user{}@example.com".format(i), user_data={"full_name": "User {}".format(i)}) for i in range(1, 5)])
+    dbsession.commit()
+
+    app = make_app()
+    response = app.post("/oauth/token", {"grant_type": "password", "username": "alice", "password": "secret"})
+    app.authorization = ("Bearer", response.headers["Authorization"].split()[1])
+    return app
+
+
+def get_ids(dbsession) -> list:
+    return [user.id for user in dbsession.query(User).order_by(User.id)]
+
+
+def test_list_users(app):
+    response = app.get("/users", headers={"Accept": "application/json"})
+    assert response.json == [None, "User 1", "User 2", "User 3", "User 4"]
+    assert "Link" not in response.headers
+
+
+def test_list_users_by_page(app, dbsession):
+    """Pages link to the next page until the last one."""
+    ids = get_ids(dbsession)
+
+    response = app.get("/users", {"limit": 2}, headers={"Accept": "application/json"})
+    assert response.json == [None, "User 1"]
+    assert response.headers["Link"] == '<http://localhost/users?after={}&limit=2>; rel="next"'.format(ids[1])
+
+    response = app.get("/users", {"after": ids[1], "limit": 2}, headers={"Accept": "application/json"})
+    assert response.json == ["User 2", "User 3"]
+
+    response = app.get("/users", {"after": ids[3], "limit": 2}, headers={"Accept": "application/json"})
+    assert response.json == ["User 4"]
+    assert "Link" not in response.headers
+
+    # A page exactly filled by the last users has no next page
+    response = app.get("/users", {"after": ids[2], "limit": 2}, headers={"Accept": "application/json"})
+    assert response.json == ["User 3", "User 4"]
+    assert "Link" not in response.headers
+
+
+@pytest.mark.parametrize("params", [{"limit": 0}, {"limit": "x"}, {"after": -1}, {"limit": 100000}])
+def test_list_users_bad_params(app, params):
+    app.get("/users", params, headers={"Accept": "application/json"}, status=400)
+
+
+def test_list_users_needs_login(app):
+    app.authorization = None
+    response = app.get("/users", headers={"Accept": "application/json"}, expect_errors=True)
+    assert response.status_int in (401, 403)
@@ -0,0 +1,65 @@
+"""Test authorization code stores."""
+import pytest
+from pyramid import testing
+
+from tm.system.user.authcodes import MemoryAuthorizationCodeStore
+from tm.system.user.authcodes import SQLAuthorizationCodeStore
+from tm.system.user.authcodes import get_authorization_code_store
+from tm.system.user.interfaces import IAuthorizationCodeStore
+from tm.system.user.models import Group
+from tm.system.user.models import User
+from tm.system.user.userregistry import UserRegistry
+
+
+class FakeUser:
+    id = 1
+
+
+def test_code_is_used_once():
+    """Codes can be exchanged once and only by the user they were issued to."""
+    store = MemoryAuthorizationCodeStore()
+    code = store.create(None, FakeUser(), 30)
+    assert len(code) == 32
+    assert store.consume(None, "1", code)
+    assert not store.consume(None, 1, code)
+
+    code = store.create(None, FakeUser(), 30)
+    assert not store.consume(None, 2, code)
+    assert not store.consume(None, 1, code)
+
+
+def test_code_expires():
+    store = MemoryAuthorizationCodeStore()
+    code = store.create(None, FakeUser(), 0)
+    assert not store.consume(None, 1, code)
+
+
+def test_database_store_is_default(make_app):
+    app = make_app()
+    assert isinstance(get_authorization_code_store(app.app.registry), SQLAuthorizationCodeStore)
+
+
+@pytest.mark.parametrize("store", [MemoryAuthorizationCodeStore(), SQLAuthorizationCodeStore()], ids=["memory", "sql"])
+def test_validate_authorization_code(dbsession, store):
+    """The user is returned with the groups needed for the access token already loaded."""
+    user = User(email="foo@example.com", groups=[Group(name="admin")])
+    dbsession.add(user)
+    dbsession.flush()
+
+    registry = testing.setUp().registry
+    registry.registerUtility(store, IAuthorizationCodeStore)
+    try:
+        request = testing.DummyRequest(dbsession=dbsession, registry=registry)
+        code = store.create(request, user, 30)
+        user_id = user.id
+        dbsession.commit()
+        dbsession.expunge_all()
+
+        user_registry = UserRegistry(request)
+        user = user_registry.validate_authorization_code(user_id, code)
+        assert user.id == user_id
+        assert "groups" in user.__dict__
+        assert [group.name for group in user.groups] == ["admin"]
+        assert user_registry.validate_authorization_code(user_id, code) is None
+    finally:
+        testing.tearDown()
@@ -0,0 +1,221 @@
+"""Test caching users between requests."""
+import pytest
+from pyramid import testing
+from sqlalchemy import event
+
+from tm.system.user.cache import LRUGroupMembershipCache
+from tm.system.user.cache import LRUUserCache
+from tm.system.user.cache import invalidate_users
+from tm.system.user.cache import restore_user
+from tm.system.user.cache import snapshot_user
+from tm.system.user.cache import watch_group_membership_changes
+from tm.system.user.cache import watch_user_changes
+from tm.system.user.interfaces import IGroupMembershipCache
+from tm.system.user.interfaces import IUserCache
+from tm.system.user.models import Group
+from tm.system.user.models import User
+from tm.system.user.models import UserGroup
+from tm.system.user.userregistry import UserRegistry
+
+
+@pytest.fixture
+def user(dbsession):
+    u = User(email="foo@example.com", username="foo", user_data={"full_name": "Foo Bar"})
+    dbsession.add(u)
+    dbsession.commit()
+    return u
+
+
+@pytest.fixture
+def statements(engine):
+    """SQL statements sent to the database during the test."""
+    sent = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        sent.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield sent
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_restore_snapshot_without_sql(user, dbsession, statements):
+    """A user rebuilt from a snapshot has the same columns and is attached without a query."""
+    state = snapshot_user(user)
+    user_id = user.id
+    dbsession.expunge_all()
+    del statements[:]
+
+    restored = restore_user(dbsession, User, state)
+    assert restored.id == user_id
+    assert restored.email == "foo@example.com"
+    assert restored.full_name == "Foo Bar"
+    assert restored in dbsession
+    assert statements == []
+
+    # The snapshot is a copy, changing the restored user does not change the cached state
+    restored.user_data["full_name"] = "Changed"
+    assert state["user_data"]["full_name"] == "Foo Bar"
+
+
+def test_snapshot_leaves_out_password(user, dbsession, statements):
+    """Password hashes are not cached, a restored user loads it from the database when asked."""
+    user.hashed_password = "$argon2id$v=19$m=8,t=1,p=1$c2FsdHNhbHQ$aGFzaA"
+    dbsession.commit()
+
+    state = snapshot_user(user)
+    assert "hashed_password" not in state
+    dbsession.expunge_all()
+
+    restored = restore_user(dbsession, User, state)
+    del statements[:]
+    assert restored.hashed_password == "$argon2id$v=19$m=8,t=1,p=1$c2FsdHNhbHQ$aGFzaA"
+    assert len(statements) == 1
+
+    # Changing other columns of a restored user keeps the stored hash
+    dbsession.expunge_all()
+    restored = restore_user(dbsession, User, state)
+    restored.username = "changed"
+    dbsession.commit()
+    dbsession.expunge_all()
+    assert dbsession.query(User).get(user.id).hashed_password == "$argon2id$v=19$m=8,t=1,p=1$c2FsdHNhbHQ$aGFzaA"
+
+
+def test_flush_and_commit_evict(engine):
+    """Users changed in a flush are dropped at the flush and again after the commit."""
+    from tm.system.model.meta import get_session_factory
+
+    session_factory = get_session_factory(engine)
+    cache = LRUUserCache()
+    watch_user_changes(session_factory, cache)
+
+    session = session_factory()
+    user = User(email="foo@example.com")
+    session.add(user)
+    session.commit()
+
+    cache.set(user.id, snapshot_user(user))
+    user.enabled = False
+    session.flush()
+    assert cache.get(user.id) is None
+
+    # A concurrent request caching the old row between our flush and commit
+    cache.set(user.id, {"id": user.id})
+    session.commit()
+    assert cache.get(user.id) is None
+    session.close()
+
+
+def test_get_cached_user_by_id(user, dbsession, statements):
+    """The first lookup loads the user, later ones come from the cache until invalidated."""
+    registry = testing.setUp().registry
+    cache = LRUUserCache()
+    registry.registerUtility(cache, IUserCache)
+    try:
+        user_registry = UserRegistry(testing.DummyRequest(dbsession=dbsession, registry=registry))
+        user_id = user.id
+        dbsession.expunge_all()
+        del statements[:]
+
+        assert user_registry.get_cached_user_by_id(str(user_id)).email == "foo@example.com"
+        assert len(statements) == 1
+
+        dbsession.expunge_all()
+        assert user_registry.get_cached_user_by_id(user_id).email == "foo@example.com"
+        assert len(statements) == 1
+
+        invalidate_users(registry, [user_id])
+        dbsession.expunge_all()
+        assert user_registry.get_cached_user_by_id(user_id).email == "foo@example.com"
+        assert len(statements) == 2
+
+        assert user_registry.get_cached_user_by_id(user_id + 1) is None
+    finally:
+        testing.tearDown()
+
+
+def test_group_membership_cache():
+    cache = LRUGroupMembershipCache()
+    cache.set(1, ["admin", "editors"])
+    assert cache.get(1) == frozenset({"admin", "editors"})
+    cache.invalidate(1)
+    assert cache.get(1) is None
+
+    cache.set(1, {"admin"})
+    cache.set(2, {"editors"})
+    cache.clear()
+    assert cache.get(1) is None and cache.get(2) is None
+
+
+@pytest.fixture
+def membership(engine):
+    """Session factory watched by a membership cache, a user and two groups."""
+    from tm.system.model.meta import get_session_factory
+
+    session_factory = get_session_factory(engine)
+    cache = LRUGroupMembershipCache()
+    watch_group_membership_changes(session_factory, cache)
+
+    session = session_factory()
+    user = User(email="foo@example.com")
+    editors = Group(name="editors")
+    admins = Group(name="admin")
+    session.add_all([user, editors, admins])
+    session.commit()
+    yield session, cache, user, editors, admins
+    session.close()
+
+
+def test_membership_changes_evict(membership):
+    """Adding and removing members from either side drops the cached membership of the user."""
+    session, cache, user, editors, admins = membership
+
+    cache.set(user.id, set())
+    user.groups.append(editors)
+    session.commit()
+    assert cache.get(user.id) is None
+
+    cache.set(user.id, {"editors"})
+    admins.users.append(user)
+    session.commit()
+    assert cache.get(user.id) is None
+
+    cache.set(user.id, {"editors", "admin"})
+    session.delete(session.query(UserGroup).filter_by(user_id=user.id, group_id=editors.id).one())
+    session.commit()
+    assert cache.get(user.id) is None
+
+
+def test_group_rename_clears_all(membership):
+    session, cache, user, editors, admins = membership
+    cache.set(user.id, {"editors"})
+    cache.set(user.id + 1, {"admin"})
+    editors.name = "writers"
+    session.commit()
+    assert cache.get(user.id) is None
+    assert cache.get(user.id + 1) is None
+
+
+def test_principals_use_cached_groups(user, dbsession, statements):
+    """Group principals come from the membership cache instead of the token or the database."""
+    from tm.system.auth.principals import resolve_principals
+
+    registry = testing.setUp().registry
+    cache = LRUGroupMembershipCache()
+    registry.registerUtility(cache, IGroupMembershipCache)
+    try:
+        cache.set(user.id, {"editors"})
+        dbsession.expire(user, ["groups"])
+        del statements[:]
+
+        request = testing.DummyRequest(dbsession=dbsession, registry=registry, user=user)
+        request.jwt_claims = {"principals": ["system.Authenticated", "group:admin", "user:{}".format(user.id)]}
+        assert resolve_principals("token", request) == ["system.Authenticated", "user:{}".format(user.id), "group:editors"]
+        assert UserRegistry(request).is_admin(user) is False
+        assert statements == []
+
+        cache.invalidate(user.id)
+        assert UserRegistry(request).get_group_names(user) == frozenset()
+        assert len(statements) == 1
+    finally:
+        testing.tearDown()
@@ -0,0 +1,142 @@
+"""Test bulk user import helpers."""
+# Standard Library
+import io
+
+import argon2
+import pytest
+from sqlalchemy import event
+
+from tm.system.user.importer import UserImporter
+from tm.system.user.importer import chunked
+from tm.system.user.importer import guess_format
+from tm.system.user.importer import is_password_hash
+from tm.system.user.importer import read_records
+from tm.system.user.models import User
+
+
+def test_read_csv_and_jsonl():
+    """Both input formats give the same records."""
+    csv_input = io.StringIO('email,username,password\nfoo@example.com,foo,"se,cret"\n')
+    jsonl_input = io.StringIO('{"email": "foo@example.com", "username": "foo", "password": "se,cret"}\n\n')
+    assert list(read_records(csv_input, "csv")) == list(read_records(jsonl_input, "jsonl"))
+    assert guess_format("users.JSONL") == "jsonl"
+    assert guess_format("-") == "csv"
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+def test_clean_skips_invalid_and_duplicates():
+    """Emails and usernames repeating earlier input are dropped case insensitively, also across chunks."""
+    importer = UserImporter(engine=None, workers=1)
+    first = importer.clean([
+        {"email": " Foo@Example.com ", "username": "foo", "password": "x"},
+        {"email": "not an email"},
+        {"email": "foo@example.COM"},
+    ])
+    second = importer.clean([
+        {"email": "bar@example.com", "username": "FOO"},
+        {"email": "baz@example.com", "hashed_password": "$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA"},
+    ])
+
+    assert [record["email"] for record in first + second] == ["Foo@Example.com", "baz@example.com"]
+    assert importer.stats.read == 5
+    assert importer.stats.invalid == 1
+    assert importer.stats.duplicate == 2
+    assert is_password_hash(second[0]["hashed_password"])
+    assert second[0]["password"] is None
+    assert first[0]["password"] == "x"
+    assert first[0]["hashed_password"] is None
+
+
+def test_clean_rejects_foreign_hashes():
+    """Only Argon 2 hashes are accepted, plain text passwords are never taken for hashes."""
+    importer = UserImporter(engine=None, workers=1)
+    cleaned = importer.clean([
+        {"email": "bcrypt@example.com", "hashed_password": "$2b$12$R9h/cIPz0gi.URNNX3kh2OPST9/PgBkqquzi.Ss7KIUgO2t0jWMUW"},
+        {"email": "pbkdf2@example.com", "hashed_password": "pbkdf2_sha256$260000$salt$hash"},
+        {"email": "plain@example.com", "password": "$argon2 is my password"},
+    ])
+    assert [record["email"] for record in cleaned] == ["plain@example.com"]
+    assert cleaned[0]["password"] == "$argon2 is my password"
+    assert importer.stats.invalid == 2
+
+
+@pytest.fixture
+def hasher():
+    return argon2.PasswordHasher(time_cost=1, memory_cost=1024, parallelism=1)
+
+
+def test_drop_existing(engine, dbsession):
+    """Records whose email or username is taken are dropped regardless of case."""
+    dbsession.add(User(email="Foo@Example.com", username="bar"))
+    dbsession.commit()
+
+    importer = UserImporter(engine, workers=1)
+    records = importer.clean([
+        {"email": "foo@example.COM"},
+        {"email": "other@example.com", "username": "BAR"},
+        {"email": "new@example.com", "username": "new"},
+    ])
+    with engine.connect() as connection:
+        fresh = importer.drop_existing(connection, records)
+    assert [record["email"] for record in fresh] == ["new@example.com"]
+    assert importer.stats.existing == 2
+
+
+def test_import_with_copy(engine, dbsession, hasher):
+    """Users are inserted with COPY, plain text passwords hashed and Argon 2 hashes kept."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with UserImporter(engine, hasher=hasher, workers=1, source="legacy") as importer:
+            stats = importer.run([
+                {"email": "foo@example.com", "username": "foo", "password": "secret", "full_name": "Foo Bar"},
+                {"email": "bar@example.com", "hashed_password": hasher.hash("other")},
+                {"email": "baz@example.com"},
+            ], chunk_size=2)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    assert (stats.read, stats.inserted, stats.invalid) == (3, 3, 0)
+    assert not any(statement.lstrip().upper().startswith("INSERT") for statement in statements)
+
+    users = {user.email: user for user in dbsession.query(User)}
+    assert hasher.verify(users["foo@example.com"].hashed_password, "secret")
+    assert hasher.verify(users["bar@example.com"].hashed_password, "other")
+    assert users["baz@example.com"].hashed_password is None
+    assert users["foo@example.com"].full_name == "Foo Bar"
+    assert users["foo@example.com"].registration_source == "legacy"
+    assert users["foo@example.com"].is_activated()
+    assert users["foo@example.com"].username == "foo"
+
+    # Running the same import again inserts nothing
+    with UserImporter(engine, hasher=hasher, workers=1) as importer:
+        stats = importer.run([{"email": "FOO@example.com"}])
+    assert (stats.inserted, stats.existing) == (0, 1)
+
+
+def test_conflicting_sign_up_retries_chunk(engine, dbsession, monkeypatch):
+    """A user created between the check and the insert makes the chunk start over without that user."""
+    importer = UserImporter(engine, workers=1)
+    records = importer.clean([{"email": "foo@example.com"}, {"email": "bar@example.com"}])
+    copy_rows = importer.copy_rows
+
+    def sign_up_and_copy(connection, rows):
+        if not dbsession.query(User).count():
+            dbsession.add(User(email="foo@example.com"))
+            dbsession.commit()
+        copy_rows(connection, rows)
+
+    monkeypatch.setattr(importer, "copy_rows", sign_up_and_copy)
+    assert importer.insert(records) == 1
+    assert importer.stats.existing == 1
+
+    dbsession.rollback()
+    assert sorted(user.email for user in dbsession.query(User)) == ["bar@example.com", "foo@example.com"]
@@ -0,0 +1,160 @@
+"""Test password hashing."""
+# Standard Library
+import threading
+
+import pytest
+
+from tm.system.user.interfaces import PasswordHashingBusy
+from tm.system.user.password import Argon2Hasher
+from tm.system.user.password import HashingPool
+from tm.system.user.password import get_argon2_parameters
+
+
+def test_hash_and_verify_in_pool():
+    """Hashing through the worker pool gives the same results as hashing inline."""
+    pool = HashingPool(kind="thread", workers=1)
+    hasher = Argon2Hasher(pool=pool)
+    hashed = hasher.hash_password("secret")
+    assert hasher.verify_password(hashed, "secret")
+    assert not hasher.verify_password(hashed, "wrong")
+    pool.shutdown()
+
+
+def test_full_pool_rejects():
+    """When all workers are busy and the queue is full we fail fast."""
+    pool = HashingPool(kind="thread", workers=1, max_queue=0)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    t = threading.Thread(target=pool.run, args=(block,))
+    t.start()
+    started.wait()
+
+    with pytest.raises(PasswordHashingBusy):
+        pool.run(lambda: None)
+
+    release.set()
+    t.join()
+    pool.shutdown()
+
+
+def test_needs_rehash():
+    """Hashes made with other parameters are flagged for an upgrade."""
+    old = Argon2Hasher(time_cost=1, memory_cost=8, parallelism=1)
+    new = Argon2Hasher(time_cost=2, memory_cost=8, parallelism=1)
+    hashed = old.hash_password("secret")
+    assert new.verify_password(hashed, "secret")
+    assert new.needs_rehash(hashed)
+    assert not old.needs_rehash(hashed)
+    assert not new.needs_rehash("not a hash")
+
+
+def test_get_argon2_parameters():
+    settings = {"tm.password.time_cost": "4", "tm.password.memory_cost": "", "tm.password.pool": "thread"}
+    assert get_argon2_parameters(settings) == {"time_cost": 4}
+
+
+def test_timed_out_job_keeps_its_slot():
+    """A job still running after the caller gave up keeps occupying the pool until it finishes."""
+    pool = HashingPool(kind="thread", workers=1, max_queue=0, timeout=0.05)
+    release = threading.Event()
+
+    with pytest.raises(PasswordHashingBusy):
+        pool.run(release.wait)
+
+    # The first job still runs, so there is no room for another one
+    with pytest.raises(PasswordHashingBusy):
+        pool.run(lambda: None)
+
+    release.set()
+    pool.executor.submit(lambda: None).result()
+    assert pool.run(lambda: "done") == "done"
+    pool.shutdown()
+
+
+@pytest.fixture
+def login(request):
+    """Verify a password with a hasher using newer parameters than the stored hash."""
+    from pyramid import testing
+
+    from tm.system.user.interfaces import IPasswordHasher
+    from tm.system.user.models import User
+    from tm.system.user.userregistry import UserRegistry
+
+    registry = testing.setUp(settings={}).registry
+    request.addfinalizer(testing.tearDown)
+
+    def login(hasher, password="secret", **settings):
+        registry.settings.update(settings)
+        registry.registerUtility(hasher, IPasswordHasher)
+        user = User(hashed_password=Argon2Hasher(time_cost=1, memory_cost=8, parallelism=1).hash_password("secret"))
+        before = user.hashed_password
+        verified = UserRegistry(testing.DummyRequest(dbsession=None, registry=registry)).verify_password(user, password)
+        return verified, before, user.hashed_password
+
+    return login
+
+
+def test_login_upgrades_hash(login):
+    """A successful login stores the password hashed with the current parameters."""
+    hasher = Argon2Hasher(time_cost=2, memory_cost=8, parallelism=1)
+    verified, before, after = login(hasher)
+    assert verified
+    assert after != before
+    assert not hasher.needs_rehash(after)
+    assert hasher.verify_password(after, "secret")
+
+
+def test_failed_login_keeps_hash(login):
+    verified, before, after = login(Argon2Hasher(time_cost=2, memory_cost=8, parallelism=1), password="wrong")
+    assert not verified
+    assert after == before
+
+
+def test_rehash_on_login_disabled(login):
+    verified, before, after = login(Argon2Hasher(time_cost=2, memory_cost=8, parallelism=1), **{"tm.password.rehash_on_login": "false"})
+    assert verified
+    assert after == before
+
+
+def test_busy_pool_does_not_fail_login(login):
+    """When the hashing pool is full the login succeeds and the upgrade waits for the next one."""
+
+    class BusyHasher(Argon2Hasher):
+        def hash_password(self, plain_text):
+            raise PasswordHashingBusy()
+
+    verified, before, after = login(BusyHasher(time_cost=2, memory_cost=8, parallelism=1))
+    assert verified
+    assert after == before
+
+
+def test_calibrate(monkeypatch):
+    """Time cost grows to meet the target, memory is halved only when one iteration is already too slow."""
+    from tm.system.user import password
+
+    def measure_verify(hasher, samples):
+        # 10 ms per iteration for every 64 MiB
+        return hasher.time_cost * hasher.memory_cost / 65536 * 0.01
+
+    monkeypatch.setattr(password, "measure_verify", measure_verify)
+
+    parameters, elapsed = password.calibrate(0.05)
+    assert parameters == {"time_cost": 5, "memory_cost": 65536, "parallelism": 4}
+    assert elapsed == pytest.approx(0.05)
+
+    # One iteration fits the target at 16 MiB, two of them meet it
+    parameters, elapsed = password.calibrate(0.003, memory_cost=65536, min_memory_cost=8192)
+    assert parameters == {"time_cost": 2, "memory_cost": 16384, "parallelism": 4}
+    assert elapsed == pytest.approx(0.005)
+
+    # Memory is not halved below the minimum even if the target is missed
+    parameters, elapsed = password.calibrate(0.001, memory_cost=65536, min_memory_cost=19456)
+    assert parameters == {"time_cost": 1, "memory_cost": 32768, "parallelism": 4}
+
+    parameters, elapsed = password.calibrate(10, max_time_cost=20)
+    assert parameters["time_cost"] == 20
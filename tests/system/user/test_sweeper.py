@@ -0,0 +1,92 @@
+"""Test deleting expired tokens."""
+import datetime
+import time
+
+import pytest
+from pyramid import testing
+
+from tm.system.user.cache import LRUUserCache
+from tm.system.user.interfaces import IUserCache
+from tm.system.user.models import Activation
+from tm.system.user.models import User
+from tm.system.user.sweeper import Sweeper
+from tm.system.user.sweeper import delete_expired_batch
+from tm.utils.time import now
+
+
+@pytest.fixture
+def tokens(dbsession):
+    """Three expired activations, the oldest two referred by users, and one valid activation."""
+    expired = [Activation(code="expired{}".format(i), expires_at=now() - datetime.timedelta(hours=3 - i)) for i in range(3)]
+    valid = Activation(code="valid", expires_at=now() + datetime.timedelta(hours=1))
+    users = [User(email="foo@example.com", activation=expired[0]), User(email="bar@example.com", activation=expired[1]), User(email="baz@example.com", activation=valid)]
+    dbsession.add_all(expired + [valid] + users)
+    dbsession.commit()
+    return [user.id for user in users]
+
+
+def get_codes(dbsession) -> set:
+    dbsession.rollback()
+    return {activation.code for activation in dbsession.query(Activation)}
+
+
+def test_delete_in_batches(engine, dbsession, tokens):
+    """Oldest rows go first and users referring to them are cleared."""
+    assert delete_expired_batch(engine, Activation, "activation_id", 2) == 2
+    assert get_codes(dbsession) == {"expired2", "valid"}
+    assert [user.activation_id is None for user in dbsession.query(User).order_by(User.id)] == [True, True, False]
+
+    assert delete_expired_batch(engine, Activation, "activation_id", 2) == 1
+    assert delete_expired_batch(engine, Activation, "activation_id", 2) == 0
+    assert get_codes(dbsession) == {"valid"}
+
+
+def test_locked_rows_are_skipped(engine, dbsession, tokens):
+    """A row locked by another sweeper is left to it instead of waiting."""
+    with engine.connect() as connection:
+        with connection.begin():
+            connection.execute("SELECT id FROM user_activation WHERE code = 'expired0' FOR UPDATE")
+            assert delete_expired_batch(engine, Activation, "activation_id", 10) == 2
+
+    assert get_codes(dbsession) == {"expired0", "valid"}
+
+
+def test_cached_users_are_invalidated(engine, tokens):
+    """Users whose reference was cleared are dropped from the user cache after the commit."""
+    registry = testing.setUp().registry
+    cache = LRUUserCache()
+    registry.registerUtility(cache, IUserCache)
+    try:
+        for user_id in tokens:
+            cache.set(user_id, {"id": user_id})
+        assert delete_expired_batch(engine, Activation, "activation_id", 10, registry) == 3
+        assert [cache.get(user_id) for user_id in tokens] == [None, None, {"id": tokens[2]}]
+    finally:
+        testing.tearDown()
+
+
+def test_sweep(engine, dbsession, tokens):
+    assert Sweeper(engine, batch_size=2).sweep() == {"user_activation": 3, "user_authorization_code": 0}
+    assert get_codes(dbsession) == {"valid"}
+
+
+def test_background_thread(engine, dbsession, tokens):
+    """The thread sweeps every interval until stopped."""
+    sweeper = Sweeper(engine, interval=0.05)
+    thread = sweeper.start()
+    try:
+        deadline = time.monotonic() + 10
+        while get_codes(dbsession) != {"valid"}:
+            assert time.monotonic() < deadline, "Expired tokens were not swept"
+            time.sleep(0.05)
+    finally:
+        sweeper.stop()
+        thread.join(10)
+    assert not thread.is_alive()
+
+
+def test_started_with_application(make_app):
+    app = make_app(**{"tm.sweeper.enabled": "true"})
+    sweeper = app.app.registry["tm.sweeper"]
+    sweeper.stop()
+    assert sweeper.registry is app.app.registry
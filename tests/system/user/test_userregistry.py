@@ -0,0 +1,101 @@
+"""Test looking up and authenticating users."""
+import pytest
+from pyramid import testing
+
+from tm.scripts.createuser import create
+from tm.system.user.models import User
+from tm.system.user.password import Argon2Hasher
+from tm.system.user.userregistry import UserRegistry
+
+
+@pytest.fixture
+def hasher():
+    return Argon2Hasher(time_cost=1, memory_cost=8, parallelism=1)
+
+
+@pytest.fixture
+def user_registry(dbsession, hasher):
+    from tm.system.user.interfaces import IPasswordHasher
+
+    registry = testing.setUp().registry
+    registry.registerUtility(hasher, IPasswordHasher)
+    yield UserRegistry(testing.DummyRequest(dbsession=dbsession, registry=registry))
+    testing.tearDown()
+
+
+def test_lookups_ignore_case(dbsession, user_registry):
+    """Emails and usernames match whatever case they were stored or typed in."""
+    dbsession.add(User(email="Foo.Bar@Example.com", username="FooBar"))
+    dbsession.flush()
+
+    assert user_registry.get_by_email("foo.bar@example.COM").username == "FooBar"
+    assert user_registry.get_by_username("foobar").email == "Foo.Bar@Example.com"
+    assert user_registry.get_by_email("other@example.com") is None
+
+
+def test_create_reuses_user_with_other_case(dbsession, hasher):
+    """The command line user creation finds an existing user regardless of the email case."""
+    user = create(dbsession, "foo", "Foo@Example.com", "secret", hasher=hasher)
+    assert create(dbsession, "foo2", "foo@example.COM", "secret", hasher=hasher) is user
+    assert dbsession.query(User).count() == 1
+
+
+def test_sign_up_email_taken_in_other_case(dbsession):
+    """Sign up refuses an email which differs from an existing one only by case."""
+    import colander
+
+    from tm.system.user.schemas import SignUpSchema
+
+    dbsession.add(User(email="Foo@Example.com"))
+    dbsession.flush()
+
+    schema = SignUpSchema().bind(request=testing.DummyRequest(dbsession=dbsession))
+    with pytest.raises(colander.Invalid) as e:
+        schema.deserialize({"email": "foo@example.COM", "password": "secret123"})
+    assert e.value.asdict()["email"] == "Email address already taken"
+    assert schema.deserialize({"email": "bar@example.com", "password": "secret123"})["email"] == "bar@example.com"
+
+
+@pytest.fixture
+def login_users(dbsession, hasher):
+    """Alice's username is Bob's email address."""
+    alice = User(email="alice@example.com", username="bob@example.com", hashed_password=hasher.hash_password("alice-secret"))
+    bob = User(email="Bob@Example.com", username="bob", hashed_password=hasher.hash_password("bob-secret"))
+    dbsession.add_all([alice, bob])
+    dbsession.flush()
+    return alice, bob
+
+
+def test_authenticate_by_username(login_users, user_registry):
+    alice, bob = login_users
+    assert user_registry.get_authenticated_user("BOB", "bob-secret") is bob
+    assert user_registry.get_authenticated_user("bob", "alice-secret") is None
+
+
+def test_authenticate_by_email(login_users, user_registry):
+    alice, bob = login_users
+    assert user_registry.get_authenticated_user("Alice@example.com", "alice-secret") is alice
+    assert user_registry.get_authenticated_user("alice@example.com", "alice-secret", allow_email=False) is None
+    assert user_registry.get_authenticated_user("nobody@example.com", "alice-secret") is None
+
+
+def test_username_wins_over_other_users_email(login_users, user_registry):
+    """A login matching one user's username and another user's email only authenticates the username owner."""
+    alice, bob = login_users
+    assert user_registry.get_authenticated_user("bob@example.com", "alice-secret") is alice
+    assert user_registry.get_authenticated_user("bob@example.com", "bob-secret") is None
+
+
+def test_iter_full_names_is_a_snapshot(engine, dbsession, user_registry):
+    """Users added while the listing is consumed do not show up in it, even on later chunks."""
+    dbsession.add_all([User(email="user{}@example.com".format(i), user_data={"full_name": "User {}".format(i)}) for i in range(3)])
+    dbsession.commit()
+
+    names = user_registry.iter_full_names(chunk_size=1)
+    assert next(names)[1] == "User 0"
+
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert().values(email="late@example.com", user_data={"full_name": "Late"}))
+
+    assert [full_name for id, full_name in names] == ["User 1", "User 2"]
+    assert [full_name for id, full_name in user_registry.iter_full_names()][-1] == "Late"
@@ -0,0 +1,46 @@
+"""Test in-process cache."""
+from tm.utils.cache import LRUCache
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    """Least recently used entries go first."""
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_expiry():
+    """Entries expire after their time-to-live."""
+    clock = FakeClock()
+    cache = LRUCache(max_size=10, ttl=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_pop_and_invalidate():
+    """Popped and invalidated entries are gone."""
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    cache.invalidate("b")
+    assert cache.get("b") is None
@@ -0,0 +1,32 @@
+"""Test random string generation."""
+import collections
+import string
+
+from tm.utils.crypt import generate_random_string
+from tm.utils.crypt import generate_random_strings
+
+
+def test_random_string():
+    """Strings have the asked length and only contain the given letters."""
+    value = generate_random_string(32)
+    assert len(value) == 32
+    assert set(value) <= set(string.ascii_letters + string.digits)
+
+    assert set(generate_random_string(100, "ab")) <= {"a", "b"}
+    assert set(generate_random_string(10, "äö")) <= {"ä", "ö"}
+
+
+def test_random_strings():
+    """Batches are unique strings of the asked length."""
+    values = generate_random_strings(1000, 32)
+    assert len(values) == 1000
+    assert len(set(values)) == 1000
+    assert all(len(value) == 32 for value in values)
+
+
+def test_letters_are_equally_likely():
+    """The last letters of the pool are not favoured, 256 is not a multiple of 62."""
+    counts = collections.Counter(generate_random_string(62 * 2000))
+    assert len(counts) == 62
+    assert max(counts.values()) < 2000 * 1.25
+    assert min(counts.values()) > 2000 * 0.75
@@ -0,0 +1,14 @@
+"""Test streamed JSON encoding."""
+import json
+
+from tm.utils.jsonstream import iter_json_array
+
+
+def test_iter_json_array():
+    """Chunks join to the same document json.dumps would produce."""
+    values = [None, "ä", {"a": [1, 2]}] * 1000
+    chunks = list(iter_json_array(iter(values), buffer_size=100))
+    assert len(chunks) > 1
+    assert json.loads(b"".join(chunks)) == values
+
+    assert b"".join(iter_json_array([])) == b"[]"